@@ -1,17 +1,54 @@
 from dotenv import load_dotenv
 import os
+import time
+import asyncio
+from typing import List, Optional
 
 # Load environment variables
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Header, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import torch
-import tenseal as ts
 import numpy as np
-from digit_recognition.model import ConvNet
+from digit_recognition.inference import (
+    MODEL_PATH,
+    load_tenseal_context,
+    load_model,
+    compile_model,
+    build_bsgs_engine,
+    encrypted_forward,
+    evaluate_encrypted,
+    encrypted_forward_batch,
+    max_packed_batch,
+    create_worker_pool,
+    warm_up_worker_pool,
+    run_in_worker_pool,
+    run_batch_in_worker_pool,
+)
+from digit_recognition.plan import FHEModelPlan
+from fhe.context_cache import warm_galois_keys
+from digit_recognition.preprocess import N_PIXELS, ImageDecodeError, normalize, standardize, decode_raw, decode_base64, decode_png
 from routers import chat, sentiment
+from serving.batching import MicroBatcher
+from serving.metrics import (
+    METRICS_ENABLED,
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    MetricsMiddleware,
+    time_stage,
+    render as render_metrics,
+    record_context_load,
+    startup_seconds,
+)
+from serving.transport import (
+    MAX_CONTEXT_BYTES,
+    MAX_CIPHERTEXT_BYTES,
+    read_body,
+    ciphertext_response,
+    context_registry,
+    load_ckks_vector,
+)
 
 app = FastAPI(title="FHE Digit Recognition API (TenSEAL)")
 
@@ -23,6 +60,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 # Include Routers
 app.include_router(chat.router)
@@ -30,62 +69,182 @@ app.include_router(sentiment.router)
 
 # Global variables
 model = None
+plan = None
 context = None
+bsgs_engine = None
+executor = None
+batcher = None
+startup_metrics = {}
+
+# Execution mode for encrypted inference:
+#   "inline"  - run on the API process (default, single core)
+#   "process" - run on a pool of worker processes, each with its own context and model
+FHE_EXECUTION_MODE = os.getenv("FHE_EXECUTION_MODE", "inline").lower()
+FHE_WORKERS = int(os.getenv("FHE_WORKERS", os.cpu_count() or 1))
+
+# Encrypted linear algebra backend:
+#   "tenseal" - TenSEAL CKKSVector.matmul (default)
+#   "bsgs"    - baby-step/giant-step diagonal engine with minimal Galois keys (fhe/linear.py)
+FHE_ENGINE = os.getenv("FHE_ENGINE", "tenseal").lower()
+
+# Micro-batching: wait up to FHE_BATCH_WAIT_MS for more /classify requests and
+# pack up to FHE_MAX_BATCH images into one ciphertext (0 ms disables batching)
+FHE_BATCH_WAIT_MS = float(os.getenv("FHE_BATCH_WAIT_MS", "0"))
+FHE_MAX_BATCH = min(int(os.getenv("FHE_MAX_BATCH", max_packed_batch())), max_packed_batch())
+
+# Upper bound on images in one /classify/raw or /classify/compact request
+MAX_IMAGES_PER_REQUEST = int(os.getenv("MAX_IMAGES_PER_REQUEST", 64))
 
 class ImageInput(BaseModel):
-    image: list  # Expecting a flat list or 2D list of pixel values
+    image: list  # Expecting a flat list or 2D list of pixel values in [0, 1] (as the canvas sends them), normalized server-side
 
-def setup_tenseal_context():
-    """
-    Setup TenSEAL context for CKKS scheme.
-    CKKS is good for floating point operations (like neural networks).
-    """
-    # bit_scale: scales the message to preserve precision
-    # poly_modulus_degree: degree of the polynomial modulus (security parameter)
-    # coeff_module_bit_sizes: bit sizes of the coefficient modulus primes
-    # Increasing to 16384 and adding more primes to support depth (Linear -> Square -> Linear)
-    context = ts.context(
-        ts.SCHEME_TYPE.CKKS,
-        poly_modulus_degree=16384,
-        coeff_mod_bit_sizes=[60, 40, 40, 40, 40, 60]
-    )
-    context.global_scale = 2**40
-    context.generate_galois_keys()
-    return context
+class CompactImageInput(BaseModel):
+    pixels: Optional[str] = None  # base64 of k * 784 uint8 pixels (0 = background, 255 = ink)
+    images: Optional[List[str]] = None  # base64 PNGs or data URLs, e.g. canvas.toDataURL()
+
+def ensure_digit_ready():
+    if executor is None and bsgs_engine is None and (plan is None or context is None):
+        raise HTTPException(status_code=503, detail="Model or Context not initialized")
+
+def format_prediction(output_vec):
+    return {
+        "prediction": int(np.argmax(output_vec)),
+        "confidence": float(np.max(output_vec)),
+        "encrypted": True
+    }
+
+def classify_inline(input_data):
+    """Encrypted forward pass on the API process"""
+    if bsgs_engine is not None:
+        with time_stage("digit", "encrypt"):
+            ct = bsgs_engine.encrypt(input_data)
+        with time_stage("digit", "evaluate"):
+            ct = bsgs_engine.evaluate(ct)
+        with time_stage("digit", "decrypt"):
+            return bsgs_engine.decrypt(ct)
+    return encrypted_forward(plan, context, input_data)
+
+async def classify_batch(images):
+    """Run a packed encrypted forward pass for a list of 784-pixel vectors"""
+    batch = np.stack(images)
+    if executor is not None:
+        logits = await run_batch_in_worker_pool(executor, batch)
+    elif bsgs_engine is not None:
+        logits = await run_in_threadpool(lambda: [bsgs_engine.forward(image) for image in batch])
+    else:
+        # Off the event loop: a packed pass takes longer than a single image
+        logits = await run_in_threadpool(encrypted_forward_batch, plan, context, batch)
+    return list(logits)
+
+async def classify_images(images):
+    """Classify a (k, 784) float32 array, packing images into shared ciphertexts where possible"""
+    if batcher is not None:
+        outputs = await asyncio.gather(*[batcher.submit(image) for image in images])
+    else:
+        outputs = []
+        for start in range(0, len(images), FHE_MAX_BATCH):
+            outputs.extend(await classify_batch(list(images[start:start + FHE_MAX_BATCH])))
+    return [format_prediction(output_vec) for output_vec in outputs]
 
 @app.on_event("startup")
 async def startup_event():
-    global model, context
-    
-    # Load Model
+    global model, plan, context, bsgs_engine, executor, batcher
+    startup_start = time.perf_counter()
+
+    # Load Model (the plan is also used by the client-encrypted endpoints)
     print("Loading model...")
-    device = torch.device("cpu") # TenSEAL works on CPU
-    model = ConvNet().to(device)
-    
-    model_path = "mnist_model.pth"
-    if os.path.exists(model_path):
-        model.load_state_dict(torch.load(model_path, map_location=device))
-        model.eval()
-        print("Model loaded successfully.")
+    model = load_model(MODEL_PATH)
+    compiled = compile_model(model)
+    plan = FHEModelPlan(compiled)
+
+    if FHE_EXECUTION_MODE == "process":
+        if FHE_ENGINE != "bsgs":
+            # Make sure the context cache exists before the workers race to create it
+            _, stats = load_tenseal_context()
+            startup_metrics["digit_context_seconds"] = stats["seconds"]
+            startup_metrics["digit_context_cached"] = stats["cached"]
+            record_context_load("digit", stats)
+
+        # Workers load the model and build their own TenSEAL context
+        print(f"Starting {FHE_WORKERS} FHE worker processes...")
+        executor = create_worker_pool(FHE_WORKERS, MODEL_PATH, FHE_ENGINE)
+        pids = await warm_up_worker_pool(executor, FHE_WORKERS)
+        print(f"FHE worker pool ready (pids: {pids}).")
     else:
-        print("Warning: mnist_model.pth not found. Please run train.py first.")
-
-    # Setup TenSEAL
-    print("Setting up TenSEAL context...")
-    context = setup_tenseal_context()
-    print("TenSEAL context ready.")
+        if FHE_ENGINE == "bsgs":
+            print("Building BSGS encrypted inference engine...")
+            engine_start = time.perf_counter()
+            bsgs_engine = build_bsgs_engine(compiled)
+            startup_metrics["digit_engine_seconds"] = time.perf_counter() - engine_start
+            print(f"BSGS engine ready ({len(bsgs_engine.rotation_steps)} Galois keys).")
+        else:
+            # Setup TenSEAL
+            print("Setting up TenSEAL context...")
+            context, stats = load_tenseal_context()
+            warm_galois_keys(context)
+            startup_metrics["digit_context_seconds"] = stats["seconds"]
+            startup_metrics["digit_context_cached"] = stats["cached"]
+            record_context_load("digit", stats)
+            print(f"TenSEAL context ready ({'cached' if stats['cached'] else 'generated'}, {stats['seconds']:.2f}s).")
+
+    if FHE_BATCH_WAIT_MS > 0:
+        batcher = MicroBatcher(
+            classify_batch,
+            max_batch_size=FHE_MAX_BATCH,
+            max_wait_ms=FHE_BATCH_WAIT_MS,
+            max_concurrent_batches=FHE_WORKERS if executor is not None else 1
+        )
+        batcher.start()
+        print(f"FHE micro-batching enabled (up to {FHE_MAX_BATCH} images / {FHE_BATCH_WAIT_MS} ms).")
     
     # Load Sentiment Analysis Model
     print("Loading sentiment analysis model...")
-    sentiment.load_sentiment_model()
-
+    if sentiment.load_sentiment_model():
+        sentiment.setup_encrypted_inference()
+
+    chat.setup_ner_batching()
+    chat.setup_context_batching()
+    chat.setup_llm_client()
+
+    startup_metrics["startup_seconds"] = time.perf_counter() - startup_start
+    startup_seconds.set(startup_metrics["startup_seconds"])
+    print(f"Startup complete in {startup_metrics['startup_seconds']:.2f}s.")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await sentiment.shutdown_encrypted_inference()
+    await chat.shutdown_ner_batching()
+    await chat.shutdown_context_batching()
+    await chat.shutdown_llm_client()
+    if batcher is not None:
+        await batcher.stop()
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+@app.get("/status")
+async def status():
+    """Inference configuration and startup timings"""
+    return {
+        "execution_mode": FHE_EXECUTION_MODE,
+        "engine": FHE_ENGINE,
+        "batching": batcher is not None,
+        "startup": startup_metrics
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, payload sizes, errors, in-flight requests, RSS"""
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
 
 @app.post("/classify")
 async def classify_digit(payload: ImageInput):
-    global model, context
-    
-    if model is None or context is None:
-        raise HTTPException(status_code=503, detail="Model or Context not initialized")
+    """
+    Server-encrypted digit classification.
+    Body: {"image": 784 pixel values in [0, 1]} (flat or 28x28), ink = 1.
+    MNIST normalization is applied server-side before encryption.
+    """
+    ensure_digit_ready()
 
     try:
 
@@ -95,58 +254,113 @@ async def classify_digit(payload: ImageInput):
 
         if len(input_data) != 784: # Validates that the image has exactly 784 pixels (28×28)
             raise HTTPException(status_code=400, detail=f"Expected 784 pixels, got {len(input_data)}")
+        input_data = standardize(input_data)
 
+        # Encrypt -> fc1 -> square -> fc2 -> decrypt (see digit_recognition/inference.py)
+        with time_stage("digit", "inference"):
+            if batcher is not None:
+                output_vec = await batcher.submit(input_data)
+            elif executor is not None:
+                output_vec = await run_in_worker_pool(executor, input_data)
+            else:
+                output_vec = await run_in_threadpool(classify_inline, input_data)
 
+        return format_prediction(output_vec)
 
-        
-
-        enc_input = ts.ckks_vector(context, input_data) # CKKS encodes each float as a complex number inside a polynomial ring. The encryption makes it mathematically impossible to recover the original pixels without the secret key
-                                                        # Image is now encrypted. The server cannot see the actual pixels.
-
-
-
-
-        # The server retrieves the AI model's learned knowledge (weights and biases from training)
-        fc1_weight = model.fc1.weight.data.numpy().T
-        fc1_bias = model.fc1.bias.data.numpy()
-        fc2_weight = model.fc2.weight.data.numpy().T
-        fc2_bias = model.fc2.bias.data.numpy()
-
-
-
-        # Encrypted input (784 pixels) 
-        # × Weights (784 → 128)
-        # + Biases (128)
-        # = Encrypted hidden activations (128 neurons)
-        enc_hidden = enc_input.matmul(fc1_weight) + fc1_bias
-        
-
-        enc_hidden.square_() # Applied an activation function to the encrypted hidden layer
-        
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
-        enc_output = enc_hidden.matmul(fc2_weight) + fc2_bias # Server completed the entire neural network inference. 
-                                                                # Got 10 encrypted prediction scores (one per digit 0-9). 
-                                                                #  Still no decryption - all encrypted!
-        
+async def classify_pixels(pixels):
+    """Normalize (k, 784) uint8 images and classify them"""
+    if len(pixels) > MAX_IMAGES_PER_REQUEST:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_IMAGES_PER_REQUEST} images per request")
+    try:
+        with time_stage("digit", "inference"):
+            return {"predictions": await classify_images(normalize(pixels))}
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/classify/raw")
+async def classify_raw(request: Request):
+    """
+    Compact input: application/octet-stream body of 784 uint8 pixels per image
+    (row-major 28x28, 0 = background, 255 = ink). Several images may be concatenated.
+    MNIST normalization is applied server-side.
+    """
+    ensure_digit_ready()
+    data, _ = await read_body(request, MAX_IMAGES_PER_REQUEST * N_PIXELS)
+    try:
+        pixels = decode_raw(data)
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await classify_pixels(pixels)
 
-        output_vec = enc_output.decrypt()
-        
+@app.post("/classify/compact")
+async def classify_compact(payload: CompactImageInput):
+    """
+    Compact JSON input: `pixels` (base64 of k * 784 uint8 pixels) and/or
+    `images` (base64 PNGs / canvas data URLs, resized to 28x28 server-side).
+    """
+    ensure_digit_ready()
+    batches = []
+    try:
+        with time_stage("digit", "decode"):
+            if payload.pixels:
+                batches.append(decode_raw(decode_base64(payload.pixels)))
+            if payload.images:
+                if len(payload.images) > MAX_IMAGES_PER_REQUEST:
+                    raise HTTPException(status_code=413, detail=f"At most {MAX_IMAGES_PER_REQUEST} images per request")
+                batches.append(np.stack([decode_png(decode_base64(image)) for image in payload.images]))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not batches:
+        raise HTTPException(status_code=400, detail="Provide `pixels` or `images`")
+    return await classify_pixels(np.concatenate(batches))
+
+@app.post("/fhe/context")
+async def register_client_context(request: Request):
+    """
+    Register a client's public TenSEAL context (application/octet-stream).
+    The context must not contain the secret key and needs Galois + relin keys.
+    Returns the id to send as X-Context-Id with encrypted requests.
+    Registrations are kept in this process only, so run a single API worker
+    (see serving/transport.py). Uploads are capped at FHE_MAX_CONTEXT_BYTES.
+    """
+    data, wire_bytes = await read_body(request, MAX_CONTEXT_BYTES)
+    context_id, _ = await run_in_threadpool(context_registry.register, data)
+    return {"context_id": context_id, "request_bytes": wire_bytes}
 
-        prediction = int(np.argmax(output_vec))
-        confidence = float(np.max(output_vec)) 
+@app.post("/classify/encrypted")
+async def classify_encrypted(request: Request, x_context_id: str = Header(None)):
+    """
+    Client-encrypted digit classification.
+    Body: serialized CKKSVector of 784 MNIST-normalized pixels ((x - 0.1307) / 0.3081
+    for x in [0, 1]) encrypted under the registered context
+    (CKKS, poly_modulus_degree 16384, depth >= 3). Returns the serialized encrypted logits.
+    """
+    if plan is None:
+        raise HTTPException(status_code=503, detail="Model not initialized")
 
-        return {
-            "prediction": prediction,
-            "confidence": confidence,
-            "encrypted": True
-        }
+    client_context = context_registry.get(x_context_id)
+    data, wire_bytes = await read_body(request, MAX_CIPHERTEXT_BYTES)
+    enc_input = load_ckks_vector(client_context, data, 28 * 28)
 
+    try:
+        enc_output = await run_in_threadpool(evaluate_encrypted, plan, enc_input)
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+    return ciphertext_response(enc_output.serialize(), wire_bytes)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1 @@
+# Per-stage microbenchmarks for the FHE and privacy pipelines
@@ -0,0 +1,139 @@
+"""
+Parity and cost check for the NER backends (privacy/ner.py)
+
+Runs a fixture corpus through the FP32 and int8 backends, each in a fresh
+process, and compares the detected PII spans (entity_group, start, end).
+Reports span precision/recall of int8 against FP32, per-text latency and
+the resident memory each backend adds.
+
+Usage (from backend/):
+    python -m benchmarks.ner_parity
+    python -m benchmarks.ner_parity --min-f1 0.98 --output ner_parity.json
+
+Exits with 1 when the span F1 is below --min-f1.
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+
+import numpy as np
+
+NER_CORPUS = [
+    "My name is Alice Johnson and I live in Seattle.",
+    "You can reach me at alice.johnson@example.com or call 555-123-4567.",
+    "I work at Contoso Ltd and my manager David Smith wants the report by Friday.",
+    "We are planning a trip to Paris next spring, any suggestions for museums?",
+    "My sister Maria Garcia moved from Madrid to Berlin last year.",
+    "Please forward the invoice to Robert Brown at Globex Corporation.",
+    "Dr. Emily Chen from Stanford University will review my application.",
+    "I was born in Toronto but grew up in Vancouver, British Columbia.",
+    "Our team at Initech is migrating everything to Amazon Web Services.",
+    "Can you help me write a cover letter for a job at Microsoft in Redmond?",
+    "My landlord, Mr. Patel, lives in the apartment above mine on Oak Street.",
+    "John and I visited the Louvre and the Eiffel Tower during our honeymoon.",
+    "The meeting with Siemens in Munich was moved to Thursday afternoon.",
+    "I bank with Wells Fargo and my account manager is Jennifer Lopez.",
+    "Tell Michael Jordan that the Chicago office closes early on Friday.",
+    "My daughter Sophie goes to Lincoln Elementary School in Portland.",
+    "Anna Kowalski from Warsaw joined the United Nations last month.",
+    "I need a reference letter from Professor James Wilson at Oxford.",
+    "Send the package to 221B Baker Street, London, attention Sherlock Holmes.",
+    "Our startup, Acme Robotics, just raised funding from Sequoia Capital.",
+    # Lengths far from the one the int8 graph was traced with
+    "Bob.",
+    "Ask Lisa in Denver.",
+    ("Last summer my colleague Thomas Becker and I flew from Frankfurt to Chicago for a conference "
+     "organized by Northwind Traders. After the talks we drove to Milwaukee, where his cousin Laura "
+     "Becker works for Harley-Davidson. On the way back we stopped in Madison to meet Kevin O'Brien, "
+     "who teaches at the University of Wisconsin, and we spent the weekend at a lake house near "
+     "Green Bay that belongs to the Nakamura family. Everything was booked through Expedia, and "
+     "the invoices went to our office manager, Priya Raman, at the Frankfurt headquarters."),
+]
+
+def _spans(entities):
+    return {(e["entity_group"], int(e["start"]), int(e["end"])) for e in entities}
+
+def _run_backend(backend, model_name, repeats):
+    """Load one backend and run the corpus, in a child process"""
+    import torch
+    from privacy.ner import load_ner_pipeline
+    from serving.metrics import process_rss_bytes
+
+    torch.set_num_threads(1)
+    rss_before = process_rss_bytes()
+    start = time.perf_counter()
+    ner = load_ner_pipeline(backend, model_name)
+    load_seconds = time.perf_counter() - start
+    ner(NER_CORPUS[0])  # warm up
+
+    timings = []
+    for _ in range(repeats):
+        for text in NER_CORPUS:
+            start = time.perf_counter()
+            ner(text)
+            timings.append((time.perf_counter() - start) * 1000)
+    spans = [sorted(_spans(ner(text))) for text in NER_CORPUS]
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "rss_added_mb": (process_rss_bytes() - rss_before) / 2**20,
+        "latency_ms_p50": float(np.percentile(timings, 50)),
+        "latency_ms_p95": float(np.percentile(timings, 95)),
+        "spans": spans,
+    }
+
+def compare_spans(reference, candidate):
+    """Span precision/recall/F1 of candidate against reference, plus texts that differ"""
+    tp = fp = fn = 0
+    differing = []
+    for i, (ref, cand) in enumerate(zip(reference, candidate)):
+        ref, cand = set(map(tuple, ref)), set(map(tuple, cand))
+        tp += len(ref & cand)
+        fp += len(cand - ref)
+        fn += len(ref - cand)
+        if ref != cand:
+            differing.append({"text": NER_CORPUS[i], "fp32_only": sorted(ref - cand), "int8_only": sorted(cand - ref)})
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f1": f1, "differing_texts": differing}
+
+def main():
+    from privacy.ner import NER_MODEL
+
+    parser = argparse.ArgumentParser(description="Compare int8 and FP32 NER backends on a fixture corpus")
+    parser.add_argument("--model", default=NER_MODEL)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--min-f1", type=float, default=0.95, help="Required span F1 of int8 vs FP32")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    # Fresh process per backend so RSS and load time are not shared
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for backend in ("fp32", "int8"):
+        with ctx.Pool(1) as pool:
+            results[backend] = pool.apply(_run_backend, (backend, args.model, args.repeats))
+        r = results[backend]
+        print(f"{backend:>5}: load {r['load_seconds']:.1f} s, +{r['rss_added_mb']:.0f} MB RSS, "
+              f"p50 {r['latency_ms_p50']:.1f} ms, p95 {r['latency_ms_p95']:.1f} ms per text")
+
+    parity = compare_spans(results["fp32"]["spans"], results["int8"]["spans"])
+    print(f"int8 vs fp32 spans: precision {parity['precision']:.3f}, recall {parity['recall']:.3f}, F1 {parity['f1']:.3f}")
+    for diff in parity["differing_texts"]:
+        print(f"  {diff['text']!r}: fp32 only {diff['fp32_only']}, int8 only {diff['int8_only']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model": args.model, "backends": results, "parity": parity}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if parity["f1"] < args.min_f1:
+        print(f"Span F1 {parity['f1']:.3f} is below {args.min_f1}")
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
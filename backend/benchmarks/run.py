@@ -0,0 +1,138 @@
+"""
+Per-stage microbenchmarks for the FHE and privacy pipelines
+
+Times every stage in isolation (encryption, fc1 matmul, square, fc2, decrypt,
+TF-IDF transform, BERT NER, spaCy parse, redaction) and the HTTP routes end to
+end through an in-process ASGI client with a stubbed Gemini model.
+Reports ops/sec and p50/p95/p99 latency.
+
+Usage (from backend/):
+    python -m benchmarks.run --save benchmarks/baseline.json
+    python -m benchmarks.run --compare benchmarks/baseline.json --threshold 0.2
+    FHE_ENGINE=bsgs python -m benchmarks.run --only "fhe.*" "route.classify"
+
+With --compare the exit code is 1 when any stage's p50 is more than
+`threshold` (fraction) slower than in the baseline, or when a baseline stage
+was skipped or not run.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import time
+
+import numpy as np
+
+def measure(fn, iterations, warmup=1):
+    """Time `iterations` calls of fn, returns a stats dict (milliseconds)"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings = np.array(timings)
+    return {
+        "iterations": iterations,
+        "ops_per_sec": float(1000.0 / timings.mean()),
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+def run_stages(patterns=None, iterations=None, warmup=1):
+    """Run the selected stages, returns {name: stats or {"skipped": reason}}"""
+    from benchmarks import stages
+
+    results = {}
+    try:
+        for name, (setup, default_iterations) in stages.STAGES.items():
+            if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+                continue
+            try:
+                fn = setup()
+            except stages.SkipStage as e:
+                print(f"{name:<26} skipped ({e})")
+                results[name] = {"skipped": str(e)}
+                continue
+            stats = measure(fn, iterations or default_iterations, warmup)
+            results[name] = stats
+            print(f"{name:<26} {stats['ops_per_sec']:>10.2f} ops/s  p50 {stats['p50_ms']:>10.3f} ms  "
+                  f"p95 {stats['p95_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms")
+    finally:
+        stages.close()
+    return results
+
+def compare(results, baseline, threshold, patterns=None):
+    """
+    Stages whose p50 regressed by more than `threshold` compared with the
+    baseline, plus baseline stages (among the selected ones) that were skipped
+    or not run at all: a stage that cannot be measured must not pass the gate.
+    """
+    failures = []
+    for name, base in baseline.get("stages", {}).items():
+        if "p50_ms" not in base:
+            continue
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        stats = results.get(name, {})
+        if "p50_ms" not in stats:
+            reason = stats.get("skipped", "not run")
+            print(f"{name:<26} {base['p50_ms']:>10.3f} -> {'-':>10} ms  MISSING ({reason})")
+            failures.append(name)
+            continue
+        change = stats["p50_ms"] / base["p50_ms"] - 1.0
+        marker = "REGRESSION" if change > threshold else "ok"
+        print(f"{name:<26} {base['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms  ({change:+.1%})  {marker}")
+        if change > threshold:
+            failures.append(name)
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage microbenchmarks for the FHE and privacy pipelines")
+    parser.add_argument("--only", nargs="+", help="Stage name patterns, e.g. 'fhe.*' 'chat.redaction'")
+    parser.add_argument("--iterations", type=int, help="Override the per-stage iteration count")
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="List stages and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        from benchmarks.stages import STAGES
+        for name, (_, iterations) in STAGES.items():
+            print(f"{name:<26} {iterations} iterations")
+        return
+
+    results = run_stages(args.only, args.iterations, args.warmup)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "fhe_engine": os.getenv("FHE_ENGINE", "tenseal").lower(),
+        "stages": results
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("fhe_engine") != report["fhe_engine"]:
+            print(f"Warning: baseline was recorded with FHE_ENGINE={baseline.get('fhe_engine')}")
+        failures = compare(results, baseline, args.threshold, args.only)
+        if failures:
+            print(f"{len(failures)} stage(s) regressed by more than {args.threshold:.0%} "
+                  f"or were not measured: {', '.join(failures)}")
+            raise SystemExit(1)
+        print("No regressions.")
+
+if __name__ == "__main__":
+    main()
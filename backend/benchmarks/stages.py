@@ -0,0 +1,330 @@
+"""
+Benchmark stages
+
+Each stage is registered with @stage and is a setup function returning the
+zero-argument callable to time. Setup work (models, contexts, encrypted inputs)
+is not timed. A setup raises SkipStage when an optional dependency (spaCy
+model, BERT weights, trained artifacts) is not available.
+"""
+
+import os
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE_TEXTS = [
+    "My name is Alice Johnson and I live in Seattle. You can reach me at alice.johnson@example.com or 555-123-4567.",
+    "I work at Contoso Ltd and my manager David Smith wants the report by Friday.",
+    "We are planning a trip to Paris next spring, any suggestions for museums?",
+    "This movie was absolutely wonderful, the acting and the soundtrack were brilliant.",
+    "The service was slow and the food arrived cold. I will not be coming back.",
+]
+
+class SkipStage(Exception):
+    pass
+
+# name -> (setup function, default iterations)
+STAGES = {}
+
+def stage(name, iterations=50):
+    def register(setup):
+        STAGES[name] = (setup, iterations)
+        return setup
+    return register
+
+_shared = {}
+
+def _cached(key, factory):
+    if key not in _shared:
+        _shared[key] = factory()
+    return _shared[key]
+
+# --- FHE digit pipeline -----------------------------------------------------
+
+def _digit_model():
+    """Compiled ConvNet (see fhe/compiler.py)"""
+    from digit_recognition.inference import MODEL_PATH, load_model, compile_model
+    return _cached("digit_model", lambda: compile_model(load_model(os.path.join(BACKEND_DIR, MODEL_PATH)).eval()))
+
+def _digit_input():
+    """[0, 1] pixels, as /classify takes them"""
+    return np.random.default_rng(0).random(28 * 28).astype(np.float32)
+
+def _digit_model_input():
+    """MNIST-normalized pixels, the input of the compiled model"""
+    from digit_recognition.preprocess import standardize
+    return standardize(_digit_input())
+
+class _TenSEALStages:
+    """fc1 -> square -> fc2 on a CKKSVector with the prebuilt FHEModelPlan"""
+    def __init__(self):
+        from digit_recognition.inference import load_tenseal_context
+        from fhe.context_cache import ensure_galois_keys
+        from digit_recognition.plan import FHEModelPlan
+        import tenseal as ts
+        self.ts = ts
+        self.plan = FHEModelPlan(_digit_model())
+        self.context, _ = load_tenseal_context()
+        ensure_galois_keys(self.context)
+        self.x = _digit_model_input().tolist()
+        self.encrypted = self.encrypt()
+        self.hidden = self.fc1(self.encrypted)
+        self.squared = self.square(self.hidden)
+        self.output = self.fc2(self.squared)
+
+    def encrypt(self):
+        return self.ts.ckks_vector(self.context, self.x)
+
+    def fc1(self, ct):
+        layer = self.plan.layers[0]
+        return ct.matmul(layer.weight) + layer.bias
+
+    def square(self, ct):
+        return ct.square()
+
+    def fc2(self, ct):
+        layer = self.plan.layers[1]
+        return ct.matmul(layer.weight) + layer.bias
+
+    def decrypt(self, ct):
+        return ct.decrypt()
+
+class _BSGSStages:
+    """The same stages on the BSGS diagonal engine (fhe/linear.py)"""
+    def __init__(self):
+        import tenseal.sealapi as sealapi
+        from digit_recognition.inference import build_bsgs_engine
+        self.sealapi = sealapi
+        self.engine = build_bsgs_engine(_digit_model())
+        self.x = _digit_model_input()
+        self.encrypted = self.encrypt()
+        self.hidden = self.fc1(self.encrypted)
+        self.squared = self.square(self.hidden)
+        self.output = self.fc2(self.squared)
+
+    def encrypt(self):
+        return self.engine.encrypt(self.x)
+
+    def fc1(self, ct):
+        return self.engine.layers[0].apply(self.engine, ct)
+
+    def square(self, ct):
+        evaluator = self.engine.evaluator
+        result = self.sealapi.Ciphertext()
+        evaluator.square(ct, result)
+        evaluator.relinearize_inplace(result, self.engine.relin_keys)
+        evaluator.rescale_to_next_inplace(result)
+        return result
+
+    def fc2(self, ct):
+        return self.engine.layers[1].apply(self.engine, ct)
+
+    def decrypt(self, ct):
+        return self.engine.decrypt(ct)
+
+FHE_ENGINES = {"tenseal": _TenSEALStages, "bsgs": _BSGSStages}
+
+def _fhe():
+    engine = os.getenv("FHE_ENGINE", "tenseal").lower()
+    return _cached(f"fhe_{engine}", FHE_ENGINES[engine])
+
+@stage("fhe.encrypt", iterations=10)
+def fhe_encrypt():
+    return _fhe().encrypt
+
+@stage("fhe.fc1", iterations=5)
+def fhe_fc1():
+    fhe = _fhe()
+    return lambda: fhe.fc1(fhe.encrypted)
+
+@stage("fhe.square", iterations=10)
+def fhe_square():
+    fhe = _fhe()
+    return lambda: fhe.square(fhe.hidden)
+
+@stage("fhe.fc2", iterations=5)
+def fhe_fc2():
+    fhe = _fhe()
+    return lambda: fhe.fc2(fhe.squared)
+
+@stage("fhe.decrypt", iterations=10)
+def fhe_decrypt():
+    fhe = _fhe()
+    return lambda: fhe.decrypt(fhe.output)
+
+# --- Sentiment --------------------------------------------------------------
+
+def _sentiment_router():
+    from routers import sentiment
+    if sentiment.vectorizer is None and not sentiment.load_sentiment_model():
+        raise SkipStage("sentiment model / vectorizer not found, run sentiment_analysis/train.py")
+    return sentiment
+
+@stage("sentiment.tfidf_transform", iterations=500)
+def sentiment_tfidf_transform():
+    vectorizer = _sentiment_router().vectorizer
+    return lambda: vectorizer.transform(SAMPLE_TEXTS[3:4])
+
+# --- Privacy (chat) pipeline ------------------------------------------------
+
+def _chat_router():
+    from routers import chat
+    return chat
+
+@stage("chat.bert_ner", iterations=20)
+def chat_bert_ner():
+    chat = _chat_router()
+    if chat.ner_pipeline is None:
+        raise SkipStage("BERT NER model (dslim/bert-base-NER) not available")
+    return lambda: chat.ner_pipeline(SAMPLE_TEXTS[0])
+
+@stage("chat.spacy_parse", iterations=100)
+def chat_spacy_parse():
+    chat = _chat_router()
+    if chat.nlp is None:
+        raise SkipStage("spaCy model en_core_web_sm not available")
+    return lambda: chat.nlp(SAMPLE_TEXTS[0])
+
+@stage("chat.context_analysis", iterations=100)
+def chat_context_analysis():
+    """Trimmed context analysis (privacy/context.py) of a long document with one candidate"""
+    chat = _chat_router()
+    if chat.context_analyzer is None:
+        raise SkipStage("spaCy model en_core_web_sm not available")
+    text = " ".join(SAMPLE_TEXTS[1:] * 40) + " " + SAMPLE_TEXTS[0]
+    spans = chat.context_spans(_fixture_entities(text))
+    return lambda: chat.context_analyzer.decide(text, spans)
+
+def _fixture_entities(text):
+    """Entities the NER model finds in SAMPLE_TEXTS[0], so redaction can be timed without it"""
+    entities = []
+    for word, group in [("Alice Johnson", "PER"), ("Seattle", "LOC")]:
+        start = text.index(word)
+        entities.append({"entity_group": group, "word": word, "start": start, "end": start + len(word)})
+    return entities
+
+@stage("chat.stream_restore", iterations=500)
+def chat_stream_restore():
+    from privacy.redaction import StreamRestorer
+    pii_map = {"Maria Lopez": "Alice Johnson", "Portland": "Seattle", "mlopez@example.org": "alice.johnson@example.com"}
+    response = "Hi Maria Lopez! Portland is lovely in spring. I'll reply to mlopez@example.org soon. " * 20
+    chunks = [response[i:i + 5] for i in range(0, len(response), 5)]
+
+    def run():
+        restorer = StreamRestorer(pii_map)
+        return "".join(restorer.feed(chunk) for chunk in chunks) + restorer.flush()
+    return run
+
+_PSEUDONYM_ENTITIES = [
+    ("PERSON", "Alice Johnson"), ("PERSON", "David Smith"), ("LOC", "Seattle"), ("GPE", "Portland"),
+    ("ORG", "Contoso Ltd"), ("EMAIL", "alice.johnson@example.com"), ("PHONE", "555-123-4567"),
+    ("PERSON", "Maria Garcia"), ("LOC", "Madrid"), ("ORG", "Globex Corporation"),
+]
+
+@stage("chat.pseudonyms_faker", iterations=200)
+def chat_pseudonyms_faker():
+    """Reference: one Faker provider call per entity, as redaction did before privacy/pseudonyms.py"""
+    from faker import Faker
+    fake = Faker()
+    providers = {"PERSON": fake.first_name, "LOC": fake.city, "GPE": fake.city, "ORG": fake.company,
+                 "EMAIL": fake.email, "PHONE": fake.phone_number}
+    return lambda: [providers[label]() for label, _ in _PSEUDONYM_ENTITIES]
+
+@stage("chat.pseudonyms", iterations=200)
+def chat_pseudonyms():
+    pseudonymizer = _chat_router().pseudonymizer
+    text = SAMPLE_TEXTS[0]
+
+    def run():
+        used = set()
+        for label, original in _PSEUDONYM_ENTITIES:
+            used.add(pseudonymizer.pseudonym(label, original, text, used))
+        return used
+    return run
+
+@stage("chat.redaction", iterations=500)
+def chat_redaction():
+    chat = _chat_router()
+    text = SAMPLE_TEXTS[0]
+    entities = _fixture_entities(text)
+    personal = chat.context_analyzer.decide(text, chat.context_spans(entities)) if chat.context_analyzer else {}
+
+    def run():
+        return chat.redact_entities(text, entities + chat.find_pattern_entities(text), personal)
+    return run
+
+# --- End-to-end routes (in-process ASGI) -------------------------------------
+
+def _client():
+    def create():
+        from fastapi.testclient import TestClient
+        from routers import chat
+        from serving.llm import EchoProvider, LLMClient
+        import app as app_module
+        client = TestClient(app_module.app)
+        client.__enter__()  # runs the startup events
+        # Local stand-in LLM instead of Gemini, so no network calls are timed
+        chat.llm_client = LLMClient(EchoProvider())
+        return client
+    return _cached("client", create)
+
+def _sse_events(text):
+    """Event names of a Server-Sent Events body"""
+    return [line[len("event: "):] for line in text.splitlines() if line.startswith("event: ")]
+
+def _check_response(path, response, expected_keys):
+    """Raise unless the route succeeded: 2xx, no error payload, the expected keys present"""
+    response.raise_for_status()
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        events = _sse_events(response.text)
+        if "error" in events or not events or events[-1] != "done":
+            raise RuntimeError(f"{path} stream did not complete: {response.text[:200]}")
+        return
+    body = response.json()
+    missing = [key for key in expected_keys if key not in body]
+    if "error" in body:
+        raise RuntimeError(f"{path} returned an error: {response.text[:200]}")
+    if missing:
+        raise RuntimeError(f"{path} response has no {', '.join(missing)}: {response.text[:200]}")
+
+def _post(path, payload, expected_keys=()):
+    """
+    Timed request. Every sample is checked, so an error (HTTP status or an
+    error body returned with 200) fails the stage instead of being timed.
+    """
+    client = _client()
+
+    def run():
+        response = client.post(path, json=payload)
+        _check_response(path, response, expected_keys)
+        return response
+    run()  # fail fast during setup instead of mid-measurement
+    return run
+
+@stage("route.classify", iterations=5)
+def route_classify():
+    return _post("/classify", {"image": _digit_input().tolist()}, ("prediction",))
+
+@stage("route.sentiment_predict", iterations=200)
+def route_sentiment_predict():
+    _sentiment_router()
+    return _post("/sentiment/predict", {"text": SAMPLE_TEXTS[3]}, ("prediction", "prediction_index"))
+
+@stage("route.chat_secure", iterations=20)
+def route_chat_secure():
+    if _chat_router().nlp is None:
+        raise SkipStage("/chat/secure needs the spaCy model en_core_web_sm")
+    return _post("/chat/secure", {"message": SAMPLE_TEXTS[0]}, ("redacted_prompt", "llm_response_restored"))
+
+@stage("route.chat_secure_stream", iterations=20)
+def route_chat_secure_stream():
+    if _chat_router().nlp is None:
+        raise SkipStage("/chat/secure/stream needs the spaCy model en_core_web_sm")
+    return _post("/chat/secure/stream", {"message": SAMPLE_TEXTS[0]})
+
+def close():
+    client = _shared.pop("client", None)
+    if client is not None:
+        client.__exit__(None, None, None)
+    _shared.clear()
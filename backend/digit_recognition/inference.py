@@ -0,0 +1,194 @@
+"""
+Encrypted inference for the digit recognition model (TenSEAL)
+
+The same forward pass is used in-process by the API and inside the optional
+worker process pool, where every worker owns its own context and model plan.
+"""
+
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import tenseal as ts
+import torch
+
+from digit_recognition.model import ConvNet
+from digit_recognition.plan import FHEModelPlan
+from fhe.context_cache import ensure_galois_keys, load_or_create_context, warm_galois_keys
+from fhe.compiler import load_or_compile
+from fhe.linear import BSGSNetwork
+from fhe.packed import max_packed_batch as packed_max_batch, packed_forward
+from serving.metrics import time_stage
+
+MODEL_PATH = "mnist_model.pth"
+CONTEXT_PATH = "full_context.bin" # Cached context with keys, see fhe/context_cache.py
+BSGS_KEY_PATH = "bsgs_digit.key"
+POLY_MODULUS_DEGREE = 16384
+
+def load_tenseal_context():
+    """
+    Setup TenSEAL context for CKKS scheme.
+    CKKS is good for floating point operations (like neural networks).
+    The context is loaded from CONTEXT_PATH when its parameters match.
+    Returns (context, stats).
+    """
+    # bit_scale: scales the message to preserve precision
+    # poly_modulus_degree: degree of the polynomial modulus (security parameter)
+    # coeff_module_bit_sizes: bit sizes of the coefficient modulus primes
+    # Increasing to 16384 and adding more primes to support depth (Linear -> Square -> Linear)
+    return load_or_create_context(
+        CONTEXT_PATH,
+        poly_modulus_degree=POLY_MODULUS_DEGREE,
+        coeff_mod_bit_sizes=[60, 40, 40, 40, 40, 60],
+        global_scale=2**40
+    )
+
+def setup_tenseal_context():
+    context, _ = load_tenseal_context()
+    return context
+
+def build_bsgs_engine(compiled):
+    """BSGS engine for the compiled ConvNet, reusing the cached secret key"""
+    return BSGSNetwork.from_compiled(compiled, POLY_MODULUS_DEGREE, secret_key_path=BSGS_KEY_PATH)
+
+def compile_model(model):
+    """Verified ConvNet plan for FHE (takes MNIST-normalized pixels), see fhe/compiler.py"""
+    return load_or_compile("digit", model)
+
+def load_model(model_path=MODEL_PATH):
+    """Build the ConvNet and load trained weights if they exist"""
+    device = torch.device("cpu") # TenSEAL works on CPU
+    model = ConvNet().to(device)
+
+    if os.path.exists(model_path):
+        model.load_state_dict(torch.load(model_path, map_location=device))
+        model.eval()
+        print("Model loaded successfully.")
+    else:
+        print(f"Warning: {model_path} not found. Please run train.py first.")
+    return model
+
+def evaluate_encrypted(plan, enc_input, pipeline="digit"):
+    """
+    Run every layer of the compiled plan (for the ConvNet: fc1 -> square -> fc2)
+    on an already encrypted input CKKSVector.
+    Returns the encrypted logits (the caller may not hold the secret key).
+    """
+    enc_x = enc_input
+    for i, (layer, activation) in enumerate(zip(plan.layers, plan.activations), start=1):
+        # Encrypted input (784 MNIST-normalized pixels)
+        # × Weights (784 → 128)
+        # + Biases (128)
+        # = Encrypted hidden activations (128 neurons)
+        with time_stage(pipeline, f"fc{i}"):
+            enc_x = enc_x.matmul(layer.weight) + layer.bias
+
+        if activation == "square":
+            with time_stage(pipeline, "square"):
+                enc_x.square_() # Applied an activation function to the encrypted hidden layer
+
+    # Server completed the entire neural network inference.
+    # Got 10 encrypted prediction scores (one per digit 0-9).
+    #  Still no decryption - all encrypted!
+    return enc_x
+
+def encrypted_forward(plan, context, input_data):
+    """
+    Run fc1 -> square -> fc2 on an encrypted 784-pixel vector (MNIST-normalized pixels).
+    `plan` is the FHEModelPlan built once from the compiled model.
+    Returns the decrypted logits as a NumPy array.
+    """
+    ensure_galois_keys(context)
+    with time_stage("digit", "encrypt"):
+        enc_input = ts.ckks_vector(context, input_data) # CKKS encodes each float as a complex number inside a polynomial ring. The encryption makes it mathematically impossible to recover the original pixels without the secret key
+                                                        # Image is now encrypted. The server cannot see the actual pixels.
+
+    enc_output = evaluate_encrypted(plan, enc_input)
+
+    with time_stage("digit", "decrypt"):
+        return np.array(enc_output.decrypt())
+
+def max_packed_batch(poly_modulus_degree=POLY_MODULUS_DEGREE, n_features=28 * 28):
+    """Number of images that fit in one ciphertext for encrypted_forward_batch"""
+    return packed_max_batch(poly_modulus_degree, n_features)
+
+def encrypted_forward_batch(plan, context, images):
+    """
+    Run fc1 -> square -> fc2 for several images packed into one ciphertext.
+
+    The (B, 784) batch is encrypted column-major with enc_matmul_encoding, so one
+    enc_matmul_plain per hidden neuron computes that neuron for every image at once.
+    Rotations are shared across the batch instead of paid per image.
+    Returns a (B, 10) NumPy array of decrypted logits.
+    """
+    images = np.asarray(images, dtype=np.float32)
+    if images.shape[0] == 1:
+        return encrypted_forward(plan, context, images[0])[np.newaxis, :]
+    return packed_forward(plan, context, images)
+
+# ============================================
+# Worker process pool
+# ============================================
+
+# Per-process state, populated once by _init_worker
+_worker_plan = None
+_worker_context = None
+_worker_engine = None
+
+def _init_worker(model_path, engine="tenseal"):
+    global _worker_plan, _worker_context, _worker_engine
+
+    # Each worker is single threaded so the pool, not torch, decides core usage
+    torch.set_num_threads(1)
+    compiled = compile_model(load_model(model_path))
+    if engine == "bsgs":
+        _worker_engine = build_bsgs_engine(compiled)
+    else:
+        _worker_plan = FHEModelPlan(compiled)
+        _worker_context = setup_tenseal_context()
+        warm_galois_keys(_worker_context)
+
+def _worker_forward(input_data):
+    if _worker_engine is not None:
+        return _worker_engine.forward(input_data)
+    return encrypted_forward(_worker_plan, _worker_context, input_data)
+
+def _worker_forward_batch(images):
+    if _worker_engine is not None:
+        return np.stack([_worker_engine.forward(image) for image in images])
+    return encrypted_forward_batch(_worker_plan, _worker_context, images)
+
+def _worker_ready():
+    return os.getpid()
+
+def create_worker_pool(num_workers, model_path=MODEL_PATH, engine="tenseal"):
+    """
+    Create a process pool for encrypted inference.
+    Workers are spawned (not forked) so no TenSEAL/torch state is shared with the API process.
+    """
+    return ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_path, engine)
+    )
+
+async def warm_up_worker_pool(executor, num_workers):
+    """Start every worker now so the first requests don't pay for context generation"""
+    loop = asyncio.get_running_loop()
+    pids = await asyncio.gather(*[
+        loop.run_in_executor(executor, _worker_ready) for _ in range(num_workers)
+    ])
+    return sorted(set(pids))
+
+async def run_in_worker_pool(executor, input_data):
+    """Await the encrypted forward pass on one of the pool workers"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _worker_forward, input_data)
+
+async def run_batch_in_worker_pool(executor, images):
+    """Await a packed batch forward pass on one of the pool workers"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, _worker_forward_batch, images)
@@ -0,0 +1,102 @@
+"""
+FHE model plan for the digit recognition and sentiment models
+
+Everything the encrypted forward pass needs from the compiled model is
+prepared here once (at startup / model load), so the request path only does
+ciphertext arithmetic.
+
+Run `python -m digit_recognition.plan` to compare per-request latency with
+and without a prebuilt plan.
+"""
+
+import numpy as np
+import tenseal as ts
+
+class FHELayer:
+    """One affine layer prepared for TenSEAL"""
+    def __init__(self, weight, bias):
+        self.in_features = weight.shape[1]
+        self.out_features = weight.shape[0]
+
+        # (in, out) layout expected by CKKSVector.matmul
+        self.weight = ts.plain_tensor(np.ascontiguousarray(weight.T))
+        self.bias = ts.plain_tensor(bias)
+
+        # Per-neuron values for packed (multi-input) evaluation, see fhe/packed.py
+        self.rows = weight.tolist()
+        self.bias_values = bias.tolist()
+
+class FHEModelPlan:
+    """
+    A compiled model (fhe/compiler.py: identity layers fused)
+    prepared for TenSEAL.
+
+    - single input path: transposed, contiguous weight matrices and biases
+      already wrapped as TenSEAL plain tensors
+    - packed batch path: weight rows and biases as plain Python floats
+    """
+    def __init__(self, compiled):
+        self.layers = [FHELayer(weight, bias) for weight, bias in compiled.layers]
+        self.activations = list(compiled.activations)
+        self.depth = compiled.depth
+
+        self.n_features = self.layers[0].in_features
+        self.n_classes = self.layers[-1].out_features
+
+def _time_requests(fn, n_requests):
+    import time
+    timings = []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+def baseline_encrypted_forward(model, context, input_data):
+    """
+    The request path before the plan existed: weights pulled out of the
+    PyTorch module (.numpy().T) on every request and handed to matmul as
+    NumPy arrays.
+    """
+    enc_input = ts.ckks_vector(context, input_data)
+    fc1_weight = model.fc1.weight.data.numpy().T
+    fc1_bias = model.fc1.bias.data.numpy()
+    fc2_weight = model.fc2.weight.data.numpy().T
+    fc2_bias = model.fc2.bias.data.numpy()
+    enc_hidden = enc_input.matmul(fc1_weight) + fc1_bias
+    enc_hidden.square_()
+    enc_output = enc_hidden.matmul(fc2_weight) + fc2_bias
+    return np.array(enc_output.decrypt())
+
+if __name__ == "__main__":
+    import argparse
+    from digit_recognition.inference import load_model, setup_tenseal_context, encrypted_forward
+    from digit_recognition.preprocess import standardize
+    from fhe.compiler import load_or_compile
+    from fhe.context_cache import ensure_galois_keys
+
+    parser = argparse.ArgumentParser(description="Per-request latency with and without a prebuilt plan")
+    parser.add_argument("--requests", type=int, default=10)
+    args = parser.parse_args()
+
+    model = load_model()
+    compiled = load_or_compile("digit", model)
+    context = setup_tenseal_context()
+    ensure_galois_keys(context)
+    image = standardize(np.random.default_rng(0).random(28 * 28))
+
+    def weight_extraction():
+        return [model.fc1.weight.data.numpy().T, model.fc1.bias.data.numpy(),
+                model.fc2.weight.data.numpy().T, model.fc2.bias.data.numpy()]
+
+    # Before: weights extracted and converted by matmul on every request
+    before = _time_requests(lambda: baseline_encrypted_forward(model, context, image), args.requests)
+
+    # After: plan built once
+    plan = FHEModelPlan(compiled)
+    after = _time_requests(lambda: encrypted_forward(plan, context, image), args.requests)
+
+    for name, t in [("per-request weights", before), ("prebuilt plan", after)]:
+        print(f"{name:>20}: mean {t.mean():.1f} ms  p50 {np.percentile(t, 50):.1f} ms  p95 {np.percentile(t, 95):.1f} ms")
+    extraction = _time_requests(weight_extraction, 1000)
+    print(f"{'weight extraction':>20}: mean {extraction.mean():.3f} ms (part of every 'before' request)")
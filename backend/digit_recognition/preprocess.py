@@ -0,0 +1,76 @@
+"""
+Compact input decoding for digit classification
+
+Images arrive as raw uint8 buffers (784 bytes per 28x28 image, 0 = background,
+255 = ink) or as PNG canvas snapshots, and are turned into normalized float32
+arrays without creating a Python object per pixel.
+"""
+
+import base64
+import binascii
+import io
+
+import numpy as np
+
+IMAGE_SIZE = 28
+N_PIXELS = IMAGE_SIZE * IMAGE_SIZE
+
+# Same statistics as transforms.Normalize in digit_recognition/train.py
+MNIST_MEAN = 0.1307
+MNIST_STD = 0.3081
+
+# uint8 -> normalized float32, applied as a single table lookup
+_NORMALIZE_LUT = ((np.arange(256, dtype=np.float32) / 255.0 - MNIST_MEAN) / MNIST_STD).astype(np.float32)
+
+class ImageDecodeError(ValueError):
+    pass
+
+def normalize(pixels):
+    """(k, 784) uint8 -> (k, 784) float32 with MNIST normalization"""
+    return _NORMALIZE_LUT[pixels]
+
+def standardize(pixels):
+    """[0, 1] float pixels (as the canvas sends them) -> float32 with MNIST normalization"""
+    return ((np.asarray(pixels, dtype=np.float32) - MNIST_MEAN) / MNIST_STD).astype(np.float32)
+
+def decode_raw(buffer):
+    """Raw bytes holding k * 784 uint8 pixels -> (k, 784) uint8 array"""
+    if len(buffer) == 0 or len(buffer) % N_PIXELS != 0:
+        raise ImageDecodeError(f"Expected a multiple of {N_PIXELS} bytes, got {len(buffer)}")
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(-1, N_PIXELS)
+
+def decode_base64(data):
+    """Base64 string (optionally a data: URL) -> bytes"""
+    if data.startswith("data:"):
+        data = data.split(",", 1)[-1]
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ImageDecodeError(f"Invalid base64 data: {e}")
+
+def decode_png(data):
+    """
+    PNG (any size / mode) -> (784,) uint8 with ink as high values.
+    Canvas snapshots are dark ink on a light background, so light images are inverted.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except (UnidentifiedImageError, OSError) as e:
+        raise ImageDecodeError(f"Invalid image: {e}")
+
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        # Transparent canvas pixels are background
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        background.alpha_composite(image.convert("RGBA"))
+        image = background
+    image = image.convert("L")
+    if image.size != (IMAGE_SIZE, IMAGE_SIZE):
+        image = image.resize((IMAGE_SIZE, IMAGE_SIZE), Image.BILINEAR)
+
+    pixels = np.asarray(image, dtype=np.uint8).reshape(N_PIXELS)
+    if pixels.mean() > 127:
+        pixels = 255 - pixels
+    return pixels
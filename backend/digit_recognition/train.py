@@ -1,86 +1,213 @@
+"""
+Train the square-activation ConvNet on MNIST
+
+Two modes:
+- "fast" (default): MNIST is loaded once as a uint8 tensor; each batch is
+  sliced from it and augmented on the whole batch at once with a random affine
+  grid (rotation, shift, scale) via affine_grid / grid_sample. No PIL, no
+  per-image transforms, no DataLoader.
+- "legacy": the original torchvision pipeline (PIL RandomRotation/RandomAffine
+  per image through a DataLoader, `--workers` worker processes).
+
+Both train on inputs normalized with the MNIST mean/std (the API normalizes
+in plaintext before encrypting) and use the same augmentation ranges. Seeds are fixed, so a
+fast-mode run is reproducible for a given seed and thread count.
+
+Usage (from backend/):
+    python -m digit_recognition.train --epochs 15 --threads 4 --seed 0
+    python -m digit_recognition.train --mode legacy --workers 2
+"""
+
+import argparse
+import functools
+import math
+import os
+import random
+import time
+
+import numpy as np
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 from torchvision import datasets, transforms
 from torch.utils.data import DataLoader
-import os
+
 from digit_recognition.model import ConvNet
+from digit_recognition.preprocess import MNIST_MEAN, MNIST_STD
 
-def train_model():
-    # Parameters
-    BATCH_SIZE = 64
-    EPOCHS = 15 # Increased epochs
-    LEARNING_RATE = 0.001
-    
-    # Check device
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    print(f"Using device: {device}")
+# Parameters
+BATCH_SIZE = 64
+EPOCHS = 15
+LEARNING_RATE = 0.001
+
+# Augmentation ranges (same as the legacy RandomRotation / RandomAffine)
+ROTATION_DEGREES = 15
+TRANSLATE = 0.1
+SCALE = (0.9, 1.1)
 
-    # Transformations with Augmentation
+def seed_everything(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+def load_mnist_tensors(root, train):
+    """(N, 28, 28) uint8 images and (N,) int64 labels, read once"""
+    dataset = datasets.MNIST(root=root, train=train, download=True)
+    return dataset.data, dataset.targets
+
+def normalize(images):
+    return (images - MNIST_MEAN) / MNIST_STD
+
+def random_affine_batch(images, generator):
+    """
+    Rotate, shift and scale a (B, 1, 28, 28) float batch in one grid_sample call.
+    Each image gets its own random transform; pixels moved in from outside are 0.
+    """
+    batch = images.shape[0]
+    angle = (torch.rand(batch, generator=generator) * 2 - 1) * math.radians(ROTATION_DEGREES)
+    scale = SCALE[0] + torch.rand(batch, generator=generator) * (SCALE[1] - SCALE[0])
+    # Shift as a fraction of the image size; grid coordinates span 2 units
+    shift = (torch.rand(batch, 2, generator=generator) * 2 - 1) * TRANSLATE * 2
+
+    # affine_grid maps output to input coordinates, so use the inverse transform
+    cos, sin = torch.cos(angle) / scale, torch.sin(angle) / scale
+    inverse = torch.stack([
+        torch.stack([cos, sin], dim=1),
+        torch.stack([-sin, cos], dim=1),
+    ], dim=1)
+    offset = -torch.bmm(inverse, shift.unsqueeze(2))
+    theta = torch.cat([inverse, offset], dim=2).to(images.device)
+
+    grid = F.affine_grid(theta, images.shape, align_corners=False)
+    return F.grid_sample(images, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+def fast_batches(images, targets, batch_size, generator, augment=True):
+    """Shuffled, augmented, normalized batches sliced from the preloaded uint8 tensor"""
+    order = torch.randperm(images.shape[0], generator=generator)
+    for start in range(0, len(order), batch_size):
+        index = order[start:start + batch_size]
+        data = images[index].unsqueeze(1).float().div_(255)
+        if augment:
+            data = random_affine_batch(data, generator)
+        yield normalize(data), targets[index]
+
+def _seed_worker(seed, worker_id):
+    seed_everything(seed + worker_id)
+
+def legacy_loader(root, batch_size, workers, seed):
     transform_train = transforms.Compose([
-        transforms.RandomRotation(15), # Initial rotation around center
-        transforms.RandomAffine(degrees=0, translate=(0.1, 0.1), scale=(0.9, 1.1)), # Small shifts/scales
+        transforms.RandomRotation(ROTATION_DEGREES), # Initial rotation around center
+        transforms.RandomAffine(degrees=0, translate=(TRANSLATE, TRANSLATE), scale=SCALE), # Small shifts/scales
         transforms.ToTensor(),
-        transforms.Normalize((0.1307,), (0.3081,)) # MNIST Stats
+        transforms.Normalize((MNIST_MEAN,), (MNIST_STD,)) # MNIST Stats
     ])
+    train_dataset = datasets.MNIST(root=root, train=True, download=True, transform=transform_train)
+    generator = torch.Generator().manual_seed(seed)
+    return DataLoader(
+        train_dataset, batch_size=batch_size, shuffle=True, num_workers=workers, generator=generator,
+        worker_init_fn=functools.partial(_seed_worker, seed), persistent_workers=workers > 0
+    )
 
-    transform_test = transforms.Compose([
-        transforms.ToTensor(),
-        transforms.Normalize((0.1307,), (0.3081,))
-    ])
+def evaluate(model, images, targets, device, batch_size=1000):
+    """(average loss, correct count) on preloaded test tensors"""
+    criterion = nn.CrossEntropyLoss(reduction="sum")
+    model.eval()
+    test_loss = 0.0
+    correct = 0
+    with torch.no_grad():
+        for start in range(0, images.shape[0], batch_size):
+            data = normalize(images[start:start + batch_size].unsqueeze(1).float().div_(255)).to(device)
+            target = targets[start:start + batch_size].to(device)
+            output = model(data)
+            test_loss += criterion(output, target).item()
+            correct += output.argmax(dim=1).eq(target).sum().item()
+    return test_loss / images.shape[0], correct
 
-    # Load Data
-    print("Downloading MNIST data...")
-    train_dataset = datasets.MNIST(root='./data', train=True, download=True, transform=transform_train)
-    test_dataset = datasets.MNIST(root='./data', train=False, download=True, transform=transform_test)
+def train_model(mode="fast", epochs=EPOCHS, batch_size=BATCH_SIZE, learning_rate=LEARNING_RATE, threads=None, workers=0,
+                seed=0, data_root="./data", save_path="mnist_model.pth", augment=True):
+    seed_everything(seed)
+    if threads:
+        torch.set_num_threads(threads)
 
-    train_loader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True)
-    test_loader = DataLoader(test_dataset, batch_size=1000, shuffle=False)
+    # Check device
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"Using device: {device} ({torch.get_num_threads()} threads, mode={mode}, seed={seed})")
+
+    # Load Data
+    print("Loading MNIST data...")
+    load_start = time.perf_counter()
+    test_images, test_targets = load_mnist_tensors(data_root, train=False)
+    if mode == "fast":
+        train_images, train_targets = load_mnist_tensors(data_root, train=True)
+        n_train = train_images.shape[0]
+        generator = torch.Generator().manual_seed(seed)
+    elif mode == "legacy":
+        train_loader = legacy_loader(data_root, batch_size, workers, seed)
+        n_train = len(train_loader.dataset)
+    else:
+        raise ValueError(f"Unknown mode {mode!r}, expected 'fast' or 'legacy'")
+    print(f"Data ready in {time.perf_counter() - load_start:.2f}s ({n_train} training images)")
 
     # Model
     model = ConvNet(hidden=128).to(device) # Matches new default
     criterion = nn.CrossEntropyLoss()
-    optimizer = optim.Adam(model.parameters(), lr=LEARNING_RATE)
+    optimizer = optim.Adam(model.parameters(), lr=learning_rate)
 
     # Training
-    model.train()
-    for epoch in range(1, EPOCHS + 1):
+    for epoch in range(1, epochs + 1):
+        model.train()
+        epoch_start = time.perf_counter()
         running_loss = 0.0
-        for batch_idx, (data, target) in enumerate(train_loader):
+        n_batches = 0
+        if mode == "fast":
+            batches = fast_batches(train_images, train_targets, batch_size, generator, augment)
+        else:
+            batches = train_loader
+        for data, target in batches:
             data, target = data.to(device), target.to(device)
-            
+
             optimizer.zero_grad()
             output = model(data)
             loss = criterion(output, target)
             loss.backward()
             optimizer.step()
-            
-            running_loss += loss.item()
-            
-            if batch_idx % 100 == 0:
-                print(f'Epoch {epoch} [{batch_idx * len(data)}/{len(train_loader.dataset)} ({100. * batch_idx / len(train_loader):.0f}%)]\tLoss: {loss.item():.6f}')
 
-    # Evaluation
-    model.eval()
-    test_loss = 0
-    correct = 0
-    with torch.no_grad():
-        for data, target in test_loader:
-            data, target = data.to(device), target.to(device)
-            output = model(data)
-            test_loss += criterion(output, target).item()
-            pred = output.argmax(dim=1, keepdim=True)
-            correct += pred.eq(target.view_as(pred)).sum().item()
+            running_loss += loss.item()
+            n_batches += 1
 
-    test_loss /= len(test_loader.dataset)
-    accuracy = 100. * correct / len(test_loader.dataset)
+        epoch_seconds = time.perf_counter() - epoch_start
+        print(f"Epoch {epoch}/{epochs}: loss {running_loss / n_batches:.4f}, "
+              f"{epoch_seconds:.2f}s ({n_train / epoch_seconds:.0f} images/s)")
 
-    print(f'\nTest set: Average loss: {test_loss:.4f}, Accuracy: {correct}/{len(test_loader.dataset)} ({accuracy:.2f}%)\n')
+    # Evaluation
+    test_loss, correct = evaluate(model, test_images, test_targets, device)
+    n_test = test_images.shape[0]
+    accuracy = 100. * correct / n_test
+    print(f'\nTest set: Average loss: {test_loss:.4f}, Accuracy: {correct}/{n_test} ({accuracy:.2f}%)\n')
 
     # Save Model
-    save_path = "mnist_model.pth"
     torch.save(model.state_dict(), save_path)
     print(f"Model saved to {save_path}")
+    return model
 
 if __name__ == "__main__":
-    train_model()
+    parser = argparse.ArgumentParser(description="Train the square-activation MNIST model")
+    parser.add_argument("--mode", choices=["fast", "legacy"], default="fast")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--lr", type=float, default=LEARNING_RATE)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("TRAIN_THREADS", 0)) or None,
+                        help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument("--workers", type=int, default=0, help="DataLoader worker processes (legacy mode)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data", default="./data", help="MNIST download directory")
+    parser.add_argument("--output", default="mnist_model.pth")
+    parser.add_argument("--no-augment", action="store_true", help="Disable augmentation (fast mode)")
+    args = parser.parse_args()
+
+    train_model(
+        mode=args.mode, epochs=args.epochs, batch_size=args.batch_size, learning_rate=args.lr,
+        threads=args.threads, workers=args.workers, seed=args.seed, data_root=args.data,
+        save_path=args.output, augment=not args.no_augment
+    )
@@ -0,0 +1 @@
+# Low-level FHE building blocks shared by the digit and sentiment models
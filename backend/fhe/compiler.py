@@ -0,0 +1,251 @@
+"""
+Model compiler for FHE inference
+
+Turns a trained state_dict into a minimal-depth stack of affine layers:
+
+- input normalization ((x - mean) / std) can be folded into the first layer
+  (ModelSpec.input_normalization; the digit model does not use it, see SPECS)
+- consecutive layers with an identity activation between them are fused
+  (W2 (W1 x + b1) + b2 = (W2 W1) x + (W2 b1 + b2)), saving one ciphertext level
+
+Every compiled model is checked against the original module before use.
+Compiled plans are cached next to the weights and recompiled when the
+weights change.
+
+Usage (from backend/):
+    python -m fhe.compiler --model digit
+    python -m fhe.compiler --model sentiment
+"""
+
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Bump when the compilation rules change so cached plans are rebuilt
+COMPILER_VERSION = 2
+
+class CompiledModel:
+    """
+    Affine layers [(weight (out, in), bias (out,))] in float64,
+    `activations[i]` ("square" or None) is applied after layer i.
+    """
+    def __init__(self, layers, activations, source_hash=None):
+        self.layers = [(np.asarray(w, dtype=np.float64), np.asarray(b, dtype=np.float64)) for w, b in layers]
+        self.activations = list(activations)
+        self.source_hash = source_hash
+
+    @property
+    def n_features(self):
+        return self.layers[0][0].shape[1]
+
+    @property
+    def n_classes(self):
+        return self.layers[-1][0].shape[0]
+
+    @property
+    def depth(self):
+        """Rescales needed: one per layer plus one per square activation"""
+        return len(self.layers) + sum(1 for a in self.activations if a == "square")
+
+    def forward(self, x):
+        """
+        Plaintext evaluation of a (B, n_features) batch. A SciPy sparse matrix
+        (e.g. TF-IDF CSR) is multiplied as-is, without densifying it.
+        """
+        if not hasattr(x, "tocsr"):
+            x = np.asarray(x, dtype=np.float64)
+        for (weight, bias), activation in zip(self.layers, self.activations):
+            x = np.asarray(x @ weight.T) + bias
+            if activation == "square":
+                x = x * x
+        return x
+
+    def save(self, path):
+        arrays = {}
+        for i, (weight, bias) in enumerate(self.layers):
+            arrays[f"weight_{i}"] = weight
+            arrays[f"bias_{i}"] = bias
+        meta = {"activations": self.activations, "source_hash": self.source_hash, "compiler_version": COMPILER_VERSION}
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, meta=json.dumps(meta), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            n_layers = len(meta["activations"])
+            layers = [(data[f"weight_{i}"], data[f"bias_{i}"]) for i in range(n_layers)]
+        if meta.get("compiler_version") != COMPILER_VERSION:
+            raise ValueError(f"Plan was built by compiler version {meta.get('compiler_version')}")
+        return cls(layers, meta["activations"], meta.get("source_hash"))
+
+def state_dict_hash(state_dict):
+    """Hash of the weights a plan was compiled from"""
+    digest = hashlib.sha256(str(COMPILER_VERSION).encode())
+    for name in sorted(state_dict):
+        digest.update(name.encode())
+        digest.update(state_dict[name].detach().cpu().numpy().tobytes())
+    return digest.hexdigest()
+
+def fold_input_normalization(layers, mean, std):
+    """W ((x - mean) / std) + b = (W / std) x + (b - W.sum(1) * mean / std)"""
+    (weight, bias), rest = layers[0], layers[1:]
+    return [(weight / std, bias - weight.sum(axis=1) * mean / std)] + rest
+
+def fuse_linear_layers(layers, activations):
+    """Merge layer i+1 into layer i whenever activation i is the identity"""
+    fused_layers, fused_activations = [layers[0]], [activations[0]]
+    for (weight, bias), activation in zip(layers[1:], activations[1:]):
+        if fused_activations[-1] is None:
+            prev_weight, prev_bias = fused_layers[-1]
+            fused_layers[-1] = (weight @ prev_weight, weight @ prev_bias + bias)
+            fused_activations[-1] = activation
+        else:
+            fused_layers.append((weight, bias))
+            fused_activations.append(activation)
+    return fused_layers, fused_activations
+
+def compile_state_dict(state_dict, layer_names, activations, input_normalization=None):
+    """
+    state_dict of an MLP (`<name>.weight`, `<name>.bias` for each layer name)
+    -> CompiledModel with normalization folded (if given) and identity activations fused.
+    """
+    layers = [
+        (state_dict[f"{name}.weight"].detach().cpu().numpy().astype(np.float64),
+         state_dict[f"{name}.bias"].detach().cpu().numpy().astype(np.float64))
+        for name in layer_names
+    ]
+    if input_normalization is not None:
+        layers = fold_input_normalization(layers, *input_normalization)
+    layers, activations = fuse_linear_layers(layers, list(activations))
+    return CompiledModel(layers, activations, state_dict_hash(state_dict))
+
+def check_equivalence(compiled, module, inputs, preprocess=None, tolerance=1e-4):
+    """
+    Compare compiled.forward(x) with module(preprocess(x)) (float32).
+    Returns the largest absolute difference, raises ValueError if it exceeds
+    `tolerance` relative to the largest output magnitude.
+    """
+    module_inputs = preprocess(inputs) if preprocess else inputs
+    with torch.no_grad():
+        expected = module(torch.from_numpy(np.asarray(module_inputs, dtype=np.float32))).double().numpy()
+    actual = compiled.forward(inputs)
+    max_error = float(np.max(np.abs(actual - expected)))
+    scale = max(1.0, float(np.max(np.abs(expected))))
+    if max_error > tolerance * scale:
+        raise ValueError(f"Compiled model differs from the original module (max error {max_error:.3g})")
+    return max_error
+
+class ModelSpec:
+    """How to compile one of our models and which inputs the compiled plan expects"""
+    def __init__(self, layer_names, activations, plan_path, input_normalization=None, input_sampler=None):
+        self.layer_names = layer_names
+        self.activations = activations
+        self.plan_path = plan_path
+        self.input_normalization = input_normalization
+        self.input_sampler = input_sampler
+
+    def compile(self, state_dict):
+        return compile_state_dict(state_dict, self.layer_names, self.activations, self.input_normalization)
+
+    def verify(self, compiled, module, n_samples=64, seed=0):
+        rng = np.random.default_rng(seed)
+        inputs = self.input_sampler(rng, n_samples, compiled.n_features)
+        preprocess = None
+        if self.input_normalization is not None:
+            mean, std = self.input_normalization
+            preprocess = lambda x: (x - mean) / std
+        return check_equivalence(compiled, module, inputs, preprocess)
+
+def _unit_interval(rng, n_samples, n_features):
+    return rng.random((n_samples, n_features))
+
+def _sparse_tfidf(rng, n_samples, n_features):
+    # TF-IDF rows: mostly zeros, unit L2 norm
+    x = rng.random((n_samples, n_features)) * (rng.random((n_samples, n_features)) < 0.1)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+def _mnist_pixels(rng, n_samples, n_features):
+    from digit_recognition.preprocess import standardize
+    return standardize(_unit_interval(rng, n_samples, n_features))
+
+SPECS = {
+    # Inputs are MNIST-normalized pixels, as in train.py. Folding the normalization
+    # into fc1 gives a bias of up to ~10, which TenSEAL's vector matmul carries
+    # into fc2: the mean CKKS logit error at N=16384 grew from 0.018 to 5.3.
+    "digit": ModelSpec(("fc1", "fc2"), ("square", None), "mnist_plan.npz", None, _mnist_pixels),
+    # nn.Identity between fc1 and fc2 -> one 256 x 3 affine map
+    "sentiment": ModelSpec(("fc1", "fc2"), (None, None), "sentiment_plan.npz", None, _sparse_tfidf),
+}
+
+def load_or_compile(name, module, plan_path=None):
+    """
+    Compiled plan for a loaded module: read from the cache file if it was built
+    from the same weights, otherwise compile and save. Always verified.
+    """
+    spec = SPECS[name]
+    plan_path = plan_path or os.path.join(BACKEND_DIR, spec.plan_path)
+    state_dict = module.state_dict()
+    expected_hash = state_dict_hash(state_dict)
+
+    compiled = None
+    if os.path.exists(plan_path):
+        try:
+            compiled = CompiledModel.load(plan_path)
+            if compiled.source_hash != expected_hash:
+                compiled = None
+        except Exception as e:
+            print(f"Warning: could not load compiled plan {plan_path} ({e}), recompiling.")
+            compiled = None
+
+    if compiled is None:
+        compiled = spec.compile(state_dict)
+        try:
+            compiled.save(plan_path)
+        except OSError as e:
+            print(f"Warning: could not save compiled plan {plan_path} ({e})")
+
+    spec.verify(compiled, module.eval())
+    return compiled
+
+def _load_module(name):
+    if name == "digit":
+        from digit_recognition.inference import load_model
+        return load_model(os.path.join(BACKEND_DIR, "mnist_model.pth"))
+    from sentiment_analysis.model import SentimentNet
+    model = SentimentNet(input_dim=256, hidden_dim=64, output_dim=3)
+    model_path = os.path.join(BACKEND_DIR, "sentiment_model.pth")
+    if os.path.exists(model_path):
+        model.load_state_dict(torch.load(model_path, map_location=torch.device("cpu"), weights_only=True))
+    else:
+        print(f"Warning: {model_path} not found, compiling a randomly initialized model.")
+    return model.eval()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a trained model into a fused FHE inference plan")
+    parser.add_argument("--model", choices=sorted(SPECS), default="digit")
+    parser.add_argument("--output", help="Plan file (default: backend/<model>_plan.npz)")
+    args = parser.parse_args()
+
+    spec = SPECS[args.model]
+    module = _load_module(args.model)
+    compiled = spec.compile(module.state_dict())
+    error = spec.verify(compiled, module)
+    plan_path = args.output or os.path.join(BACKEND_DIR, spec.plan_path)
+    compiled.save(plan_path)
+
+    original_depth = len(spec.layer_names) + sum(1 for a in spec.activations if a == "square")
+    shapes = " -> ".join(f"{w.shape[1]}x{w.shape[0]}" + (" (square)" if a == "square" else "")
+                         for (w, _), a in zip(compiled.layers, compiled.activations))
+    print(f"{args.model}: {shapes}, depth {original_depth} -> {compiled.depth}, max error vs module {error:.2e}")
+    print(f"Plan written to {plan_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+On-disk cache for FHE contexts and keys
+
+A cached file is only used when its parameter hash (stored next to it in
+`<path>.sha256`) matches the parameters being requested, otherwise it is
+regenerated. Files contain the secret key and are written with 0600 permissions.
+
+Contexts are cached without Galois keys. TenSEAL re-derives Galois keys
+from the secret key when a context that has both is loaded, which costs as
+much as generating them (~3.4s for 16384, a public context with stored Galois
+keys is 175 MB and still takes ~2.6s). Without them a cached context loads in
+~0.3s. The Galois keys are generated from the cached secret key by
+ensure_galois_keys(), on the first rotation or in the background right after
+startup (warm_galois_keys()).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+import tenseal as ts
+import tenseal.sealapi as sealapi
+
+CONTEXT_CACHE_ENABLED = os.getenv("FHE_CONTEXT_CACHE", "1") != "0"
+
+def params_hash(**params):
+    """Stable hash of the parameters a cached context/key was generated with"""
+    params = dict(params, tenseal=ts.__version__)
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def is_cached(path, expected_hash):
+    """True if `path` exists and was generated with the expected parameters"""
+    try:
+        with open(path + ".sha256") as f:
+            return f.read().strip() == expected_hash and os.path.exists(path)
+    except OSError:
+        return False
+
+def _write_private(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def mark_cached(path, expected_hash):
+    """Record the parameter hash once `path` has been fully written"""
+    _write_private(path + ".sha256", expected_hash.encode())
+
+def load_or_create_context(path, poly_modulus_degree, coeff_mod_bit_sizes, global_scale=2**40, galois_keys=True):
+    """
+    Load a CKKS TenSEAL context from `path` or create (and save) a new one.
+    Returns (context, stats) where stats has `seconds` and `cached`.
+    With `galois_keys`, call ensure_galois_keys() (or warm_galois_keys())
+    before rotating; they are not part of the cached file.
+    """
+    start = time.perf_counter()
+    expected_hash = params_hash(
+        scheme="CKKS",
+        poly_modulus_degree=poly_modulus_degree,
+        coeff_mod_bit_sizes=list(coeff_mod_bit_sizes),
+        global_scale=global_scale,
+        galois_keys="on_demand" if galois_keys else False
+    )
+
+    if CONTEXT_CACHE_ENABLED and is_cached(path, expected_hash):
+        try:
+            with open(path, "rb") as f:
+                context = ts.context_from(f.read())
+            return context, {"seconds": time.perf_counter() - start, "cached": True}
+        except Exception as e:
+            print(f"Warning: could not load cached context {path} ({e}), regenerating.")
+
+    context = ts.context(
+        ts.SCHEME_TYPE.CKKS,
+        poly_modulus_degree=poly_modulus_degree,
+        coeff_mod_bit_sizes=list(coeff_mod_bit_sizes)
+    )
+    context.global_scale = global_scale
+
+    if CONTEXT_CACHE_ENABLED:
+        try:
+            _write_private(path, context.serialize(save_secret_key=True, save_galois_keys=False))
+            mark_cached(path, expected_hash)
+        except OSError as e:
+            print(f"Warning: could not save context cache {path} ({e})")
+
+    return context, {"seconds": time.perf_counter() - start, "cached": False}
+
+_galois_lock = threading.Lock()
+
+def ensure_galois_keys(context):
+    """Generate the Galois keys of a context that holds its secret key, once"""
+    with _galois_lock:
+        if not context.has_galois_keys():
+            start = time.perf_counter()
+            context.generate_galois_keys()
+            print(f"Galois keys generated ({time.perf_counter() - start:.2f}s).")
+
+def warm_galois_keys(context):
+    """ensure_galois_keys in a background thread, so startup does not wait for it"""
+    thread = threading.Thread(target=ensure_galois_keys, args=(context,), daemon=True)
+    thread.start()
+    return thread
+
+def load_secret_key(seal_context, path, expected_hash):
+    """Load a sealapi SecretKey saved by save_secret_key, or None if missing/stale"""
+    if not (CONTEXT_CACHE_ENABLED and is_cached(path, expected_hash)):
+        return None
+    try:
+        secret_key = sealapi.SecretKey()
+        secret_key.load(seal_context, path)
+        return secret_key
+    except Exception as e:
+        print(f"Warning: could not load cached key {path} ({e}), regenerating.")
+        return None
+
+def save_secret_key(secret_key, path, expected_hash):
+    if not CONTEXT_CACHE_ENABLED:
+        return
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        secret_key.save(tmp)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, path)
+        mark_cached(path, expected_hash)
+    except (OSError, RuntimeError) as e:
+        print(f"Warning: could not save key cache {path} ({e})")
@@ -0,0 +1,317 @@
+"""
+Rotation-optimized encrypted linear layers (CKKS, SEAL via tenseal.sealapi)
+
+Each layer uses the hybrid diagonal method with baby-step / giant-step
+rotations instead of TenSEAL's generic vector-matrix product:
+
+    W (m x n) is zero padded to m_pad x n_pad (powers of two, m_pad <= n_pad)
+    z = sum_k diag_k * rot(x, k)            k = 0 .. m_pad-1
+    y = sum_t rot(z, t * m_pad)             folded with log2(n_pad / m_pad) rotations
+
+The input is replicated with period n_pad across all slots, so every rotation
+is cyclic within one period and the output comes out replicated with period
+m_pad, ready for the next layer.
+
+Baby steps are taken one slot at a time and giant steps are accumulated
+Horner-style, so a layer only needs Galois keys for steps 1, g and the fold
+steps. For ConvNet that is 8 keys instead of the full power-of-two set, with
+~35 rotations per inference instead of one per input feature.
+
+Run `python -m fhe.linear` to check the engine against the plaintext models.
+"""
+
+import math
+
+import numpy as np
+import tenseal.sealapi as sealapi
+
+from fhe.context_cache import params_hash, load_secret_key, save_secret_key
+
+def _next_pow2(n):
+    return 1 << (max(1, n) - 1).bit_length()
+
+class BSGSLinear:
+    """One linear layer (y = W x + b) prepared for the hybrid diagonal method"""
+    def __init__(self, weight, bias, slot_count):
+        weight = np.asarray(weight, dtype=np.float64)
+        bias = np.asarray(bias, dtype=np.float64)
+
+        self.out_features, self.in_features = weight.shape
+        self.m_pad = _next_pow2(self.out_features)
+        self.n_pad = max(_next_pow2(self.in_features), self.m_pad)
+        if self.n_pad > slot_count:
+            raise ValueError(f"Layer input ({self.n_pad}) does not fit in {slot_count} slots")
+        self.slot_count = slot_count
+
+        # Baby step size g and giant step count G, g * G = m_pad
+        self.g = _next_pow2(int(math.ceil(math.sqrt(self.m_pad))))
+        self.G = self.m_pad // self.g
+
+        padded = np.zeros((self.m_pad, self.n_pad))
+        padded[:self.out_features, :self.in_features] = weight
+
+        # diag_k[i] = W[i mod m_pad, (i + k) mod n_pad], pre-rotated right by the giant step g*j
+        rows = np.arange(self.n_pad) % self.m_pad
+        self.diagonals = []
+        for k in range(self.m_pad):
+            diag = padded[rows, (np.arange(self.n_pad) + k) % self.n_pad]
+            giant = (k // self.g) * self.g
+            self.diagonals.append(np.roll(diag, giant))
+
+        self.bias = np.zeros(self.m_pad)
+        self.bias[:self.out_features] = bias
+
+        self._plain_diagonals = None
+        self._plain_bias = {}
+
+    @property
+    def rotation_steps(self):
+        steps = {1} if self.g > 1 else set()
+        if self.G > 1:
+            steps.add(self.g)
+        step = self.n_pad // 2
+        while step >= self.m_pad:
+            steps.add(step)
+            step //= 2
+        return steps
+
+    @property
+    def rotation_count(self):
+        return (self.g - 1) + (self.G - 1) + int(math.log2(self.n_pad // self.m_pad))
+
+    def _tile(self, values, period):
+        return np.tile(values, self.slot_count // period).tolist()
+
+    def encode(self, encoder, parms_id, scale):
+        """Pre-encode the diagonals at the level this layer runs on"""
+        self._plain_diagonals = []
+        for diag in self.diagonals:
+            if not np.any(diag):
+                # SEAL refuses to multiply by an all-zero plaintext
+                self._plain_diagonals.append(None)
+                continue
+            plain = sealapi.Plaintext()
+            encoder.encode(self._tile(diag, self.n_pad), parms_id, scale, plain)
+            self._plain_diagonals.append(plain)
+        self._plain_bias = {}
+
+    def _bias_plain(self, encoder, ct):
+        # The scale after rescaling is deterministic, so this encodes once per level
+        key = (tuple(ct.parms_id()), ct.scale)
+        plain = self._plain_bias.get(key)
+        if plain is None:
+            plain = sealapi.Plaintext()
+            encoder.encode(self._tile(self.bias, self.m_pad), ct.parms_id(), ct.scale, plain)
+            self._plain_bias[key] = plain
+        return plain
+
+    def apply(self, engine, ct):
+        """Encrypted W x + b. Consumes one level."""
+        evaluator = engine.evaluator
+
+        # Baby steps: rot(x, b) for b = 0 .. g-1
+        baby = [ct]
+        for _ in range(1, self.g):
+            rotated = sealapi.Ciphertext()
+            evaluator.rotate_vector(baby[-1], 1, engine.galois_keys, rotated)
+            baby.append(rotated)
+
+        # Giant steps (Horner): acc = rot(... rot(inner_{G-1}, g) + inner_{G-2} ..., g) + inner_0
+        acc = None
+        for j in reversed(range(self.G)):
+            if acc is not None:
+                evaluator.rotate_vector_inplace(acc, self.g, engine.galois_keys)
+            for b in range(self.g):
+                plain = self._plain_diagonals[j * self.g + b]
+                if plain is None:
+                    continue
+                term = sealapi.Ciphertext()
+                evaluator.multiply_plain(baby[b], plain, term)
+                if acc is None:
+                    acc = term
+                else:
+                    evaluator.add_inplace(acc, term)
+        if acc is None:
+            raise ValueError("Layer weights are all zero")
+
+        evaluator.rescale_to_next_inplace(acc)
+
+        # Fold the n_pad / m_pad partial sums
+        step = self.n_pad // 2
+        while step >= self.m_pad:
+            rotated = sealapi.Ciphertext()
+            evaluator.rotate_vector(acc, step, engine.galois_keys, rotated)
+            evaluator.add_inplace(acc, rotated)
+            step //= 2
+
+        evaluator.add_plain_inplace(acc, self._bias_plain(engine.encoder, acc))
+        return acc
+
+class BSGSNetwork:
+    """
+    Encrypted MLP made of BSGSLinear layers on a dedicated SEAL context.
+    `activations[i]` is applied after layer i: "square" or None.
+    If `secret_key_path` is given the secret key is reused across restarts.
+    """
+    def __init__(self, layers, activations, poly_modulus_degree, coeff_mod_bit_sizes, scale_bits=40, secret_key_path=None):
+        self.poly_modulus_degree = poly_modulus_degree
+        self.coeff_mod_bit_sizes = list(coeff_mod_bit_sizes)
+        self.scale = 2.0 ** scale_bits
+        self.slot_count = poly_modulus_degree // 2
+        self.activations = list(activations)
+        self.layers = [BSGSLinear(w, b, self.slot_count) for w, b in layers]
+
+        depth = len(self.layers) + sum(1 for a in self.activations if a == "square")
+        if depth > len(self.coeff_mod_bit_sizes) - 2:
+            raise ValueError(f"Network needs depth {depth}, modulus chain {self.coeff_mod_bit_sizes} is too short")
+
+        parms = sealapi.EncryptionParameters(sealapi.SCHEME_TYPE.CKKS)
+        parms.set_poly_modulus_degree(poly_modulus_degree)
+        parms.set_coeff_modulus(sealapi.CoeffModulus.Create(poly_modulus_degree, self.coeff_mod_bit_sizes))
+        self.context = sealapi.SEALContext(parms, True, sealapi.SEC_LEVEL_TYPE.TC128)
+
+        secret_key = None
+        if secret_key_path:
+            key_hash = params_hash(
+                scheme="CKKS-sealapi",
+                poly_modulus_degree=poly_modulus_degree,
+                coeff_mod_bit_sizes=self.coeff_mod_bit_sizes
+            )
+            secret_key = load_secret_key(self.context, secret_key_path, key_hash)
+
+        if secret_key is not None:
+            keygen = sealapi.KeyGenerator(self.context, secret_key)
+        else:
+            keygen = sealapi.KeyGenerator(self.context)
+            if secret_key_path:
+                save_secret_key(keygen.secret_key(), secret_key_path, key_hash)
+        self.secret_key = keygen.secret_key()
+        self.public_key = sealapi.PublicKey()
+        keygen.create_public_key(self.public_key)
+        self.relin_keys = sealapi.RelinKeys()
+        keygen.create_relin_keys(self.relin_keys)
+
+        # Only the rotations this network performs (the binding takes Galois elements, not steps)
+        self.rotation_steps = sorted(set().union(*(layer.rotation_steps for layer in self.layers)))
+        galois_elts = self.context.key_context_data().galois_tool().get_elts_from_steps(self.rotation_steps)
+        self.galois_keys = sealapi.GaloisKeys()
+        keygen.create_galois_keys(galois_elts, self.galois_keys)
+
+        self.encoder = sealapi.CKKSEncoder(self.context)
+        self.encryptor = sealapi.Encryptor(self.context, self.public_key)
+        self.decryptor = sealapi.Decryptor(self.context, self.secret_key)
+        self.evaluator = sealapi.Evaluator(self.context)
+
+        # Each layer's diagonals are encoded at the level its input arrives on
+        context_data = self.context.first_context_data()
+        for layer, activation in zip(self.layers, self.activations):
+            layer.encode(self.encoder, context_data.parms_id(), self.scale)
+            context_data = context_data.next_context_data()
+            if activation == "square":
+                context_data = context_data.next_context_data()
+
+    @property
+    def rotation_count(self):
+        return sum(layer.rotation_count for layer in self.layers)
+
+    def encrypt(self, x):
+        """Encrypt a feature vector replicated with the first layer's period"""
+        first = self.layers[0]
+        padded = np.zeros(first.n_pad)
+        padded[:len(x)] = x
+        plain = sealapi.Plaintext()
+        self.encoder.encode(np.tile(padded, self.slot_count // first.n_pad).tolist(), self.scale, plain)
+        ct = sealapi.Ciphertext()
+        self.encryptor.encrypt(plain, ct)
+        return ct
+
+    def decrypt(self, ct):
+        plain = sealapi.Plaintext()
+        self.decryptor.decrypt(ct, plain)
+        values = self.encoder.decode_double(plain)
+        return np.array(values[:self.layers[-1].out_features])
+
+    def evaluate(self, ct):
+        """Run every layer (and activation) on an encrypted input"""
+        for layer, activation in zip(self.layers, self.activations):
+            ct = layer.apply(self, ct)
+            if activation == "square":
+                self.evaluator.square_inplace(ct)
+                self.evaluator.relinearize_inplace(ct, self.relin_keys)
+                self.evaluator.rescale_to_next_inplace(ct)
+        return ct
+
+    def forward(self, x):
+        """Encrypt -> evaluate -> decrypt, returns the output logits"""
+        return self.decrypt(self.evaluate(self.encrypt(x)))
+
+    @classmethod
+    def from_compiled(cls, compiled, poly_modulus_degree, coeff_mod_bit_sizes=None, scale_bits=40, secret_key_path=None):
+        """
+        Network for a CompiledModel (fhe/compiler.py). By default the modulus chain
+        has exactly compiled.depth intermediate primes.
+        """
+        if coeff_mod_bit_sizes is None:
+            coeff_mod_bit_sizes = [60] + [scale_bits] * compiled.depth + [60]
+        return cls(compiled.layers, compiled.activations, poly_modulus_degree, coeff_mod_bit_sizes,
+                   scale_bits=scale_bits, secret_key_path=secret_key_path)
+
+    @classmethod
+    def from_convnet(cls, model, poly_modulus_degree=16384, coeff_mod_bit_sizes=(60, 40, 40, 40, 60), secret_key_path=None):
+        """fc1 (784 -> 128) -> square -> fc2 (128 -> 10)"""
+        return cls(
+            [(model.fc1.weight.detach().numpy(), model.fc1.bias.detach().numpy()),
+             (model.fc2.weight.detach().numpy(), model.fc2.bias.detach().numpy())],
+            ["square", None],
+            poly_modulus_degree,
+            coeff_mod_bit_sizes,
+            secret_key_path=secret_key_path
+        )
+
+    @classmethod
+    def from_sentiment_net(cls, model, poly_modulus_degree=8192, coeff_mod_bit_sizes=(60, 40, 40, 60), secret_key_path=None):
+        """fc1 (256 -> 64) -> identity -> fc2 (64 -> 3)"""
+        return cls(
+            [(model.fc1.weight.detach().numpy(), model.fc1.bias.detach().numpy()),
+             (model.fc2.weight.detach().numpy(), model.fc2.bias.detach().numpy())],
+            [None, None],
+            poly_modulus_degree,
+            coeff_mod_bit_sizes,
+            secret_key_path=secret_key_path
+        )
+
+def verify_against_model(network, model, n_features, n_samples=5, atol=1e-2, seed=0):
+    """
+    Compare encrypted logits with plaintext model(x) on random inputs.
+    Returns the largest absolute error, raises AssertionError on mismatch.
+    """
+    import torch
+
+    rng = np.random.default_rng(seed)
+    max_error = 0.0
+    for _ in range(n_samples):
+        x = rng.random(n_features).astype(np.float32)
+        with torch.no_grad():
+            expected = model(torch.from_numpy(x).unsqueeze(0))[0].numpy()
+        actual = network.forward(x)
+        error = float(np.max(np.abs(actual - expected)))
+        max_error = max(max_error, error)
+        assert np.argmax(actual) == np.argmax(expected), f"argmax mismatch: {actual} vs {expected}"
+        assert error <= atol * max(1.0, float(np.max(np.abs(expected)))), f"error {error:.4g} too large"
+    return max_error
+
+if __name__ == "__main__":
+    import time
+    from digit_recognition.model import ConvNet
+    from sentiment_analysis.model import SentimentNet
+
+    for name, model, build, n_features in [
+        ("ConvNet", ConvNet().eval(), BSGSNetwork.from_convnet, 28 * 28),
+        ("SentimentNet", SentimentNet().eval(), BSGSNetwork.from_sentiment_net, 256),
+    ]:
+        network = build(model)
+        start = time.perf_counter()
+        error = verify_against_model(network, model, n_features)
+        elapsed = (time.perf_counter() - start) * 1000 / 5
+        print(f"{name}: max error {error:.2e}, {network.rotation_count} rotations, "
+              f"{len(network.rotation_steps)} Galois keys {network.rotation_steps}, {elapsed:.1f} ms / inference")
@@ -0,0 +1,68 @@
+"""
+Multi-input slot packing for TenSEAL CKKS inference
+
+Several inputs are encrypted column-major into one ciphertext with
+ts.enc_matmul_encoding (slot j * B + b holds feature j of input b), so one
+enc_matmul_plain per hidden neuron evaluates that neuron for every input at
+once; later layers are linear combinations of those per-neuron ciphertexts.
+Used for packed digit batches and for encrypted sentiment scoring.
+"""
+
+import numpy as np
+import tenseal as ts
+
+from fhe.context_cache import ensure_galois_keys
+from serving.metrics import time_stage
+
+def max_packed_batch(poly_modulus_degree, n_features):
+    """
+    Number of inputs that fit in one ciphertext for packed_forward.
+    The feature count is padded to the next power of two so the column sums
+    (rotations) never wrap around the slot vector.
+    """
+    slot_count = poly_modulus_degree // 2
+    padded = 1 << (n_features - 1).bit_length()
+    return max(1, slot_count // padded)
+
+def packed_forward(plan, context, inputs, pipeline="digit"):
+    """
+    Encrypt a (B, n_features) batch into one ciphertext and run every layer of
+    `plan` (an FHEModelPlan) on it. Needs a context with the secret key (Galois
+    keys are generated on first use) and plan.depth levels.
+    Returns a (B, n_classes) NumPy array of decrypted logits.
+    """
+    inputs = np.asarray(inputs, dtype=np.float64)
+    n_inputs = inputs.shape[0]
+    ensure_galois_keys(context)
+
+    with time_stage(pipeline, "batch_encrypt"):
+        enc_inputs = ts.enc_matmul_encoding(context, inputs.tolist())
+
+    # First layer: one ciphertext per output neuron, holding it for all B inputs
+    first = plan.layers[0]
+    with time_stage(pipeline, "batch_fc1"):
+        enc_values = [enc_inputs.enc_matmul_plain(weights, n_inputs) + bias
+                      for weights, bias in zip(first.rows, first.bias_values)]
+        if plan.activations[0] == "square":
+            for enc_v in enc_values:
+                enc_v.square_()
+
+    # Later layers are plain linear combinations of those ciphertexts
+    for i, (layer, activation) in enumerate(zip(plan.layers[1:], plan.activations[1:]), start=2):
+        with time_stage(pipeline, f"batch_fc{i}"):
+            next_values = []
+            for weights, bias in zip(layer.rows, layer.bias_values):
+                enc_c = enc_values[0] * weights[0]
+                for enc_v, w in zip(enc_values[1:], weights[1:]):
+                    enc_c += enc_v * w
+                enc_c += bias
+                if activation == "square":
+                    enc_c.square_()
+                next_values.append(enc_c)
+            enc_values = next_values
+
+    logits = np.empty((n_inputs, plan.n_classes), dtype=np.float64)
+    with time_stage(pipeline, "batch_decrypt"):
+        for c, enc_c in enumerate(enc_values):
+            logits[:, c] = enc_c.decrypt()[:n_inputs]
+    return logits
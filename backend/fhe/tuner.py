@@ -0,0 +1,209 @@
+"""
+CKKS parameter auto-tuner
+
+Enumerates 128-bit secure CKKS parameter sets whose modulus chain covers the
+compiled model's multiplicative depth (fhe/compiler.py), runs encrypted
+inference with each one and compares it with the plaintext model. The fastest set whose predictions all
+agree with plaintext (argmax) is reported.
+
+Usage (from backend/):
+    python -m fhe.tuner --model digit --engine bsgs --samples 50
+    python -m fhe.tuner --model sentiment --engine tenseal --output tuned_sentiment.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+import tenseal as ts
+import tenseal.sealapi as sealapi
+import torch
+
+from fhe.compiler import SPECS
+from fhe.linear import BSGSNetwork
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEGREES = (4096, 8192, 16384, 32768)
+SCALE_BITS = (20, 25, 30, 35, 40)
+
+def _load_digit_model():
+    from digit_recognition.inference import load_model
+    return load_model(os.path.join(BACKEND_DIR, "mnist_model.pth"))
+
+def _load_sentiment_model():
+    from sentiment_analysis.model import SentimentNet
+    model = SentimentNet(input_dim=256, hidden_dim=64, output_dim=3)
+    model_path = os.path.join(BACKEND_DIR, "sentiment_model.pth")
+    if os.path.exists(model_path):
+        model.load_state_dict(torch.load(model_path, map_location=torch.device("cpu"), weights_only=True))
+    else:
+        print(f"Warning: {model_path} not found, tuning a randomly initialized model.")
+    return model.eval()
+
+def _digit_samples(n_samples):
+    from torchvision import datasets, transforms
+    transform = transforms.Compose([transforms.ToTensor(), transforms.Normalize((0.1307,), (0.3081,))])
+    dataset = datasets.MNIST(root=os.path.join(BACKEND_DIR, "data"), train=False, download=True, transform=transform)
+    return np.stack([dataset[i][0].numpy().reshape(-1) for i in range(n_samples)])
+
+def _sentiment_samples(n_samples):
+    import joblib
+    from datasets import load_dataset
+    vectorizer = joblib.load(os.path.join(BACKEND_DIR, "sentiment_vectorizer.pkl"))
+    dataset = load_dataset("imdb", split=f"test[:{n_samples}]")
+    return vectorizer.transform(dataset["text"]).toarray().astype(np.float32)
+
+# name -> (model loader, sample loader, input features)
+MODELS = {
+    "digit": (_load_digit_model, _digit_samples, 28 * 28),
+    "sentiment": (_load_sentiment_model, _sentiment_samples, 256),
+}
+
+def load_samples(model_name, n_samples, seed=0):
+    """Test-set inputs for the model, or random inputs if the dataset is unavailable"""
+    _, sample_loader, n_features = MODELS[model_name]
+    try:
+        return sample_loader(n_samples), "test set"
+    except Exception as e:
+        print(f"Warning: could not load test data ({e}), using random inputs.")
+        return np.random.default_rng(seed).random((n_samples, n_features)).astype(np.float32), "random"
+
+def candidate_params(depth, degrees=DEGREES, scale_bits=SCALE_BITS):
+    """Secure (128-bit) parameter sets with exactly `depth` intermediate primes"""
+    candidates = []
+    for degree in degrees:
+        max_bits = sealapi.CoeffModulus.MaxBitCount(degree, sealapi.SEC_LEVEL_TYPE.TC128)
+        for bits in scale_bits:
+            # Outer primes leave 10-20 bits of headroom above the scale for the integer part
+            for outer in sorted({min(60, bits + 10), min(60, bits + 20)}):
+                coeff_mod_bit_sizes = [outer] + [bits] * depth + [outer]
+                if sum(coeff_mod_bit_sizes) <= max_bits:
+                    candidates.append({
+                        "poly_modulus_degree": degree,
+                        "coeff_mod_bit_sizes": coeff_mod_bit_sizes,
+                        "scale_bits": bits
+                    })
+    return candidates
+
+def _tenseal_runner(compiled, params):
+    context = ts.context(
+        ts.SCHEME_TYPE.CKKS,
+        poly_modulus_degree=params["poly_modulus_degree"],
+        coeff_mod_bit_sizes=params["coeff_mod_bit_sizes"]
+    )
+    context.global_scale = 2 ** params["scale_bits"]
+    context.generate_galois_keys()
+
+    weights = [(ts.plain_tensor(np.ascontiguousarray(weight.T)), ts.plain_tensor(bias))
+               for weight, bias in compiled.layers]
+
+    def run(x):
+        enc = ts.ckks_vector(context, x.tolist())
+        size = len(enc.serialize())
+        for (weight, bias), activation in zip(weights, compiled.activations):
+            enc = enc.matmul(weight) + bias
+            if activation == "square":
+                enc.square_()
+        return np.array(enc.decrypt()), size
+    return run
+
+def _bsgs_runner(compiled, params):
+    network = BSGSNetwork.from_compiled(
+        compiled,
+        params["poly_modulus_degree"],
+        params["coeff_mod_bit_sizes"],
+        scale_bits=params["scale_bits"]
+    )
+
+    def run(x):
+        ct = network.encrypt(x)
+        with tempfile.NamedTemporaryFile() as f:
+            ct.save(f.name)
+            size = os.path.getsize(f.name)
+        return network.decrypt(network.evaluate(ct)), size
+    return run
+
+ENGINES = {"tenseal": _tenseal_runner, "bsgs": _bsgs_runner}
+
+def evaluate_candidate(compiled, params, engine, samples, expected):
+    """Run every sample through one parameter set, return a report dict"""
+    report = dict(params)
+    try:
+        run = ENGINES[engine](compiled, params)
+        timings, errors, agree, sizes = [], [], 0, []
+        for x, plain_logits in zip(samples, expected):
+            start = time.perf_counter()
+            logits, size = run(x)
+            timings.append((time.perf_counter() - start) * 1000)
+            sizes.append(size)
+            errors.append(float(np.max(np.abs(logits - plain_logits))))
+            agree += int(np.argmax(logits) == np.argmax(plain_logits))
+        report.update({
+            "ok": True,
+            "latency_ms_mean": float(np.mean(timings)),
+            "latency_ms_p95": float(np.percentile(timings, 95)),
+            "ciphertext_bytes": int(np.mean(sizes)),
+            "max_abs_error": float(np.max(errors)),
+            "argmax_agreement": agree / len(samples)
+        })
+    except Exception as e:
+        report.update({"ok": False, "error": str(e)})
+    return report
+
+def tune(model_name, engine="tenseal", n_samples=20, min_agreement=1.0, degrees=DEGREES, scale_bits=SCALE_BITS):
+    """Evaluate all candidates, returns (reports, best report or None, data source)"""
+    model_loader, _, _ = MODELS[model_name]
+    spec = SPECS[model_name]
+    model = model_loader().eval()
+    compiled = spec.compile(model.state_dict())
+    spec.verify(compiled, model)
+    samples, source = load_samples(model_name, n_samples)
+    print(f"Tuning {model_name} ({engine}, compiled depth {compiled.depth}) on {len(samples)} {source} samples")
+    expected = compiled.forward(samples)
+
+    reports = []
+    for params in candidate_params(compiled.depth, degrees, scale_bits):
+        report = evaluate_candidate(compiled, params, engine, samples, expected)
+        reports.append(report)
+        if report["ok"]:
+            print(f"N={report['poly_modulus_degree']:>5} {report['coeff_mod_bit_sizes']}: "
+                  f"{report['latency_ms_mean']:.1f} ms, {report['ciphertext_bytes']} B, "
+                  f"agreement {report['argmax_agreement']:.1%}, max error {report['max_abs_error']:.2e}")
+        else:
+            print(f"N={report['poly_modulus_degree']:>5} {report['coeff_mod_bit_sizes']}: failed ({report['error']})")
+
+    passing = [r for r in reports if r["ok"] and r["argmax_agreement"] >= min_agreement]
+    best = min(passing, key=lambda r: r["latency_ms_mean"]) if passing else None
+    return reports, best, source
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the fastest CKKS parameters that preserve model predictions")
+    parser.add_argument("--model", choices=sorted(MODELS), default="digit")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="tenseal")
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="Required argmax agreement with plaintext (0-1)")
+    parser.add_argument("--degrees", type=int, nargs="+", default=list(DEGREES))
+    parser.add_argument("--scale-bits", type=int, nargs="+", default=list(SCALE_BITS))
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    reports, best, source = tune(args.model, args.engine, args.samples, args.min_agreement, args.degrees, args.scale_bits)
+
+    result = {"model": args.model, "engine": args.engine, "samples": args.samples, "data": source, "best": best, "candidates": reports}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Report written to {args.output}")
+
+    if best is None:
+        print("No parameter set met the agreement threshold.")
+        raise SystemExit(1)
+    print(f"Fastest passing config: poly_modulus_degree={best['poly_modulus_degree']}, "
+          f"coeff_mod_bit_sizes={best['coeff_mod_bit_sizes']}, global_scale=2**{best['scale_bits']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+# Privacy layer building blocks for the chat router
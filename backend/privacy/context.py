@@ -0,0 +1,158 @@
+"""
+Context analysis: is a LOC/ORG/GPE mention personal (redact) or general (keep)?
+
+is_personal_context only looks at dependency arcs, POS tags and lemmas around
+the entity, so the spaCy pipeline is loaded without NER (BERT finds the
+entities), and only the sentences that contain candidate entities are parsed.
+Sentences are found with the rule-based sentencizer on a blank pipeline,
+which is far cheaper than the parser. Several messages are parsed together
+with nlp.pipe (see ContextAnalyzer.decide_batch).
+
+test_context.py checks the trimmed, batched analysis against the full
+pipeline on a fixture set; `python -m privacy.context` times both on a long
+document.
+"""
+
+import bisect
+import os
+
+import spacy
+
+SPACY_MODEL = os.getenv("SPACY_MODEL", "en_core_web_sm")
+# Components is_personal_context does not need (tok2vec, tagger, parser,
+# attribute_ruler and lemmatizer stay)
+CONTEXT_EXCLUDE = ["ner"]
+CONTEXT_BATCH_SIZE = 32
+
+# Entity labels whose redaction depends on context (others are always redacted)
+CONTEXT_LABELS = {"GPE", "LOC", "ORG"}
+
+def load_context_nlp(model=SPACY_MODEL):
+    return spacy.load(model, exclude=CONTEXT_EXCLUDE)
+
+def is_personal_context(doc, ent):
+    """
+    Determine if an entity is likely strictly personal (needs redaction).
+    Strict Heuristic:
+    1. Direct Ownership: "My [Entity]"
+    2. Personal State Verbs: Subject "I" + Verb "live/am/born/etc"
+    
+    If it's just a general action verb ("visit", "go"), we default to PRESERVE.
+    """
+    
+    # 1. Check for Direct Ownership ("My name", "My city")
+    # Traverse left children of the entity's root
+    for child in ent.root.children:
+        if child.dep_ == "poss" and child.text.lower() in ["my", "our"]:
+            return True
+    
+    # Check if header of entity has ownership ("My name is Alice")
+    # Entity "Alice" -> Head "is" -> Subject "name" -> Child "My"
+    head = ent.root.head
+    if head.pos_ == "NOUN":
+        for child in head.children:
+             if child.dep_ == "poss" and child.text.lower() in ["my", "our"]:
+                 return True
+
+    # 2. Check Verb-Subject Relation
+    # Find the main verb
+    verb = head
+    while verb.pos_ != "VERB" and verb.pos_ != "AUX" and verb.head != verb:
+        verb = verb.head
+        
+    PERSONAL_STATE_VERBS = {"live", "am", "born", "work", "study", "moved", "stay", "reside", "from"}
+    
+    # Special Handle for "be" verbs (am, is, was) mapping to lemma "be"
+    # But checking raw text is safer for "am"
+    
+    if verb.pos_ in ["VERB", "AUX"]:
+        # Check if subject is 1st person
+        has_first_person_subject = False
+        for child in verb.children:
+            if child.dep_ in ["nsubj", "nsubjpass"] and child.text.lower() in ["i", "we", "me", "us"]:
+                has_first_person_subject = True
+                break
+        
+        # If subject is I/We, check if the verb is a "Personal State" verb
+        if has_first_person_subject:
+            # Check lemma or text
+            if verb.lemma_.lower() in ["be", "live", "work", "study", "stay", "reside", "born", "move"]:
+                 return True
+            # Also check if it's "am" specifically
+            if verb.text.lower() == "am":
+                return True
+                
+    return False
+
+class ContextAnalyzer:
+    """
+    Personal-context decisions for candidate entity spans.
+    Spans are (start, end) character offsets; results map each span to a bool.
+    """
+    def __init__(self, nlp, batch_size=CONTEXT_BATCH_SIZE):
+        self.nlp = nlp
+        self.batch_size = batch_size
+        self.splitter = spacy.blank(nlp.lang)
+        self.splitter.add_pipe("sentencizer")
+
+    def segments(self, text, spans):
+        """Merged (start, end) character ranges of the sentences that contain `spans`"""
+        sentences = [(sent.start_char, sent.end_char) for sent in self.splitter(text).sents] or [(0, len(text))]
+        ends = [end for _, end in sentences]
+        ranges = []
+        for start, end in sorted(spans):
+            first = sentences[min(bisect.bisect_right(ends, start), len(sentences) - 1)]
+            last = sentences[min(bisect.bisect_left(ends, end), len(sentences) - 1)]
+            seg_start, seg_end = min(first[0], start), max(last[1], end)
+            if ranges and seg_start <= ranges[-1][1]:
+                ranges[-1] = (ranges[-1][0], max(ranges[-1][1], seg_end))
+            else:
+                ranges.append((seg_start, seg_end))
+        return ranges
+
+    def decide_batch(self, items):
+        """`items` is a list of (text, spans); returns one {span: is_personal} dict per item"""
+        results = [{} for _ in items]
+        jobs = []
+        for index, (text, spans) in enumerate(items):
+            for seg_start, seg_end in self.segments(text, spans):
+                seg_spans = [span for span in spans if seg_start <= span[0] and span[1] <= seg_end]
+                jobs.append((index, seg_start, text[seg_start:seg_end], seg_spans))
+
+        docs = self.nlp.pipe((segment for _, _, segment, _ in jobs), batch_size=self.batch_size)
+        for (index, offset, _, seg_spans), doc in zip(jobs, docs):
+            for start, end in seg_spans:
+                results[index][(start, end)] = personal_span(doc, start - offset, end - offset)
+        return results
+
+    def decide(self, text, spans):
+        if not spans:
+            return {}
+        return self.decide_batch([(text, spans)])[0]
+
+def personal_span(doc, start, end):
+    """is_personal_context for a character range of `doc` (False if it cannot be aligned)"""
+    # BERT 'start'/'end' are character indices; fall back to token-expanded alignment
+    span = doc.char_span(start, end) or doc.char_span(start, end, alignment_mode="expand")
+    if not span:
+        return False
+    return is_personal_context(doc, span)
+
+if __name__ == "__main__":
+    import time
+
+    full_nlp = spacy.load(SPACY_MODEL)
+    analyzer = ContextAnalyzer(load_context_nlp())
+    print(f"Trimmed pipeline: {analyzer.nlp.pipe_names} (full: {full_nlp.pipe_names})")
+
+    filler = "The quarterly report covers revenue, costs and the outlook for next year in detail. " * 200
+    document = filler + "I live in Seattle and work at Contoso. " + filler
+    spans = [(document.index("Seattle"), document.index("Seattle") + 7)]
+    start = time.perf_counter()
+    full_nlp(document)
+    full_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    analyzer.decide(document, spans)
+    trimmed_seconds = time.perf_counter() - start
+    print(f"Long document ({len(document)} chars): full parse {full_seconds * 1000:.1f} ms, "
+          f"trimmed context analysis {trimmed_seconds * 1000:.1f} ms")
@@ -0,0 +1,126 @@
+"""
+BERT NER backends for the chat privacy layer
+
+NER_BACKEND selects how dslim/bert-base-NER is run:
+
+- "fp32" (default): the transformers token-classification pipeline
+- "int8": every nn.Linear dynamically quantized to int8, traced to a frozen
+  TorchScript graph (torch.jit.optimize_for_inference) and cached on disk.
+  Once the graph is cached, the FP32 weights are never loaded.
+
+Both backends go through TokenClassificationPipeline (tokenization, "simple"
+aggregation), so results keep the entity_group / word / start / end contract
+the redaction code consumes. `python -m benchmarks.ner_parity` compares them
+(latency, RSS, span F1) and test_ner.py checks their parity.
+"""
+
+import os
+
+import torch
+import torch.nn as nn
+
+from fhe.context_cache import is_cached, mark_cached, params_hash
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NER_MODEL = os.getenv("NER_MODEL", "dslim/bert-base-NER")
+NER_BACKEND = os.getenv("NER_BACKEND", "fp32").lower()
+NER_GRAPH_PATH = os.getenv("NER_GRAPH_PATH", os.path.join(BACKEND_DIR, "ner_int8.pt"))
+
+# Traced once with this input. test_ner.py checks that the graph gives the same
+# logits as the eager model for other lengths, batch sizes and padded batches.
+_TRACE_TEXT = "My name is Alice Johnson, I live in Seattle and work at Contoso Ltd."
+
+class _TraceableTokenClassifier(nn.Module):
+    """Positional-argument forward returning logits, as torch.jit.trace needs"""
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask, token_type_ids):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                          token_type_ids=token_type_ids, return_dict=False)[0]
+
+class GraphTokenClassifier(nn.Module):
+    """Exported TorchScript graph exposed the way TokenClassificationPipeline calls a model"""
+    def __init__(self, graph, config):
+        super().__init__()
+        self.graph = graph
+        self.config = config
+
+    @property
+    def device(self):
+        return torch.device("cpu")
+
+    @property
+    def dtype(self):
+        return torch.float32
+
+    def forward(self, input_ids, attention_mask=None, token_type_ids=None, **kwargs):
+        from transformers.modeling_outputs import TokenClassifierOutput
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        if token_type_ids is None:
+            token_type_ids = torch.zeros_like(input_ids)
+        return TokenClassifierOutput(logits=self.graph(input_ids, attention_mask, token_type_ids))
+
+def load_fp32_pipeline(model_name=NER_MODEL):
+    from transformers import pipeline
+    return pipeline("ner", model=model_name, aggregation_strategy="simple")
+
+def quantize_model(model):
+    """Dynamic int8 quantization of every nn.Linear"""
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {nn.Linear}, dtype=torch.qint8)
+
+def trace_graph(model, example):
+    """Trace and freeze a token classifier on (input_ids, attention_mask, token_type_ids)"""
+    with torch.no_grad():
+        graph = torch.jit.trace(_TraceableTokenClassifier(model).eval(), example, strict=False)
+        return torch.jit.optimize_for_inference(graph)
+
+def export_int8_graph(model_name, tokenizer, path):
+    """Quantize (dynamic int8), trace, freeze and save the model graph"""
+    from transformers import AutoModelForTokenClassification
+
+    model = AutoModelForTokenClassification.from_pretrained(model_name)
+    example = tokenizer([_TRACE_TEXT], return_tensors="pt", return_token_type_ids=True)
+    graph = trace_graph(quantize_model(model),
+                        (example["input_ids"], example["attention_mask"], example["token_type_ids"]))
+    torch.jit.save(graph, path)
+    return graph
+
+def load_int8_pipeline(model_name=NER_MODEL, graph_path=NER_GRAPH_PATH):
+    """Token-classification pipeline on the cached int8 graph (exported on first use)"""
+    import transformers
+    from transformers import AutoConfig, AutoTokenizer, TokenClassificationPipeline
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    config = AutoConfig.from_pretrained(model_name)
+    expected_hash = params_hash(model=model_name, backend="int8-torchscript",
+                                torch=torch.__version__, transformers=transformers.__version__)
+
+    graph = None
+    if is_cached(graph_path, expected_hash):
+        try:
+            graph = torch.jit.load(graph_path)
+        except Exception as e:
+            print(f"Warning: could not load NER graph {graph_path} ({e}), re-exporting.")
+    if graph is None:
+        print(f"Exporting int8 NER graph to {graph_path}...")
+        graph = export_int8_graph(model_name, tokenizer, graph_path)
+        mark_cached(graph_path, expected_hash)
+
+    return TokenClassificationPipeline(
+        model=GraphTokenClassifier(graph, config),
+        tokenizer=tokenizer,
+        aggregation_strategy="simple",
+        device=torch.device("cpu")
+    )
+
+BACKENDS = {"fp32": load_fp32_pipeline, "int8": load_int8_pipeline}
+
+def load_ner_pipeline(backend=NER_BACKEND, model_name=NER_MODEL):
+    """NER callable: text or list of texts -> aggregated entities"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown NER_BACKEND {backend!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](model_name)
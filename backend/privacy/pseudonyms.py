@@ -0,0 +1,162 @@
+"""
+Deterministic keyed pseudonyms
+
+Fake values come from precomputed per-label tables (pseudonym_tables.json:
+first names, cities, companies, emails on reserved example.* domains and
+fictional 555-01xx phone numbers). The table entry is selected with
+HMAC-SHA256(key, label, original), so the same entity gets the same pseudonym
+in every request and every worker without any shared state, and nobody
+without the key can map a pseudonym back to its original.
+
+The key is PSEUDONYM_KEY (hex) or, if unset, a random key created once in
+backend/pseudonym.key and reused by every worker and restart.
+
+A candidate is rejected (and the next one derived) if it occurs in the text
+being redacted, equals the original, or is already used for another entity;
+any of those would make restoration ambiguous.
+
+Rebuild the tables from Faker (fixed seed) with:
+    python -m privacy.pseudonyms --rebuild
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+PRIVACY_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(PRIVACY_DIR)
+
+TABLES_PATH = os.path.join(PRIVACY_DIR, "pseudonym_tables.json")
+PSEUDONYM_KEY_PATH = os.getenv("PSEUDONYM_KEY_PATH", os.path.join(BACKEND_DIR, "pseudonym.key"))
+
+# Entity label -> table
+LABEL_TABLES = {
+    "PERSON": "names",
+    "GPE": "cities",
+    "LOC": "cities",
+    "ORG": "companies",
+    "EMAIL": "emails",
+    "PHONE": "phones",
+}
+
+MAX_ATTEMPTS = 16
+
+def _read_key(path, attempts=50, delay_seconds=0.02):
+    """Key from `path`, waiting briefly for a file that is still shorter than a full key"""
+    for _ in range(attempts):
+        with open(path, "rb") as f:
+            key = f.read()
+        if len(key) == 32:
+            return key
+        time.sleep(delay_seconds)
+    raise ValueError(f"Pseudonym key file {path} is corrupt, delete it or set PSEUDONYM_KEY")
+
+def load_or_create_key(path=PSEUDONYM_KEY_PATH):
+    """
+    PSEUDONYM_KEY, or the key file. The first process writes a new key to a
+    temp file (0600) and publishes it with os.link, which fails if another
+    worker got there first; the file at `path` is therefore always complete.
+    """
+    env_key = os.getenv("PSEUDONYM_KEY")
+    if env_key:
+        return bytes.fromhex(env_key)
+    if os.path.exists(path):
+        return _read_key(path)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(os.urandom(32))
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(tmp, path)
+    except FileExistsError:
+        pass # Another worker published its key first, use that one
+    finally:
+        os.remove(tmp)
+    return _read_key(path)
+
+def load_tables(path=TABLES_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+class Pseudonymizer:
+    """Keyed table lookup: (label, original) -> fake value"""
+    def __init__(self, key, tables):
+        self.key = key
+        self.tables = tables
+
+    def _digest(self, label, original, attempt):
+        message = f"{label}\x00{original}\x00{attempt}".encode()
+        return hmac.new(self.key, message, hashlib.sha256).digest()
+
+    def candidates(self, label, original):
+        """Deterministic sequence of fake values for one entity"""
+        table = self.tables.get(LABEL_TABLES.get(label))
+        for attempt in range(MAX_ATTEMPTS):
+            digest = self._digest(label, original, attempt)
+            if table:
+                yield table[int.from_bytes(digest[:8], "big") % len(table)]
+            elif attempt == 0:
+                yield f"[{label}]"
+            else:
+                yield f"[{label} {digest[:3].hex()}]"
+        # Unique placeholder once the table candidates are exhausted
+        yield f"[{label} {self._digest(label, original, MAX_ATTEMPTS).hex()[:12]}]"
+
+    def pseudonym(self, label, original, text="", used=()):
+        """
+        Fake value for `original` that does not occur in `text` (the input being
+        redacted), differs from the original and is not in `used`.
+        """
+        for fake_val in self.candidates(label, original):
+            if fake_val != original and fake_val not in used and fake_val not in text:
+                return fake_val
+        return fake_val
+
+def rebuild_tables(path=TABLES_PATH, size=512, seed=0):
+    """Regenerate the tables from Faker with a fixed seed"""
+    import random
+    from faker import Faker
+
+    fake = Faker("en_US")
+    fake.seed_instance(seed)
+
+    def unique(generate):
+        values = []
+        seen = set()
+        while len(values) < size:
+            value = generate()
+            if value not in seen:
+                seen.add(value)
+                values.append(value)
+        return values
+
+    rng = random.Random(seed)
+    tables = {
+        "names": unique(fake.first_name),
+        "cities": unique(fake.city),
+        "companies": unique(fake.company),
+        "emails": unique(fake.safe_email),
+        # 555-0100..0199 is reserved for fictional use
+        "phones": unique(lambda: f"{rng.randint(201, 989)}-555-01{rng.randint(0, 99):02d}"),
+    }
+    with open(path, "w") as f:
+        json.dump(tables, f, indent=0)
+    return tables
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Pseudonym tables")
+    parser.add_argument("--rebuild", action="store_true", help="Regenerate pseudonym_tables.json from Faker")
+    parser.add_argument("--size", type=int, default=512)
+    args = parser.parse_args()
+    if args.rebuild:
+        tables = rebuild_tables(size=args.size)
+        print(f"Wrote {TABLES_PATH} ({', '.join(f'{len(v)} {k}' for k, v in tables.items())})")
+    else:
+        tables = load_tables()
+        print({name: len(values) for name, values in tables.items()})
@@ -0,0 +1,162 @@
+"""
+Linear-time redaction and restoration
+
+- find_pattern_entities: email / phone spans from regexes compiled at import
+- apply_replacements: builds the redacted text in one pass over sorted spans
+  instead of re-slicing the whole string once per entity
+- Restorer: replaces every fake value in an LLM response in one scan, with a
+  single regex compiled from a trie of the fake values (Aho-Corasick style:
+  at each position only the trie branch matching the next characters is
+  followed, and the longest value wins)
+- StreamRestorer: the same for a response that arrives in chunks, holding
+  back only the tail that could still be the start of a fake value
+
+`python -m privacy.redaction` (and test_redaction.py) checks streamed
+restoration against the one-shot result for every split point and several
+chunk sizes.
+"""
+
+import re
+
+EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+PHONE_RE = re.compile(r'\b(?:\+?(\d{1,3}))?[-. (]*(\d{3})[-. )]*(\d{3})[-. ]*(\d{4})\b')
+
+PATTERNS = [("EMAIL", EMAIL_RE), ("PHONE", PHONE_RE)]
+
+def find_pattern_entities(text):
+    """Regex for Pattern-based PII (Email, Phone) - BERT doesn't catch these well"""
+    return [
+        {"entity_group": label, "word": match.group(), "start": match.start(), "end": match.end()}
+        for label, pattern in PATTERNS
+        for match in pattern.finditer(text)
+    ]
+
+def apply_replacements(text, replacements):
+    """
+    `replacements` is a list of (start, end, value). Spans are applied left to
+    right; a span overlapping an earlier (or, at the same start, longer) one is
+    dropped, so the output is always well formed.
+    """
+    parts = []
+    position = 0
+    for start, end, value in sorted(replacements, key=lambda r: (r[0], -r[1])):
+        if start < position:
+            continue
+        parts.append(text[position:start])
+        parts.append(value)
+        position = end
+    parts.append(text[position:])
+    return "".join(parts)
+
+def _trie_regex(node):
+    """Regex source for a trie node; optional tails are greedy so longer keys win"""
+    terminal = "" in node
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if len(branches) == 1 and not terminal:
+        return branches[0]
+    body = "(?:" + "|".join(branches) + ")"
+    return body + "?" if terminal else body
+
+def compile_alternation(keys):
+    """One compiled pattern matching any of `keys`, leftmost-longest (None if empty)"""
+    trie = {}
+    for key in keys:
+        if not key:
+            continue
+        node = trie
+        for char in key:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    if not trie:
+        return None
+    return re.compile(_trie_regex(trie))
+
+class Restorer:
+    """Maps every fake value back to its original in a single pass over the text"""
+    def __init__(self, pii_map):
+        self.pii_map = dict(pii_map)
+        self.pattern = compile_alternation(self.pii_map)
+
+    def _original(self, match):
+        return self.pii_map[match.group()]
+
+    def restore(self, text):
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._original, text)
+
+class StreamRestorer(Restorer):
+    """
+    Incremental restoration: feed() returns the restored text that is final so
+    far, flush() the rest once the stream ends. A fake value split across
+    chunks is buffered until it is complete (or can no longer match).
+    """
+    def __init__(self, pii_map):
+        super().__init__(pii_map)
+        # Every proper prefix of a fake value; a buffer ending in one of these may still grow into a match
+        self.prefixes = {key[:i] for key in self.pii_map for i in range(1, len(key))}
+        self.max_prefix = max((len(p) for p in self.prefixes), default=0)
+        self.buffer = ""
+
+    def _pending_start(self, position):
+        """Earliest index >= position from which the buffer is a proper prefix of a fake value"""
+        for start in range(max(position, len(self.buffer) - self.max_prefix), len(self.buffer)):
+            if self.buffer[start:] in self.prefixes:
+                return start
+        return None
+
+    def feed(self, chunk):
+        """
+        Restores every match that more text can no longer change, and holds
+        back from the first position where a fake value may still be starting.
+        The holdback is searched only after the last final match, never inside
+        it (with "ab" and "bcd", the "b" of a complete "ab" is not held back).
+        """
+        self.buffer += chunk
+        parts = []
+        position = 0
+        while True:
+            pending = self._pending_start(position)
+            match = self.pattern.search(self.buffer, position) if self.pattern else None
+            if match is None or (pending is not None and match.start() >= pending):
+                break
+            # Starts before any pending prefix, so no longer fake value can match here
+            parts.append(self.buffer[position:match.start()])
+            parts.append(self.pii_map[match.group()])
+            position = match.end()
+        safe = len(self.buffer) if pending is None else pending
+        parts.append(self.buffer[position:safe])
+        self.buffer = self.buffer[safe:]
+        return "".join(parts)
+
+    def flush(self):
+        rest, self.buffer = self.buffer, ""
+        return self.restore(rest)
+
+# (pii_map, LLM response) pairs checked by `python -m privacy.redaction` and test_redaction.py
+SELF_CHECK_CASES = [
+    (
+        {"Jo": "Ann", "Johnny Walker": "David Smith", "Springfield": "Seattle", "jo@fake.net": "ann@example.com"},
+        "Hi Johnny Walker! Jo from Springfield wrote to jo@fake.net about Johnny. Jo",
+    ),
+    # One fake value's suffix is another's prefix
+    ({"ab": "X", "bcd": "Y"}, "abcd ab bcd abc xbcd"),
+    ({"Ann Lee": "Mia", "Lee Park": "Bo", "Park": "Zed"}, "Ann Lee Park, Lee Park and Ann Lee Par"),
+]
+
+def chunkings(text, sizes=(1, 2, 3, 7)):
+    """One first chunk ending at every possible boundary, then fixed-size chunks"""
+    for split in range(len(text) + 1):
+        for size in sizes:
+            yield [text[:split]] + [text[i:i + size] for i in range(split, len(text), size)]
+
+if __name__ == "__main__":
+    for pii_map, response in SELF_CHECK_CASES:
+        expected = Restorer(pii_map).restore(response)
+        for chunks in chunkings(response):
+            streamer = StreamRestorer(pii_map)
+            streamed = "".join(streamer.feed(chunk) for chunk in chunks) + streamer.flush()
+            assert streamed == expected, (chunks, streamed)
+        print(f"Streamed restoration matches: {expected!r}")
@@ -0,0 +1,109 @@
+"""
+Multi-turn chat sessions
+
+A session keeps, per conversation ID:
+- the pseudonym map (original -> fake and fake -> original), so an entity keeps
+  the same fake value for the whole conversation
+- the redacted turns (user messages after redaction, raw LLM replies), so the
+  LLM sees the conversation history without any earlier message being
+  re-analyzed: NER and spaCy only run on the new message
+
+Sessions hold PII, so the store is bounded (CHAT_SESSION_MAX, least recently
+used evicted first), expires idle sessions after CHAT_SESSION_TTL_SECONDS and
+keeps at most CHAT_SESSION_MAX_TURNS turns of history per session.
+"""
+
+import asyncio
+import os
+import secrets
+import time
+from collections import OrderedDict
+
+from privacy.redaction import Restorer
+
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", 1000))
+CHAT_SESSION_TTL_SECONDS = float(os.getenv("CHAT_SESSION_TTL_SECONDS", 1800))
+CHAT_SESSION_MAX_TURNS = int(os.getenv("CHAT_SESSION_MAX_TURNS", 50))
+
+class ChatSession:
+    def __init__(self, conversation_id, max_turns=CHAT_SESSION_MAX_TURNS):
+        self.conversation_id = conversation_id
+        self.max_turns = max_turns
+        self.session_map = {}  # original -> fake
+        self.pii_map = {}      # fake -> original
+        self.turns = []        # {"redacted", "entities", "llm_response_raw"}, never the original message
+        self.turn_count = 0
+        self.last_used = time.monotonic()
+        # Turns of one conversation run one at a time
+        self.lock = asyncio.Lock()
+        self._restorer = None
+
+    def history(self):
+        """Earlier turns as (role, redacted text) pairs for the LLM"""
+        pairs = []
+        for turn in self.turns:
+            pairs.append(("user", turn["redacted"]))
+            if turn["llm_response_raw"] is not None:
+                pairs.append(("model", turn["llm_response_raw"]))
+        return pairs
+
+    def add_pseudonyms(self, pii_map):
+        if any(self.pii_map.get(fake_val) != original for fake_val, original in pii_map.items()):
+            self.pii_map.update(pii_map)
+            self.session_map.update({original: fake_val for fake_val, original in pii_map.items()})
+            self._restorer = None
+
+    def add_turn(self, redacted, entities, llm_response_raw):
+        self.turns.append({
+            "redacted": redacted,
+            "entities": entities,
+            "llm_response_raw": llm_response_raw
+        })
+        self.turn_count += 1
+        del self.turns[:-self.max_turns]
+
+    def restorer(self):
+        """Restorer over every pseudonym of the conversation, recompiled only when new ones appear"""
+        if self._restorer is None:
+            self._restorer = Restorer(self.pii_map)
+        return self._restorer
+
+class SessionStore:
+    """Bounded, TTL-evicted map of conversation ID -> ChatSession"""
+    def __init__(self, max_sessions=CHAT_SESSION_MAX, ttl_seconds=CHAT_SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_expired(self, now):
+        # Least recently used first, so stop at the first live session
+        while self._sessions:
+            conversation_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl_seconds:
+                break
+            del self._sessions[conversation_id]
+
+    def create(self):
+        now = time.monotonic()
+        self._evict_expired(now)
+        while len(self._sessions) >= self.max_sessions:
+            self._sessions.popitem(last=False)
+        session = ChatSession(secrets.token_urlsafe(16))
+        self._sessions[session.conversation_id] = session
+        return session
+
+    def get(self, conversation_id):
+        """The live session, or None if it does not exist or has expired"""
+        now = time.monotonic()
+        self._evict_expired(now)
+        session = self._sessions.get(conversation_id)
+        if session is not None:
+            session.last_used = now
+            self._sessions.move_to_end(conversation_id)
+        return session
+
+    def delete(self, conversation_id):
+        return self._sessions.pop(conversation_id, None) is not None
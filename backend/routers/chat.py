@@ -1,261 +1,456 @@
 
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import spacy
-import google.generativeai as genai
+from typing import Optional
 import os
+import json
+import time
 import traceback
-from faker import Faker
-from transformers import pipeline
-import re
+
+from privacy.context import CONTEXT_LABELS, ContextAnalyzer, load_context_nlp
+from privacy.ner import NER_BACKEND, load_ner_pipeline
+from privacy.pseudonyms import Pseudonymizer, load_or_create_key, load_tables
+from privacy.redaction import Restorer, StreamRestorer, apply_replacements, find_pattern_entities
+from privacy.sessions import SessionStore
+from serving.batching import MicroBatcher
+from serving.llm import LLM_PROVIDER, LLMClient, create_provider
+from serving.response_cache import create_response_cache
+from serving.metrics import time_stage, errors_total, stage_seconds
 
 router = APIRouter()
-fake = Faker()
 
-# Initialize Spacy (for syntactic parsing/context only)
+# Initialize Spacy (for syntactic parsing/context only; NER disabled, see privacy/context.py)
 try:
-    nlp = spacy.load("en_core_web_sm")
+    nlp = load_context_nlp()
+    context_analyzer = ContextAnalyzer(nlp)
 except:
     print("Warning: Spacy model not found. Context analysis will be limited.")
     nlp = None
+    context_analyzer = None
 
-# Initialize BERT NER
+# Initialize BERT NER (NER_BACKEND=int8 for the quantized graph, see privacy/ner.py)
 try:
-    print("Loading BERT NER model...")
-    ner_pipeline = pipeline("ner", model="dslim/bert-base-NER", aggregation_strategy="simple")
+    print(f"Loading BERT NER model ({NER_BACKEND})...")
+    ner_pipeline = load_ner_pipeline()
     print("BERT NER model loaded.")
 except Exception as e:
     print(f"Error loading BERT model: {e}")
     ner_pipeline = None
 
-# Initialize Gemini
-def get_gemini_model():
-    api_key = os.getenv("GOOGLE_GENERATIVE_AI_API_KEY")
-    if not api_key:
-        return None
+# NER micro-batching: messages arriving within NER_BATCH_WAIT_MS are run through
+# BERT as one padded batch of up to NER_MAX_BATCH (0 ms disables coalescing)
+NER_BATCH_WAIT_MS = float(os.getenv("NER_BATCH_WAIT_MS", "5"))
+NER_MAX_BATCH = int(os.getenv("NER_MAX_BATCH", 16))
+ner_batcher = None
+
+def run_ner_batch(texts):
+    """One token-classification forward pass for several messages, returns entities per message"""
+    with time_stage("chat", "ner_batch"):
+        return ner_pipeline(list(texts), batch_size=len(texts))
+
+async def ner_batch(texts):
+    return await run_in_threadpool(run_ner_batch, texts)
+
+async def extract_entities(text):
+    """Aggregated BERT entities for one message, computed off the event loop"""
+    if ner_pipeline is None:
+        return []
+    if ner_batcher is not None:
+        return await ner_batcher.submit(text)
+    return await run_in_threadpool(ner_pipeline, text)
+
+def setup_ner_batching():
+    """Start the NER request coalescer (call from the running event loop)"""
+    global ner_batcher
+    if ner_pipeline is not None and NER_BATCH_WAIT_MS > 0:
+        ner_batcher = MicroBatcher(ner_batch, max_batch_size=NER_MAX_BATCH, max_wait_ms=NER_BATCH_WAIT_MS)
+        ner_batcher.start()
+        print(f"NER micro-batching enabled (up to {NER_MAX_BATCH} messages / {NER_BATCH_WAIT_MS} ms).")
+
+async def shutdown_ner_batching():
+    global ner_batcher
+    if ner_batcher is not None:
+        await ner_batcher.stop()
+        ner_batcher = None
+
+# Context analysis is batched like NER: concurrent messages are parsed together with nlp.pipe
+context_batcher = None
+
+def context_spans(entities):
+    """(start, end) of the mentions whose redaction depends on context"""
+    return sorted({(ent["start"], ent["end"]) for ent in entities
+                   if LABEL_MAP.get(ent["entity_group"], ent["entity_group"]) in CONTEXT_LABELS})
+
+def run_context_batch(items):
+    with time_stage("chat", "context_batch"):
+        return context_analyzer.decide_batch(list(items))
+
+async def context_batch(items):
+    return await run_in_threadpool(run_context_batch, items)
+
+async def analyze_context(text, spans):
+    """{(start, end): is_personal} for the candidate spans of one message"""
+    if context_analyzer is None or not spans:
+        return {}
+    if context_batcher is not None:
+        return await context_batcher.submit((text, spans))
+    return await run_in_threadpool(context_analyzer.decide, text, spans)
+
+def setup_context_batching():
+    """Start the context-analysis coalescer (call from the running event loop)"""
+    global context_batcher
+    if context_analyzer is not None and NER_BATCH_WAIT_MS > 0:
+        context_batcher = MicroBatcher(context_batch, max_batch_size=NER_MAX_BATCH, max_wait_ms=NER_BATCH_WAIT_MS)
+        context_batcher.start()
+
+async def shutdown_context_batching():
+    global context_batcher
+    if context_batcher is not None:
+        await context_batcher.stop()
+        context_batcher = None
+
+# Deterministic keyed pseudonyms (same entity -> same fake value in every worker, see privacy/pseudonyms.py)
+pseudonymizer = Pseudonymizer(load_or_create_key(), load_tables())
+
+# Multi-turn conversations (pseudonym maps and redacted history, see privacy/sessions.py)
+session_store = SessionStore()
+
+# Optional cache of raw LLM responses keyed on the redacted prompt (CHAT_CACHE, see serving/response_cache.py)
+response_cache = create_response_cache()
+
+# LLM client: created once at startup, shared by every request (see serving/llm.py)
+llm_client = None
+
+def setup_llm_client():
+    global llm_client
     try:
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel('gemini-2.5-flash')
+        provider = create_provider()
     except Exception as e:
-        print(f"Chat Router Error configuring Gemini: {e}")
-        return None
+        print(f"Chat Router Error configuring LLM provider: {e}")
+        return
+    if provider is None:
+        print("Warning: GOOGLE_GENERATIVE_AI_API_KEY not set. /chat/secure is disabled.")
+        return
+    llm_client = LLMClient(provider)
+    print(f"LLM client ready ({provider.name}, up to {llm_client.max_concurrency} concurrent requests).")
+
+async def shutdown_llm_client():
+    global llm_client
+    if llm_client is not None:
+        await llm_client.close()
+        llm_client = None
 
 class ChatInput(BaseModel):
     message: str
+    # From POST /chat/sessions; earlier turns and their pseudonyms are kept server-side
+    conversation_id: Optional[str] = None
 
-def get_fake_pii(label):
-    """Generate realistic fake data based on entity label"""
-    if label == "PERSON":
-        return fake.first_name()
-    elif label == "GPE" or label == "LOC":
-        return fake.city()
-    elif label == "ORG":
-        return fake.company()
-    elif label == "EMAIL":
-        return fake.email()
-    elif label == "PHONE":
-        return fake.phone_number()
-    return f"[{label}]"
-
-def is_personal_context(doc, ent):
+# Map BERT labels to our standard labels
+LABEL_MAP = {
+    "PER": "PERSON",
+    "ORG": "ORG",
+    "LOC": "LOC",
+    "MISC": "MISC",
+    "EMAIL": "EMAIL",
+    "PHONE": "PHONE"
+}
+
+REDACTED_LABELS = ["PERSON", "GPE", "LOC", "ORG", "PHONE", "EMAIL", "MISC"]
+
+def redact_entities(original_text, all_detected_entities, personal=None, session_map=None):
     """
-    Determine if an entity is likely strictly personal (needs redaction).
-    Strict Heuristic:
-    1. Direct Ownership: "My [Entity]"
-    2. Personal State Verbs: Subject "I" + Verb "live/am/born/etc"
-    
-    If it's just a general action verb ("visit", "go"), we default to PRESERVE.
+    Replace personal entities with consistent fake values.
+    `personal` maps the (start, end) of LOC/ORG mentions to the context
+    analysis decision (True = personal, redact); anything else is preserved.
+    `session_map` (original -> fake) holds the pseudonyms of earlier turns of a
+    conversation; they are reused and new fake values never collide with them.
+    Returns (redacted_text, pii_map, preserved_items).
     """
+    # Redaction Logic
+    pii_map = {}
     
-    # 1. Check for Direct Ownership ("My name", "My city")
-    # Traverse left children of the entity's root
-    for child in ent.root.children:
-        if child.dep_ == "poss" and child.text.lower() in ["my", "our"]:
-            return True
-    
-    # Check if header of entity has ownership ("My name is Alice")
-    # Entity "Alice" -> Head "is" -> Subject "name" -> Child "My"
-    head = ent.root.head
-    if head.pos_ == "NOUN":
-        for child in head.children:
-             if child.dep_ == "poss" and child.text.lower() in ["my", "our"]:
-                 return True
-
-    # 2. Check Verb-Subject Relation
-    # Find the main verb
-    verb = head
-    while verb.pos_ != "VERB" and verb.pos_ != "AUX" and verb.head != verb:
-        verb = verb.head
-        
-    PERSONAL_STATE_VERBS = {"live", "am", "born", "work", "study", "moved", "stay", "reside", "from"}
-    
-    # Special Handle for "be" verbs (am, is, was) mapping to lemma "be"
-    # But checking raw text is safer for "am"
+    replacements = []
+    preserved_items = {} # Map of text -> label
+    global_preserved_texts = set()
+
+    # Phase 1: Identify Global Erasure Exceptions (Preservation)
+    for ent in all_detected_entities:
+         label = LABEL_MAP.get(ent["entity_group"], ent["entity_group"])
+         text = ent["word"]
+         
+         if label in CONTEXT_LABELS:
+             # Context Check (spaCy dependency heuristic, computed by analyze_context)
+             is_personal = (personal or {}).get((ent["start"], ent["end"]), False)
+             
+             if not is_personal:
+                 global_preserved_texts.add(text)
+
+    # Maintain consistency for the same entity text in this session
+    session_map = dict(session_map or {})
+    used_fakes = set(session_map.values())
     
-    if verb.pos_ in ["VERB", "AUX"]:
-        # Check if subject is 1st person
-        has_first_person_subject = False
-        for child in verb.children:
-            if child.dep_ in ["nsubj", "nsubjpass"] and child.text.lower() in ["i", "we", "me", "us"]:
-                has_first_person_subject = True
-                break
-        
-        # If subject is I/We, check if the verb is a "Personal State" verb
-        if has_first_person_subject:
-            # Check lemma or text
-            if verb.lemma_.lower() in ["be", "live", "work", "study", "stay", "reside", "born", "move"]:
-                 return True
-            # Also check if it's "am" specifically
-            if verb.text.lower() == "am":
-                return True
-                
-    return False
+    # Process all entities for redaction
+    for ent in all_detected_entities:
+        label = LABEL_MAP.get(ent["entity_group"], ent["entity_group"])
+        text = ent["word"]
+        start = ent["start"]
+        end = ent["end"]
 
-@router.post("/chat/secure")
-async def secure_chat(payload: ChatInput):
+        # Filter relevant labels
+        if label in REDACTED_LABELS:
+            
+            # Check Global Preservation
+            if text in global_preserved_texts:
+                preserved_items[text] = label
+                continue
+            
+            # Proceed to Redact
+            if text in session_map:
+                fake_val = session_map[text]
+            else:
+                # Never a value that occurs in the input or is used by another entity,
+                # otherwise restoration could not tell them apart
+                fake_val = pseudonymizer.pseudonym(label, text, original_text, used_fakes)
+                session_map[text] = fake_val
+                used_fakes.add(fake_val)
+            
+            pii_map[fake_val] = text
+            replacements.append((start, end, fake_val))
+            
+    # Build the redacted text in one pass over the sorted spans
+    redacted_text = apply_replacements(original_text, replacements)
+
+    return redacted_text, pii_map, preserved_items
+
+def restore_response(llm_response, pii_map):
+    """Detokenization: put the original values back into the LLM response (single pass)"""
+    return Restorer(pii_map).restore(llm_response)
+
+def check_privacy_layer():
+    """Fail fast (HTTP 500) when the privacy layer or the LLM client is not usable"""
     if not nlp:
         raise HTTPException(status_code=500, detail="Privacy layer not initialized (Spacy missing)")
-    
-    model = get_gemini_model()
-    if not model:
-        if not os.getenv("GOOGLE_GENERATIVE_AI_API_KEY"):
+
+    if llm_client is None:
+        if LLM_PROVIDER == "gemini" and not os.getenv("GOOGLE_GENERATIVE_AI_API_KEY"):
              raise HTTPException(status_code=500, detail="LLM connection failed. API Key not found in environment.")
-        raise HTTPException(status_code=500, detail="LLM connection failed (Gemini Config Error)")
+        raise HTTPException(status_code=500, detail="LLM connection failed (LLM client not configured)")
 
-    original_text = payload.message
+async def prepare_prompt(original_text, session_map=None):
+    """
+    NER + regex + context analysis + redaction of one message.
+    Returns (redacted_text, pii_map, preserved_items, entities).
+    """
+    # 1. BERT NER Extraction
+    with time_stage("chat", "ner"):
+        bert_entities = await extract_entities(original_text)
+
+    # 2. Regex for Pattern-based PII (Email, Phone) - BERT doesn't catch these well
+    with time_stage("chat", "regex"):
+        regex_entities = find_pattern_entities(original_text)
+
+    # Combine entities
+    all_detected_entities = bert_entities + regex_entities
+
+    # Context Analysis (Dependencies) on the sentences around LOC/ORG mentions only
+    with time_stage("chat", "spacy_parse"):
+        personal = await analyze_context(original_text, context_spans(all_detected_entities))
+
+    with time_stage("chat", "redaction"):
+        redacted_text, pii_map, preserved_items = redact_entities(original_text, all_detected_entities, personal, session_map)
+    return redacted_text, pii_map, preserved_items, all_detected_entities
+
+def get_session(conversation_id):
+    """Session for a request, None without conversation_id, HTTP 404 if unknown or expired"""
+    if conversation_id is None:
+        return None
+    session = session_store.get(conversation_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation_id")
+    return session
+
+def start_turn(session, pii_map):
+    """Record the turn's pseudonyms; returns (LLM history, pii_map to restore the reply with)"""
+    if session is None:
+        return (), pii_map
+    session.add_pseudonyms(pii_map)
+    return session.history(), session.pii_map
+
+@router.post("/chat/sessions")
+async def create_chat_session():
+    """Start a multi-turn conversation: pass the returned conversation_id with each message"""
+    session = session_store.create()
+    return {"conversation_id": session.conversation_id, "ttl_seconds": session_store.ttl_seconds}
+
+@router.delete("/chat/sessions/{conversation_id}")
+async def delete_chat_session(conversation_id: str):
+    """Forget a conversation and its pseudonym map"""
+    if not session_store.delete(conversation_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired conversation_id")
+    return {"deleted": conversation_id}
+
+@router.post("/chat/secure")
+async def secure_chat(payload: ChatInput):
+    check_privacy_layer()
+    session = get_session(payload.conversation_id)
+    if session is None:
+        return await secure_chat_turn(payload.message)
+    # Turns of one conversation run in order
+    async with session.lock:
+        return await secure_chat_turn(payload.message, session)
+
+async def secure_chat_turn(original_text, session=None):
     try:
-        # 1. BERT NER Extraction
-        bert_entities = []
-        if ner_pipeline:
-            bert_entities = ner_pipeline(original_text)
-        
-        # 2. Regex for Pattern-based PII (Email, Phone) - BERT doesn't catch these well
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        phone_pattern = r'\b(?:\+?(\d{1,3}))?[-. (]*(\d{3})[-. )]*(\d{3})[-. ]*(\d{4})\b'
-        
-        regex_entities = []
-        for match in re.finditer(email_pattern, original_text):
-            regex_entities.append({
-                "entity_group": "EMAIL", 
-                "word": match.group(), 
-                "start": match.start(), 
-                "end": match.end()
-            })
-            
-        for match in re.finditer(phone_pattern, original_text):
-             regex_entities.append({
-                "entity_group": "PHONE", 
-                "word": match.group(), 
-                "start": match.start(), 
-                "end": match.end()
-            })
-
-        # Combine entities
-        all_detected_entities = bert_entities + regex_entities
-        
-        # Parse with Spacy for Context Analysis (Dependencies)
-        doc = None
-        if nlp:
-            doc = nlp(original_text)
-        
-        # Redaction Logic
-        redacted_text = original_text
-        pii_map = {}
-        
-        # Map BERT labels to our standard labels
-        label_map = {
-            "PER": "PERSON",
-            "ORG": "ORG",
-            "LOC": "LOC",
-            "MISC": "MISC",
-            "EMAIL": "EMAIL",
-            "PHONE": "PHONE"
-        }
-        
-        replacements = []
-        preserved_items = {} # Map of text -> label
-        global_preserved_texts = set()
-
-        # Phase 1: Identify Global Erasure Exceptions (Preservation)
-        for ent in all_detected_entities:
-             label = label_map.get(ent["entity_group"], ent["entity_group"])
-             text = ent["word"]
-             
-             if label in ["GPE", "LOC", "ORG"]:
-                 # Context Check using Spacy
-                 is_personal = False
-                 if doc:
-                     # Find corresponding Spacy span
-                     # formatting note: BERT 'start'/'end' are character indices
-                     span = doc.char_span(ent["start"], ent["end"])
-                     # If exact match fails (tokenization diffs), try alignment
-                     if not span:
-                          # Fallback: simple text search in doc if char_span is strict
-                          span = doc.char_span(ent["start"], ent["end"], alignment_mode="expand")
-                     
-                     if span:
-                         # We treat the found span as a named entity for our heuristic function
-                         # The heuristic expects a spaCy Span object with root/head attributes
-                         is_personal = is_personal_context(doc, span)
-                 
-                 if not is_personal:
-                     global_preserved_texts.add(text)
-
-        # Maintain consistency for the same entity text in this session
-        session_map = {} 
-        
-        # Maintain consistency for the same entity text in this session
-        session_map = {} 
-        
-        # Process all entities for redaction
-        for ent in all_detected_entities:
-            label = label_map.get(ent["entity_group"], ent["entity_group"])
-            text = ent["word"]
-            start = ent["start"]
-            end = ent["end"]
-
-            # Filter relevant labels
-            if label in ["PERSON", "GPE", "LOC", "ORG", "PHONE", "EMAIL", "MISC"]:
-                
-                # Check Global Preservation
-                if text in global_preserved_texts:
-                    preserved_items[text] = label
-                    continue
-                
-                # Proceed to Redact
-                if text in session_map:
-                    fake_val = session_map[text]
-                else:
-                    fake_val = get_fake_pii(label)
-                    session_map[text] = fake_val
-                
-                pii_map[fake_val] = text
-                replacements.append((start, end, fake_val))
-                
-        # Apply replacements in reverse order
-        replacements.sort(key=lambda x: x[0], reverse=True)
-        
-        for start, end, val in replacements:
-            redacted_text = redacted_text[:start] + val + redacted_text[end:]
+        redacted_text, pii_map, preserved_items, entities = await prepare_prompt(
+            original_text, session.session_map if session is not None else None
+        )
+        history, restore_map = start_turn(session, pii_map)
             
-        # Call Gemini
-        response = model.generate_content(redacted_text)
-        llm_response = response.text
+        # Call the LLM (async, bounded by the client's concurrency limit) unless the
+        # redacted prompt is cached
+        cache_key, llm_response = await lookup_response(redacted_text, history)
+        cached = llm_response is not None
+        if not cached:
+            with time_stage("chat", "llm"):
+                llm_response = await llm_client.generate(redacted_text, history)
+            await store_response(cache_key, llm_response)
 
         # Detokenization 
-        restored_response = llm_response
-        for fake_val, original in pii_map.items():
-            restored_response = restored_response.replace(fake_val, original)
+        with time_stage("chat", "restore"):
+            if session is not None:
+                restored_response = session.restorer().restore(llm_response)
+                session.add_turn(redacted_text, entities, llm_response)
+            else:
+                restored_response = restore_response(llm_response, restore_map)
 
-        return {
+        result = {
             "original_prompt": original_text,
             "redacted_prompt": redacted_text,
             "llm_response_raw": llm_response,
             "llm_response_restored": restored_response,
-            "llm_response_restored": restored_response,
             "pii_map": pii_map,
-            "preserved_items": preserved_items
+            "preserved_items": preserved_items,
+            "cached": cached
         }
+        if session is not None:
+            result["conversation_id"] = session.conversation_id
+            result["turn"] = session.turn_count
+        return result
     except Exception as e:
         traceback.print_exc()
+        errors_total.inc("/chat/secure", "processing")
         return {"error": f"Processing Error: {str(e)}", "redacted_prompt": locals().get("redacted_text", "N/A")}
+
+async def lookup_response(redacted_text, history):
+    """(cache key, cached raw LLM response or None); the key is None when caching is off"""
+    if response_cache is None:
+        return None, None
+    provider = llm_client.provider
+    key = response_cache.key(f"{provider.name}/{provider.model_name}", redacted_text, history)
+    return key, await run_in_threadpool(response_cache.get, key)
+
+async def store_response(cache_key, llm_response):
+    if cache_key is not None:
+        await run_in_threadpool(response_cache.set, cache_key, llm_response)
+
+async def replay(text):
+    """A cached response in place of an LLM stream"""
+    yield text
+
+@router.get("/chat/cache")
+async def chat_cache_stats():
+    """Response cache configuration and hit/miss counts"""
+    if response_cache is None:
+        return {"backend": "off"}
+    return await run_in_threadpool(response_cache.stats)
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_secure_chat(original_text, session=None):
+    if session is None:
+        async for event in stream_secure_chat_turn(original_text):
+            yield event
+        return
+    async with session.lock:
+        async for event in stream_secure_chat_turn(original_text, session):
+            yield event
+
+async def stream_secure_chat_turn(original_text, session=None):
+    """
+    SSE events for /chat/secure/stream:
+      redaction - redacted_prompt, pii_map, preserved_items (before the LLM is called)
+      token     - {"text": restored text} as LLM chunks arrive
+      done      - full raw and restored responses
+      error     - {"error": message}
+    """
+    redacted_text = "N/A"
+    try:
+        redacted_text, pii_map, preserved_items, entities = await prepare_prompt(
+            original_text, session.session_map if session is not None else None
+        )
+        history, restore_map = start_turn(session, pii_map)
+        redaction = {
+            "original_prompt": original_text,
+            "redacted_prompt": redacted_text,
+            "pii_map": pii_map,
+            "preserved_items": preserved_items
+        }
+        if session is not None:
+            redaction["conversation_id"] = session.conversation_id
+        yield sse_event("redaction", redaction)
+
+        restorer = StreamRestorer(restore_map)
+        raw_parts, restored_parts = [], []
+        started = time.perf_counter()
+        first_token = True
+        cache_key, cached_response = await lookup_response(redacted_text, history)
+        if cached_response is not None:
+            # Replays are timed separately so they do not skew the LLM latency histograms
+            chunks = replay(cached_response)
+            first_token = False
+        else:
+            chunks = llm_client.stream(redacted_text, history)
+        async for text in chunks:
+            raw_parts.append(text)
+            restored = restorer.feed(text)
+            if restored:
+                if first_token:
+                    stage_seconds.observe(time.perf_counter() - started, "chat", "first_token")
+                    first_token = False
+                restored_parts.append(restored)
+                yield sse_event("token", {"text": restored})
+        stage_seconds.observe(time.perf_counter() - started, "chat", "llm" if cached_response is None else "cache_replay")
+
+        rest = restorer.flush()
+        if rest:
+            restored_parts.append(rest)
+            yield sse_event("token", {"text": rest})
+        done = {
+            "llm_response_raw": "".join(raw_parts),
+            "llm_response_restored": "".join(restored_parts),
+            "cached": cached_response is not None
+        }
+        if cached_response is None:
+            await store_response(cache_key, done["llm_response_raw"])
+        if session is not None:
+            session.add_turn(redacted_text, entities, done["llm_response_raw"])
+            done["turn"] = session.turn_count
+        yield sse_event("done", done)
+    except Exception as e:
+        traceback.print_exc()
+        errors_total.inc("/chat/secure/stream", "processing")
+        yield sse_event("error", {"error": f"Processing Error: {str(e)}", "redacted_prompt": redacted_text})
+
+@router.post("/chat/secure/stream")
+async def secure_chat_stream(payload: ChatInput):
+    """Server-Sent Events variant of /chat/secure: restored text is streamed as the LLM generates it"""
+    check_privacy_layer()
+    session = get_session(payload.conversation_id)
+    return StreamingResponse(
+        stream_secure_chat(payload.message, session),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
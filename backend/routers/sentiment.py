@@ -2,8 +2,13 @@
 Sentiment Analysis Router with FHE support (TenSEAL)
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
+from typing import List
+import json
+import hashlib
 import numpy as np
 import torch
 import tenseal as ts
@@ -11,24 +16,71 @@ import joblib
 import os
 
 from sentiment_analysis.model import SentimentNet
+from fhe.context_cache import load_or_create_context, warm_galois_keys
+from digit_recognition.plan import FHEModelPlan
+from fhe.compiler import load_or_compile
+from fhe.packed import max_packed_batch, packed_forward
+from serving.batching import MicroBatcher
+from serving.http_cache import PrecompressedPayload
+from serving.metrics import record_context_load, time_stage
+from serving.transport import MAX_CIPHERTEXT_BYTES, read_body, ciphertext_response, context_registry, load_ckks_vector
 
 router = APIRouter()
 
 # Global variables for model and vectorizer
 sentiment_model = None
+sentiment_plan = None
+sentiment_compiled = None
 vectorizer = None
+vectorizer_params = None
 labels = None
 ts_context = None
+batcher = None
+
+# Encrypted scoring packs up to SENTIMENT_MAX_BATCH documents (256 features each)
+# into one 8192-degree ciphertext. With SENTIMENT_BATCH_WAIT_MS > 0, single-document
+# requests that arrive within that window are packed together.
+POLY_MODULUS_DEGREE = 8192
+SENTIMENT_MAX_BATCH = min(int(os.getenv("SENTIMENT_MAX_BATCH", max_packed_batch(POLY_MODULUS_DEGREE, 256))),
+                          max_packed_batch(POLY_MODULUS_DEGREE, 256))
+SENTIMENT_BATCH_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_WAIT_MS", "0"))
+MAX_DOCUMENTS_PER_REQUEST = int(os.getenv("SENTIMENT_MAX_DOCUMENTS", 1024))
+
+# /sentiment/predict-batch: texts are vectorized and scored BATCH_CHUNK_SIZE at a time,
+# each chunk's results are streamed as soon as they are ready
+VECTORIZER_PARAMS_MAX_AGE = int(os.getenv("VECTORIZER_PARAMS_MAX_AGE", 3600))
+MAX_TEXTS_PER_BATCH = int(os.getenv("SENTIMENT_MAX_BATCH_TEXTS", 100000))
+BATCH_CHUNK_SIZE = int(os.getenv("SENTIMENT_BATCH_CHUNK", 4096))
 
 class SentimentInput(BaseModel):
     text: str
 
+class SentimentBatchInput(BaseModel):
+    texts: List[str]
+
 class EncryptedSentimentInput(BaseModel):
-    encrypted_features: list  # List of encrypted TF-IDF features
+    encrypted_features: list  # TF-IDF features of one document, or a list of documents
+
+def build_vectorizer_params(vectorizer, vectorizer_path):
+    """
+    Client-side TF-IDF parameters serialized once as compact JSON (and precompressed).
+    The ETag is the hash of the vectorizer file, so it changes only when the model does.
+    """
+    with open(vectorizer_path, "rb") as f:
+        version = hashlib.sha256(f.read()).hexdigest()[:16]
+    # Convert vocabulary_ dict to have int values instead of numpy.int64
+    vocab_dict = {k: int(v) for k, v in vectorizer.vocabulary_.items()}
+    body = json.dumps({
+        "vocabulary": vocab_dict,
+        "idf": vectorizer.idf_.tolist(),
+        "max_features": len(vectorizer.vocabulary_),
+        "version": version
+    }, separators=(",", ":")).encode()
+    return PrecompressedPayload(body, "application/json", version=version, max_age=VECTORIZER_PARAMS_MAX_AGE)
 
 def load_sentiment_model():
     """Load the trained sentiment model and vectorizer"""
-    global sentiment_model, vectorizer, labels
+    global sentiment_model, sentiment_plan, sentiment_compiled, vectorizer, vectorizer_params, labels
     
     try:
         # Get backend directory path
@@ -41,6 +93,7 @@ def load_sentiment_model():
             return False
         
         vectorizer = joblib.load(vectorizer_path)
+        vectorizer_params = build_vectorizer_params(vectorizer, vectorizer_path)
         
         # Load labels
         labels_path = os.path.join(backend_dir, "sentiment_labels.pkl")
@@ -58,6 +111,9 @@ def load_sentiment_model():
         sentiment_model = SentimentNet(input_dim=256, hidden_dim=64, output_dim=3)
         sentiment_model.load_state_dict(torch.load(model_path, map_location=torch.device('cpu'), weights_only=True))
         sentiment_model.eval()
+        # fc1 -> identity -> fc2 compiles to a single 256 x 3 affine layer (fhe/compiler.py)
+        sentiment_compiled = load_or_compile("sentiment", sentiment_model)
+        sentiment_plan = FHEModelPlan(sentiment_compiled)
         
         print("✅ Sentiment model loaded successfully")
         return True
@@ -69,45 +125,78 @@ def load_sentiment_model():
         return False
 
 def create_tenseal_context():
-    """Create TenSEAL context for FHE operations"""
+    """
+    Create TenSEAL context for FHE operations (cached in sentiment_context.bin).
+    The modulus chain has one 40-bit prime per level the compiled plan uses.
+    """
     global ts_context
     
-    context = ts.context(
-        ts.SCHEME_TYPE.CKKS,
-        poly_modulus_degree=8192,
-        coeff_mod_bit_sizes=[60, 40, 40, 60]
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    depth = sentiment_plan.depth if sentiment_plan is not None else 2
+    context, stats = load_or_create_context(
+        os.path.join(backend_dir, "sentiment_context.bin"),
+        poly_modulus_degree=POLY_MODULUS_DEGREE,
+        coeff_mod_bit_sizes=[60] + [40] * depth + [60],
+        global_scale=2**40
     )
-    context.global_scale = 2**40
-    context.generate_galois_keys()
+    print(f"Sentiment TenSEAL context ready ({'cached' if stats['cached'] else 'generated'}, {stats['seconds']:.2f}s).")
+    record_context_load("sentiment", stats)
+    warm_galois_keys(context)
     ts_context = context
     return context
 
+def encrypted_predict(features):
+    """(k, 256) TF-IDF features -> (k, 3) logits, evaluated on packed CKKS ciphertexts"""
+    logits = []
+    for start in range(0, len(features), SENTIMENT_MAX_BATCH):
+        logits.append(packed_forward(sentiment_plan, ts_context, features[start:start + SENTIMENT_MAX_BATCH], pipeline="sentiment"))
+    return np.concatenate(logits)
+
+async def predict_batch(documents):
+    """MicroBatcher callback: pack concurrent single-document requests into one ciphertext"""
+    return list(await run_in_threadpool(encrypted_predict, np.stack(documents)))
+
+def setup_encrypted_inference():
+    """Create the CKKS context and, if enabled, the request batcher (call from the running event loop)"""
+    global batcher
+    create_tenseal_context()
+    if SENTIMENT_BATCH_WAIT_MS > 0:
+        batcher = MicroBatcher(predict_batch, max_batch_size=SENTIMENT_MAX_BATCH, max_wait_ms=SENTIMENT_BATCH_WAIT_MS)
+        batcher.start()
+        print(f"Sentiment micro-batching enabled (up to {SENTIMENT_MAX_BATCH} documents / {SENTIMENT_BATCH_WAIT_MS} ms).")
+
+async def shutdown_encrypted_inference():
+    if batcher is not None:
+        await batcher.stop()
+
 @router.get("/sentiment/status")
 async def sentiment_status():
     """Check if sentiment model is loaded"""
     return {
         "model_loaded": sentiment_model is not None,
         "vectorizer_loaded": vectorizer is not None,
+        "encrypted_ready": ts_context is not None,
         "labels": labels if labels else []
     }
 
-@router.post("/sentiment/get-vectorizer-params")
-async def get_vectorizer_params():
+@router.get("/sentiment/vectorizer-params")
+async def vectorizer_params_get(request: Request):
     """
     Return vectorizer parameters for client-side TF-IDF
-    Client needs these to transform text before encryption
+    Client needs these to transform text before encryption.
+    Precomputed at model load; cacheable (ETag / If-None-Match) and served
+    gzip or brotli compressed when the client accepts it.
     """
-    if vectorizer is None:
+    if vectorizer_params is None:
         raise HTTPException(status_code=500, detail="Vectorizer not loaded")
-    
-    # Convert vocabulary_ dict to have int values instead of numpy.int64
-    vocab_dict = {k: int(v) for k, v in vectorizer.vocabulary_.items()}
-    
-    return {
-        "vocabulary": vocab_dict,
-        "idf": vectorizer.idf_.tolist(),
-        "max_features": len(vectorizer.vocabulary_)
-    }
+    return vectorizer_params.response(request)
+
+@router.post("/sentiment/get-vectorizer-params")
+async def get_vectorizer_params():
+    """Deprecated: use GET /sentiment/vectorizer-params (cacheable)"""
+    if vectorizer_params is None:
+        raise HTTPException(status_code=500, detail="Vectorizer not loaded")
+    return Response(content=vectorizer_params.bodies["identity"], media_type="application/json")
 
 @router.post("/sentiment/predict")
 async def predict_sentiment(payload: SentimentInput):
@@ -119,11 +208,12 @@ async def predict_sentiment(payload: SentimentInput):
     
     try:
         # Transform text to TF-IDF features
-        features = vectorizer.transform([payload.text]).toarray()[0]
+        with time_stage("sentiment", "tfidf"):
+            features = vectorizer.transform([payload.text]).toarray()[0]
         features_tensor = torch.FloatTensor(features).unsqueeze(0)
         
         # Predict
-        with torch.no_grad():
+        with time_stage("sentiment", "forward"), torch.no_grad():
             output = sentiment_model(features_tensor)
             _, predicted = torch.max(output, 1)
             prediction_idx = predicted.item()
@@ -136,35 +226,111 @@ async def predict_sentiment(payload: SentimentInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+def score_texts(texts):
+    """
+    One sparse TF-IDF transform for all texts, fed as CSR straight into the
+    compiled (fused) model. Returns the predicted class indices.
+    """
+    with time_stage("sentiment", "tfidf"):
+        features = vectorizer.transform(texts)
+    with time_stage("sentiment", "forward"):
+        logits = sentiment_compiled.forward(features)
+    return np.argmax(logits, axis=1)
+
+@router.post("/sentiment/predict-batch")
+async def predict_sentiment_batch(payload: SentimentBatchInput):
+    """
+    Plaintext prediction for many texts in one call.
+    Streams newline-delimited JSON, one line per text in input order:
+    {"index": i, "prediction": label, "prediction_index": k}
+    """
+    if sentiment_compiled is None or vectorizer is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+    if len(payload.texts) > MAX_TEXTS_PER_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_TEXTS_PER_BATCH} texts per request")
+
+    texts = payload.texts
+    names = labels if labels else [f"Class {i}" for i in range(sentiment_compiled.n_classes)]
+
+    async def results():
+        for start in range(0, len(texts), BATCH_CHUNK_SIZE):
+            predictions = await run_in_threadpool(score_texts, texts[start:start + BATCH_CHUNK_SIZE])
+            yield "".join(
+                json.dumps({"index": start + i, "prediction": names[k], "prediction_index": int(k)}) + "\n"
+                for i, k in enumerate(predictions)
+            )
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @router.post("/sentiment/predict-encrypted")
 async def predict_sentiment_encrypted(payload: EncryptedSentimentInput):
     """
     FHE-encrypted prediction
-    Client sends encrypted TF-IDF features
-    Server performs inference on encrypted data
-    Returns encrypted prediction
+    Features are encrypted under the server's CKKS context (poly_modulus_degree 8192)
+    and the compiled (fused fc1 -> fc2) model runs on the ciphertexts.
+    Several documents share one ciphertext.
+    `encrypted_features` is one document (256 values) or a list of documents.
+    For client-side encryption use /sentiment/predict-encrypted-binary.
     """
-    if sentiment_model is None:
+    if sentiment_plan is None or ts_context is None:
         raise HTTPException(status_code=500, detail="Model not loaded")
-    
+
     try:
-        # For now, simulating FHE by accepting array and encrypting/decrypting
-        # In production, client would encrypt features
-        features = np.array(payload.encrypted_features)
-        features_tensor = torch.FloatTensor(features).unsqueeze(0)
-        
-        # Predict (in FHE mode, this would operate on encrypted tensors)
-        with torch.no_grad():
-            output = sentiment_model(features_tensor)
-            _, predicted = torch.max(output, 1)
-            prediction_idx = predicted.item()
-        
-        # In real FHE, we'd return encrypted result
-        # For this demo, returning plaintext similar to digit recognition
-        return {
-            "prediction": prediction_idx,
-            "label": labels[prediction_idx] if labels else f"Class {prediction_idx}"
+        features = np.array(payload.encrypted_features, dtype=np.float64)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="encrypted_features must be a list of numbers or a list of equal-length lists")
+    single = features.ndim == 1
+    features = features.reshape(1, -1) if single else features
+    if features.ndim != 2 or features.shape[1] != sentiment_plan.n_features:
+        raise HTTPException(status_code=400, detail=f"Expected {sentiment_plan.n_features} features per document")
+    if len(features) > MAX_DOCUMENTS_PER_REQUEST:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_DOCUMENTS_PER_REQUEST} documents per request")
+
+    try:
+        if single and batcher is not None:
+            logits = [await batcher.submit(features[0])]
+        else:
+            logits = await run_in_threadpool(encrypted_predict, features)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Encrypted prediction error: {str(e)}")
+
+    predictions = [
+        {
+            "prediction": int(np.argmax(output)),
+            "label": labels[int(np.argmax(output))] if labels else f"Class {int(np.argmax(output))}",
+            "encrypted": True
         }
-        
+        for output in logits
+    ]
+    return predictions[0] if single else {"predictions": predictions}
+
+@router.post("/sentiment/predict-encrypted-binary")
+async def predict_sentiment_encrypted_binary(request: Request, x_context_id: str = Header(None)):
+    """
+    Client-encrypted prediction over application/octet-stream.
+    Body: serialized CKKSVector of the 256 TF-IDF features, encrypted under a context
+    registered via /fhe/context (CKKS, poly_modulus_degree 8192, depth >= 1:
+    fc1 -> fc2 is compiled into one affine layer).
+    Returns the serialized encrypted logits; only the client can decrypt them.
+    """
+    if sentiment_plan is None:
+        raise HTTPException(status_code=500, detail="Model not loaded")
+
+    client_context = context_registry.get(x_context_id)
+    data, wire_bytes = await read_body(request, MAX_CIPHERTEXT_BYTES)
+    enc_features = load_ckks_vector(client_context, data, sentiment_plan.n_features)
+
+    def evaluate():
+        # Compiled fc1 -> identity -> fc2 (a single layer)
+        with time_stage("sentiment", "encrypted_matmul"):
+            enc_x = enc_features
+            for layer in sentiment_plan.layers:
+                enc_x = enc_x.matmul(layer.weight) + layer.bias
+            return enc_x
+
+    try:
+        enc_output = await run_in_threadpool(evaluate)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Encrypted prediction error: {str(e)}")
+
+    return ciphertext_response(enc_output.serialize(), wire_bytes)
@@ -1,8 +1,35 @@
 """
 Train a small sentiment analysis model on IMDb dataset
 Uses TF-IDF + simple neural network for FHE compatibility
+
+Two modes:
+- "memory" (default): the first 5000 training reviews, vectorized in memory
+- "stream": the whole corpus, out of core. Pass 1 streams the documents in
+  chunks and counts term and document frequencies; the vectorizer is the top
+  `max_features` terms with their smoothed IDF (the same as fitting
+  TfidfVectorizer on the whole corpus, unless the vocabulary outgrows
+  `--max-terms` and the counts become approximate, see count_terms). Pass 2 vectorizes chunk by chunk and
+  appends the sparse rows to flat files in a work directory, which every epoch
+  reads back through np.memmap in a shuffled order. Peak memory depends on the
+  chunk size and vocabulary, not on the number of documents.
+
+Both write the same artifacts (sentiment_model.pth, sentiment_vectorizer.pkl,
+sentiment_labels.pkl) for routers/sentiment.load_sentiment_model.
+
+Usage (from backend/):
+    python -m sentiment_analysis.train
+    python -m sentiment_analysis.train --mode stream --chunk-size 1000
+    python -m sentiment_analysis.train --mode stream --source reviews.jsonl
 """
 
+import argparse
+import heapq
+import itertools
+import json
+import tempfile
+import time
+from collections import Counter
+
 import torch
 import torch.nn as nn
 import torch.optim as optim
@@ -16,6 +43,10 @@ import numpy as np
 
 from sentiment_analysis.model import SentimentNet
 
+STREAM_CHUNK_SIZE = 1000
+MAX_VOCAB_TERMS = 1_000_000 # Pass 1 prunes the rarest terms beyond this (counts become approximate)
+TEST_EVERY = 5 # JSONL sources: every 5th document is held out for testing
+
 def simplify_label(rating):
     """Convert 0-10 rating to Negative(0), Neutral(1), Positive(2)"""
     if rating <= 4:
@@ -117,17 +148,235 @@ def train_model():
     
     # Save model and vectorizer
     print("\n[6/6] Saving model and vectorizer...")
-    os.makedirs("sentiment_analysis/saved_models", exist_ok=True)
-    
-    torch.save(model.state_dict(), "sentiment_model.pth")
-    joblib.dump(vectorizer, "sentiment_vectorizer.pkl")
-    joblib.dump(['Negative', 'Neutral', 'Positive'], "sentiment_labels.pkl")
+    save_artifacts(model, vectorizer)
+
+def save_artifacts(model, vectorizer, output_dir="."):
+    model_path = os.path.join(output_dir, "sentiment_model.pth")
+    vectorizer_path = os.path.join(output_dir, "sentiment_vectorizer.pkl")
+    labels_path = os.path.join(output_dir, "sentiment_labels.pkl")
+    torch.save(model.state_dict(), model_path)
+    joblib.dump(vectorizer, vectorizer_path)
+    joblib.dump(['Negative', 'Neutral', 'Positive'], labels_path)
     
     print("\n Training complete!")
-    print(f"   - Model saved to: sentiment_model.pth")
-    print(f"   - Vectorizer saved to: sentiment_vectorizer.pkl")
-    print(f"   - Labels saved to: sentiment_labels.pkl")
+    print(f"   - Model saved to: {model_path}")
+    print(f"   - Vectorizer saved to: {vectorizer_path}")
+    print(f"   - Labels saved to: {labels_path}")
+    print("="*50)
+
+def iter_documents(source, split):
+    """
+    (text, ternary label) pairs, read one at a time. `source` is "imdb" (the
+    Hugging Face dataset in streaming mode) or a JSONL file of {"text", "label"}
+    rows with IMDb's labels (0=negative, 1=positive).
+    """
+    if source == "imdb":
+        for row in load_dataset("imdb", split=split, streaming=True):
+            yield row["text"], 0 if row["label"] == 0 else 2
+        return
+    with open(source) as f:
+        for i, line in enumerate(f):
+            if (i % TEST_EVERY == 0) != (split == "test"):
+                continue
+            row = json.loads(line)
+            yield row["text"], 0 if row["label"] == 0 else 2
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def count_terms(documents, analyzer, chunk_size=STREAM_CHUNK_SIZE, max_terms=MAX_VOCAB_TERMS):
+    """
+    Pass 1: corpus term counts, document frequencies and document count.
+
+    Exact as long as there are at most `max_terms` distinct terms. Beyond that
+    the least frequent half is dropped, and a dropped term that shows up again
+    is counted from zero: its term and document frequencies are undercounted
+    from then on, by up to the largest dropped count. Pruning is logged.
+    """
+    term_counts = Counter()
+    doc_counts = Counter()
+    n_docs = 0
+    for chunk in iter_chunks(documents, chunk_size):
+        for text, _ in chunk:
+            tokens = analyzer(text)
+            term_counts.update(tokens)
+            doc_counts.update(set(tokens))
+        n_docs += len(chunk)
+        if len(term_counts) > max_terms:
+            # The extra entry is the most frequent term that gets dropped
+            kept = term_counts.most_common(max_terms // 2 + 1)
+            largest_dropped = kept.pop()[1]
+            print(f"Warning: {len(term_counts)} distinct terms after {n_docs} documents, dropping the "
+                  f"{len(term_counts) - len(kept)} least frequent (counts <= {largest_dropped}). "
+                  f"Term and document frequencies are approximate from here on; raise --max-terms for exact counts.")
+            term_counts = Counter(dict(kept))
+            doc_counts = Counter({term: doc_counts[term] for term, _ in kept})
+    return term_counts, doc_counts, n_docs
+
+def build_vectorizer(term_counts, doc_counts, n_docs, max_features):
+    """
+    TfidfVectorizer over the `max_features` most frequent terms with smoothed
+    IDF. Equivalent to TfidfVectorizer(max_features=...).fit(corpus) when the
+    counts are exact (count_terms did not prune), an approximation otherwise.
+    """
+    terms = heapq.nsmallest(max_features, term_counts, key=lambda term: (-term_counts[term], term))
+    vectorizer = TfidfVectorizer(stop_words='english', vocabulary=sorted(terms))
+    vectorizer.fit([""]) # Sets vocabulary_; idf_ is replaced below
+    doc_freq = np.array([doc_counts[term] for term in vectorizer.get_feature_names_out()], dtype=np.float64)
+    vectorizer.idf_ = np.log((1 + n_docs) / (1 + doc_freq)) + 1
+    return vectorizer
+
+class SparseRows:
+    """
+    CSR rows appended chunk by chunk to flat files (values, column indices, row
+    lengths, labels), then read back through np.memmap so a batch of any rows
+    can be gathered without loading the matrix.
+    """
+    FIELDS = {"data": np.float32, "indices": np.int32, "lengths": np.int32, "labels": np.int64}
+
+    def __init__(self, directory, name, n_features):
+        self.n_features = n_features
+        self.paths = {field: os.path.join(directory, f"{name}.{field}") for field in self.FIELDS}
+        self._files = {field: open(path, "wb") for field, path in self.paths.items()}
+        self.n_rows = 0
+
+    def append(self, matrix, labels):
+        matrix = matrix.tocsr()
+        self._files["data"].write(matrix.data.astype(np.float32).tobytes())
+        self._files["indices"].write(matrix.indices.astype(np.int32).tobytes())
+        self._files["lengths"].write(np.diff(matrix.indptr).astype(np.int32).tobytes())
+        self._files["labels"].write(np.asarray(labels, dtype=np.int64).tobytes())
+        self.n_rows += matrix.shape[0]
+
+    def close(self):
+        """Finish writing and map the files for reading"""
+        for f in self._files.values():
+            f.close()
+        self.indptr = np.zeros(self.n_rows + 1, dtype=np.int64)
+        np.cumsum(np.fromfile(self.paths["lengths"], dtype=np.int32), out=self.indptr[1:])
+        self.data, self.indices, self.labels = (
+            np.memmap(self.paths[field], dtype=self.FIELDS[field], mode="r")
+            if os.path.getsize(self.paths[field]) else np.empty(0, dtype=self.FIELDS[field])
+            for field in ("data", "indices", "labels")
+        )
+
+    def batch(self, rows):
+        """Dense (len(rows), n_features) inputs and labels for the given row numbers"""
+        inputs = np.zeros((len(rows), self.n_features), dtype=np.float32)
+        for i, row in enumerate(rows):
+            start, end = self.indptr[row], self.indptr[row + 1]
+            inputs[i, self.indices[start:end]] = self.data[start:end]
+        return torch.from_numpy(inputs), torch.from_numpy(np.asarray(self.labels[rows]))
+
+def vectorize_to_disk(documents, vectorizer, rows, chunk_size=STREAM_CHUNK_SIZE):
+    """Pass 2: TF-IDF one chunk at a time, appended to `rows`"""
+    for chunk in iter_chunks(documents, chunk_size):
+        texts, chunk_labels = zip(*chunk)
+        rows.append(vectorizer.transform(texts), chunk_labels)
+    rows.close()
+    return rows
+
+def train_model_streaming(source="imdb", max_features=256, epochs=20, batch_size=64, learning_rate=0.01,
+                          chunk_size=STREAM_CHUNK_SIZE, max_terms=MAX_VOCAB_TERMS, work_dir=None, seed=42,
+                          output_dir="."):
+    print("="*50)
+    print("Training Sentiment Analysis Model (FHE-Compatible, streaming)")
     print("="*50)
+    torch.manual_seed(seed)
+    device = torch.device("cpu")  # FHE models run on CPU
+    
+    # Pass 1: vocabulary and document frequencies
+    print(f"\n[1/6] Counting terms in {source} (chunks of {chunk_size})...")
+    start = time.perf_counter()
+    analyzer = TfidfVectorizer(stop_words='english').build_analyzer()
+    term_counts, doc_counts, n_docs = count_terms(iter_documents(source, "train"), analyzer, chunk_size, max_terms)
+    print(f"Counted {len(term_counts)} terms in {n_docs} documents ({time.perf_counter() - start:.1f}s)")
+    
+    print(f"\n[2/6] Building TF-IDF vectorizer (max_features={max_features})...")
+    vectorizer = build_vectorizer(term_counts, doc_counts, n_docs, max_features)
+    del term_counts, doc_counts
+    
+    with tempfile.TemporaryDirectory(dir=work_dir, prefix="sentiment_rows_") as directory:
+        # Pass 2: sparse TF-IDF rows on disk
+        start = time.perf_counter()
+        train_rows = vectorize_to_disk(
+            iter_documents(source, "train"), vectorizer, SparseRows(directory, "train", max_features), chunk_size
+        )
+        test_rows = vectorize_to_disk(
+            iter_documents(source, "test"), vectorizer, SparseRows(directory, "test", max_features), chunk_size
+        )
+        print(f"Vectorized {train_rows.n_rows} training and {test_rows.n_rows} test documents "
+              f"({time.perf_counter() - start:.1f}s)")
+        
+        # Initialize model
+        print("\n[3/6] Initializing model...")
+        model = SentimentNet(input_dim=max_features, hidden_dim=64, output_dim=3)
+        model = model.to(device)
+        
+        criterion = nn.CrossEntropyLoss()
+        optimizer = optim.Adam(model.parameters(), lr=learning_rate)
+        generator = torch.Generator().manual_seed(seed)
+        
+        # Training loop
+        print(f"\n[4/6] Training for {epochs} epochs...")
+        for epoch in range(epochs):
+            model.train()
+            total_loss = 0
+            correct = 0
+            n_batches = 0
+            order = torch.randperm(train_rows.n_rows, generator=generator).numpy()
+            
+            for begin in range(0, len(order), batch_size):
+                inputs, targets = train_rows.batch(order[begin:begin + batch_size])
+                inputs, targets = inputs.to(device), targets.to(device)
+                
+                optimizer.zero_grad()
+                outputs = model(inputs)
+                loss = criterion(outputs, targets)
+                loss.backward()
+                optimizer.step()
+                
+                total_loss += loss.item()
+                correct += (outputs.argmax(dim=1) == targets).sum().item()
+                n_batches += 1
+            
+            if (epoch + 1) % 5 == 0:
+                print(f"Epoch [{epoch+1}/{epochs}], Loss: {total_loss / n_batches:.4f}, "
+                      f"Accuracy: {100 * correct / train_rows.n_rows:.2f}%")
+        
+        # Evaluation
+        print("\n[5/6] Evaluating model...")
+        model.eval()
+        correct = 0
+        with torch.no_grad():
+            for begin in range(0, test_rows.n_rows, 1000):
+                inputs, targets = test_rows.batch(np.arange(begin, min(begin + 1000, test_rows.n_rows)))
+                correct += (model(inputs).argmax(dim=1) == targets).sum().item()
+        print(f"Test Accuracy: {100 * correct / max(test_rows.n_rows, 1):.2f}%")
+    
+    print("\n[6/6] Saving model and vectorizer...")
+    save_artifacts(model, vectorizer, output_dir)
+    return model, vectorizer
 
 if __name__ == "__main__":
-    train_model()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the FHE-compatible sentiment model")
+    parser.add_argument("--mode", choices=["memory", "stream"], default="memory")
+    parser.add_argument("--source", default="imdb", help='"imdb" or a JSONL file of {"text", "label"} rows (stream mode)')
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE, help="Documents per chunk (stream mode)")
+    parser.add_argument("--max-terms", type=int, default=MAX_VOCAB_TERMS, help="Term counter cap (stream mode)")
+    parser.add_argument("--work-dir", default=None, help="Directory for the on-disk TF-IDF rows (stream mode)")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args()
+    
+    if args.mode == "stream":
+        train_model_streaming(
+            source=args.source, chunk_size=args.chunk_size, max_terms=args.max_terms,
+            work_dir=args.work_dir, output_dir=args.output_dir
+        )
+    else:
+        train_model()
@@ -0,0 +1 @@
+# Serving utilities shared by the routers
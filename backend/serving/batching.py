@@ -0,0 +1,89 @@
+"""
+Dynamic micro-batching for expensive inference calls
+
+Requests that arrive within a short window are grouped and handed to a single
+batch function, then each caller gets its own result back.
+"""
+
+import asyncio
+
+class MicroBatcher:
+    """
+    Collect items for up to `max_wait_ms` (or until `max_batch_size` is reached)
+    and run them through `process_batch` together.
+
+    `process_batch` is an async callable that takes a list of items and returns
+    a list of results in the same order.
+    """
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10, max_concurrent_batches=1):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrent_batches = max(1, max_concurrent_batches)
+        self._queue = None
+        self._collector = None
+        self._slots = None
+        self._running = set()
+
+    def start(self):
+        """Start the collector task (must be called from the running event loop)"""
+        if self._collector is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        if self._collector is None:
+            self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Bound the number of batches in flight, the rest keep queueing
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            results = await self.process_batch(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"Batch returned {len(results)} results for {len(items)} items")
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._slots.release()
@@ -0,0 +1,89 @@
+"""
+Precompressed, ETag-validated responses for payloads that rarely change
+
+The body is serialized and compressed once (gzip, and brotli when the optional
+`brotli` package is installed). Each request only negotiates the encoding and
+checks If-None-Match.
+
+Every encoding is a different representation, so each gets its own strong
+ETag ("<hash>", "<hash>-gzip", "<hash>-br", RFC 9110 8.8.3); a cache can
+never answer an identity request with gzip bytes validated by the same tag.
+"""
+
+import gzip
+import hashlib
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def _accepted_encodings(accept_encoding):
+    """Accept-Encoding header -> {encoding: q}"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+class PrecompressedPayload:
+    """
+    `body` bytes served in the best encoding the client accepts, with a strong
+    per-encoding ETag derived from `version` (or the body hash).
+    """
+    def __init__(self, body, media_type, version=None, max_age=3600):
+        self.media_type = media_type
+        self.max_age = max_age
+        self.version = (version or hashlib.sha256(body).hexdigest())[:32]
+        self.bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(body, quality=11)
+        self.etags = {
+            encoding: f'"{self.version}"' if encoding == "identity" else f'"{self.version}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+    @property
+    def sizes(self):
+        return {encoding: len(body) for encoding, body in self.bodies.items()}
+
+    def negotiate(self, accept_encoding):
+        """Smallest encoding the client accepts (identity unless refused)"""
+        accepted = _accepted_encodings(accept_encoding)
+        wildcard = accepted.get("*")
+        candidates = []
+        for encoding, body in self.bodies.items():
+            default = (1.0 if wildcard is None else wildcard) if encoding == "identity" else (wildcard or 0.0)
+            if accepted.get(encoding, default) > 0:
+                candidates.append((len(body), encoding))
+        return min(candidates)[1] if candidates else "identity"
+
+    def response(self, request):
+        encoding = self.negotiate(request.headers.get("accept-encoding"))
+        etag = self.etags[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "Vary": "Accept-Encoding",
+        }
+        # If-None-Match uses weak comparison, against the selected representation's tag
+        if_none_match = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+        if "*" in if_none_match or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in if_none_match):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.bodies[encoding], media_type=self.media_type, headers=headers)
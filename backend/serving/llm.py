@@ -0,0 +1,176 @@
+"""
+Async LLM client for the chat router
+
+One LLMClient is created at startup and shared by every request. It bounds the
+number of in-flight LLM calls with a semaphore, applies a timeout to each call
+(and to each streamed chunk), and retries transient failures with exponential
+backoff and jitter. Providers keep one long-lived model/channel, so connections
+are reused across requests instead of being set up per call.
+
+Providers (LLM_PROVIDER):
+- "gemini" (default): google.generativeai async API, needs GOOGLE_GENERATIVE_AI_API_KEY
+- "echo": local stand-in that echoes the prompt back in chunks, for tests and benchmarks
+"""
+
+import asyncio
+import os
+import random
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", 0.5))
+
+class LLMError(Exception):
+    """The LLM call failed after all retries (or with a non-retryable error)"""
+    pass
+
+class LLMProvider:
+    """
+    Provider interface: `generate(prompt, history)` returns the full reply,
+    `stream(prompt, history)` is an async iterator of text chunks. `history` is
+    a sequence of earlier (role, text) turns, role "user" or "model".
+    `retryable_errors` lists the exception types worth retrying.
+    """
+    name = "base"
+    model_name = None
+    retryable_errors = ()
+
+    async def generate(self, prompt, history=()):
+        raise NotImplementedError
+
+    def stream(self, prompt, history=()):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, api_key, model_name=LLM_MODEL, timeout=LLM_TIMEOUT_SECONDS):
+        import google.generativeai as genai
+        from google.api_core import exceptions
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+        self.request_options = {"timeout": timeout}
+        self.retryable_errors = (
+            exceptions.TooManyRequests,
+            exceptions.ResourceExhausted,
+            exceptions.ServiceUnavailable,
+            exceptions.InternalServerError,
+            exceptions.DeadlineExceeded,
+        )
+
+    def _contents(self, prompt, history):
+        if not history:
+            return prompt
+        turns = [{"role": role, "parts": [text]} for role, text in history]
+        return turns + [{"role": "user", "parts": [prompt]}]
+
+    async def generate(self, prompt, history=()):
+        response = await self.model.generate_content_async(
+            self._contents(prompt, history), request_options=self.request_options
+        )
+        return response.text
+
+    async def stream(self, prompt, history=()):
+        response = await self.model.generate_content_async(
+            self._contents(prompt, history), stream=True, request_options=self.request_options
+        )
+        async for chunk in response:
+            yield chunk.text
+
+class EchoProvider(LLMProvider):
+    """Local stand-in: replies "Thanks for your message: <prompt>" in `chunk_size`-character chunks"""
+    name = "echo"
+    model_name = "echo"
+
+    def __init__(self, chunk_size=5, delay_seconds=0.0):
+        self.chunk_size = chunk_size
+        self.delay_seconds = delay_seconds
+
+    def reply(self, prompt):
+        return f"Thanks for your message: {prompt}"
+
+    async def generate(self, prompt, history=()):
+        await asyncio.sleep(self.delay_seconds)
+        return self.reply(prompt)
+
+    async def stream(self, prompt, history=()):
+        text = self.reply(prompt)
+        for i in range(0, len(text), self.chunk_size):
+            await asyncio.sleep(self.delay_seconds)
+            yield text[i:i + self.chunk_size]
+
+def create_provider(name=LLM_PROVIDER):
+    """Provider by name, or None when it is not configured (e.g. no Gemini API key)"""
+    if name == "echo":
+        return EchoProvider()
+    if name == "gemini":
+        api_key = os.getenv("GOOGLE_GENERATIVE_AI_API_KEY")
+        if not api_key:
+            return None
+        return GeminiProvider(api_key)
+    raise ValueError(f"Unknown LLM_PROVIDER {name!r}, expected 'gemini' or 'echo'")
+
+class LLMClient:
+    """Concurrency-bounded, timed-out, retrying front end for an LLMProvider"""
+    def __init__(self, provider, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT_SECONDS,
+                 max_retries=LLM_MAX_RETRIES, backoff_seconds=LLM_BACKOFF_SECONDS):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    def _retryable(self, error):
+        return isinstance(error, (asyncio.TimeoutError,) + tuple(self.provider.retryable_errors))
+
+    async def _backoff(self, attempt):
+        delay = self.backoff_seconds * 2 ** attempt
+        await asyncio.sleep(delay + random.uniform(0, delay))
+
+    async def generate(self, prompt, history=()):
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await asyncio.wait_for(self.provider.generate(prompt, history), self.timeout)
+                except Exception as e:
+                    if not self._retryable(e) or attempt == self.max_retries:
+                        raise LLMError(f"{self.provider.name} request failed: {e!r}") from e
+                    print(f"LLM request failed ({e!r}), retrying ({attempt + 1}/{self.max_retries})...")
+                await self._backoff(attempt)
+
+    async def stream(self, prompt, history=()):
+        """
+        Text chunks as the provider produces them. The timeout applies to each
+        chunk; a failure is only retried before the first chunk was yielded.
+        """
+        async with self._slots:
+            for attempt in range(self.max_retries + 1):
+                chunks = self.provider.stream(prompt, history)
+                started = False
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            return
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    if started or not self._retryable(e) or attempt == self.max_retries:
+                        raise LLMError(f"{self.provider.name} stream failed: {e!r}") from e
+                    print(f"LLM stream failed ({e!r}), retrying ({attempt + 1}/{self.max_retries})...")
+                finally:
+                    await chunks.aclose()
+                await self._backoff(attempt)
+
+    async def close(self):
+        await self.provider.close()
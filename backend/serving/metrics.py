@@ -0,0 +1,239 @@
+"""
+Prometheus metrics (text exposition format 0.0.4) without extra dependencies
+
+Recording is a dict lookup plus a few integer updates under a lock; nothing is
+formatted until GET /metrics is scraped, so the cost with no scraper attached
+is negligible. Set METRICS_ENABLED=0 to turn recording off entirely.
+
+Metrics recorded in FHE worker processes (FHE_EXECUTION_MODE=process) stay in
+those processes; the API process only sees the end-to-end "inference" stage.
+"""
+
+import os
+import threading
+import time
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond text processing up to TenSEAL matmuls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Bytes, from JSON prompts up to serialized contexts
+SIZE_BUCKETS = tuple(2 ** p for p in range(6, 30, 2))
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            snapshot = list(self._series.items())
+        for labels, value in sorted(snapshot):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+class Gauge(_Metric):
+    """Set directly, or computed at scrape time by `callback`"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        lines = self.header()
+        if self.callback:
+            snapshot = [((), self.callback())]
+        else:
+            with self._lock:
+                snapshot = list(self._series.items())
+        for labels, value in sorted(snapshot):
+            if value is not None:
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        if not METRICS_ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (+Inf last), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, [le])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(float(total))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+def process_rss_bytes():
+    """Current resident set size (Linux /proc), else the peak RSS from getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            import sys
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+        except ImportError:
+            return None
+
+stage_seconds = Histogram(
+    "enigma_stage_seconds",
+    "Time spent in one stage of the digit, sentiment or chat pipeline",
+    ("pipeline", "stage")
+)
+request_bytes = Histogram("enigma_request_bytes", "HTTP request body size on the wire", ("route",), SIZE_BUCKETS)
+response_bytes = Histogram("enigma_response_bytes", "HTTP response body size", ("route",), SIZE_BUCKETS)
+errors_total = Counter("enigma_errors_total", "Failed requests by route and status code (or error kind)", ("route", "code"))
+requests_in_flight = Gauge("enigma_requests_in_flight", "HTTP requests currently being served")
+chat_cache_total = Counter("enigma_chat_cache_total", "/chat/secure response cache lookups by result (hit/miss)", ("result",))
+resident_memory_bytes = Gauge("process_resident_memory_bytes", "Resident memory size in bytes", callback=process_rss_bytes)
+startup_seconds = Gauge("enigma_startup_seconds", "Time the last API startup took")
+context_load_seconds = Gauge("enigma_context_load_seconds", "Time to load (or generate) the FHE context at startup", ("pipeline",))
+context_cache_hit = Gauge("enigma_context_cache_hit", "1 if the FHE context was loaded from the cache at startup, 0 if generated", ("pipeline",))
+
+REGISTRY = [
+    stage_seconds, request_bytes, response_bytes, errors_total, chat_cache_total, requests_in_flight, resident_memory_bytes,
+    startup_seconds, context_load_seconds, context_cache_hit,
+]
+
+def record_context_load(pipeline, stats):
+    """Export the startup context load of load_or_create_context (its `stats`)"""
+    context_load_seconds.set(stats["seconds"], pipeline)
+    context_cache_hit.set(int(stats["cached"]), pipeline)
+
+def time_stage(pipeline, stage):
+    """Context manager recording the duration of a pipeline stage"""
+    return stage_seconds.time(pipeline, stage)
+
+def render():
+    """All metrics in the Prometheus text format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class MetricsMiddleware:
+    """
+    ASGI middleware tracking in-flight requests, body sizes and error statuses.
+    Routes are labelled with their path template so the label set stays bounded.
+    """
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        sizes = {"request": 0, "response": 0, "status": 500}
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                sizes["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            requests_in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            request_bytes.observe(sizes["request"], route)
+            response_bytes.observe(sizes["response"], route)
+            if sizes["status"] >= 400:
+                errors_total.inc(route, str(sizes["status"]))
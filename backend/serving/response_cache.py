@@ -0,0 +1,206 @@
+"""
+Response cache for /chat/secure
+
+Keyed on the redacted prompt (plus the model and the redacted conversation
+history), which contains pseudonyms instead of personal data. Pseudonyms are
+deterministic (privacy/pseudonyms.py), so a repeated prompt redacts to the same
+key. The cached value is the raw LLM response; each request still restores it
+with its own pii_map.
+
+CHAT_CACHE selects the backend:
+- "off" (default)
+- "memory": per-process LRU
+- "disk": one JSON file per entry in CHAT_CACHE_DIR, shared by every worker
+
+Entries expire after CHAT_CACHE_TTL_SECONDS; at most CHAT_CACHE_MAX_ENTRIES
+are kept (least recently used / oldest evicted first).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from serving.metrics import chat_cache_total
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHAT_CACHE = os.getenv("CHAT_CACHE", "off").lower()
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", 3600))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", 10000))
+CHAT_CACHE_DIR = os.getenv("CHAT_CACHE_DIR", os.path.join(BACKEND_DIR, "chat_cache"))
+
+class MemoryBackend:
+    """LRU dict of key -> (expires_at, value)"""
+    name = "memory"
+
+    def __init__(self, max_entries=CHAT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl_seconds):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class DiskBackend:
+    """
+    One file per key. Writes are atomic (temp file + rename), so several
+    workers can share the directory. The directory is private to the user
+    (0700) and entries are written 0600, since responses may mention
+    pseudonymized personal details.
+
+    Expiry and eviction run on every write from an in-memory index of
+    key -> expires_at in write order: the entries found at startup plus this
+    process's own writes, so files are never re-read to prune. Each worker
+    prunes the entries it knows about.
+    """
+    name = "disk"
+
+    def __init__(self, directory=CHAT_CACHE_DIR, max_entries=CHAT_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        try:
+            os.chmod(directory, 0o700)
+        except OSError:
+            pass # Not our directory; leave its permissions alone
+        self._index = self._scan()
+        self.prune()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def _scan(self):
+        """Index of the entries already on disk, oldest write first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path) as f:
+                    expires_at = json.load(f)["expires_at"]
+                mtime = os.path.getmtime(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((mtime, name[:-len(".json")], expires_at))
+        entries.sort()
+        return OrderedDict((key, expires_at) for _, key, expires_at in entries)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires_at"] <= time.time():
+            with self._lock:
+                self._index.pop(key, None)
+            self._remove(path)
+            return None
+        return entry["value"]
+
+    def set(self, key, value, ttl_seconds):
+        path = self._path(key)
+        expires_at = time.time() + ttl_seconds
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"expires_at": expires_at, "value": value}, f)
+        os.replace(tmp, path)
+        with self._lock:
+            self._index[key] = expires_at
+            self._index.move_to_end(key)
+        self.prune()
+
+    def prune(self):
+        """Drop expired entries, then the oldest ones beyond max_entries"""
+        now = time.time()
+        expired = []
+        with self._lock:
+            # One TTL per cache, so write order is expiry order
+            while self._index and (len(self._index) > self.max_entries or next(iter(self._index.values())) <= now):
+                expired.append(self._index.popitem(last=False)[0])
+        for key in expired:
+            self._remove(self._path(key))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+class ResponseCache:
+    """Raw LLM responses keyed on (model, redacted history, redacted prompt), with hit/miss counts"""
+    def __init__(self, backend, ttl_seconds=CHAT_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock() # get() runs on threadpool threads
+
+    @staticmethod
+    def key(model, prompt, history=()):
+        payload = json.dumps([model, [list(turn) for turn in history], prompt])
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        chat_cache_total.inc("miss" if value is None else "hit")
+        return value
+
+    def set(self, key, value):
+        self.backend.set(key, value, self.ttl_seconds)
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "backend": self.backend.name,
+            "entries": len(self.backend),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+BACKENDS = {"memory": MemoryBackend, "disk": DiskBackend}
+
+def create_response_cache(backend=CHAT_CACHE):
+    """ResponseCache for CHAT_CACHE, or None when caching is off"""
+    if backend in ("", "off", "0", "none"):
+        return None
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown CHAT_CACHE {backend!r}, expected 'off', 'memory' or 'disk'")
+    return ResponseCache(BACKENDS[backend]())
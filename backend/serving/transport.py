@@ -0,0 +1,126 @@
+"""
+Binary (application/octet-stream) transport for client-encrypted requests
+
+Clients hold the secret key. They register their public TenSEAL context once,
+then send serialized CKKSVectors and get serialized encrypted results back.
+
+Registered contexts live in memory in the process that received them, so the
+encrypted routes need a single API worker (no `uvicorn --workers N`): a
+request that lands on another worker, or after a restart or LRU eviction, gets
+a 404 asking the client to register its context again.
+"""
+
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+
+import tenseal as ts
+from fastapi import HTTPException, Response
+
+OCTET_STREAM = "application/octet-stream"
+
+# A public N=16384 context with Galois keys is ~175 MB; the upload is unauthenticated, so keep this tight
+MAX_CONTEXT_BYTES = int(os.getenv("FHE_MAX_CONTEXT_BYTES", 256 * 1024 * 1024))
+MAX_CIPHERTEXT_BYTES = int(os.getenv("FHE_MAX_CIPHERTEXT_BYTES", 16 * 1024 * 1024))
+MAX_CLIENT_CONTEXTS = int(os.getenv("FHE_MAX_CLIENT_CONTEXTS", 8))
+
+async def read_body(request, max_bytes):
+    """
+    Read a (optionally gzip Content-Encoded) request body as it streams in.
+    Returns (body, wire_bytes). Raises 413 as soon as the decoded body exceeds max_bytes.
+    """
+    encoding = request.headers.get("content-encoding", "identity").lower()
+    if encoding not in ("identity", "gzip"):
+        raise HTTPException(status_code=415, detail=f"Unsupported Content-Encoding: {encoding}")
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding == "gzip" else None
+
+    body = bytearray()
+    wire_bytes = 0
+    async for chunk in request.stream():
+        wire_bytes += len(chunk)
+        if decompressor is None:
+            body.extend(chunk)
+        else:
+            try:
+                # Bounded output per call so a small compressed body can't blow up memory
+                data = chunk
+                while data:
+                    body.extend(decompressor.decompress(data, max_bytes + 1 - len(body)))
+                    if len(body) > max_bytes:
+                        break
+                    data = decompressor.unconsumed_tail
+            except zlib.error as e:
+                raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+        if len(body) > max_bytes:
+            raise HTTPException(status_code=413, detail=f"Payload exceeds {max_bytes} bytes")
+
+    if not body:
+        raise HTTPException(status_code=400, detail="Empty request body")
+    return bytes(body), wire_bytes
+
+def ciphertext_response(data, request_bytes):
+    """Serialized encrypted result with payload sizes in the headers"""
+    return Response(
+        content=data,
+        media_type=OCTET_STREAM,
+        headers={
+            "X-Request-Bytes": str(request_bytes),
+            "X-Response-Bytes": str(len(data))
+        }
+    )
+
+class ContextRegistry:
+    """
+    Bounded LRU store of public client contexts, keyed by the hash of their
+    serialization. Per process: see the module docstring.
+    """
+    def __init__(self, max_contexts=MAX_CLIENT_CONTEXTS):
+        self.max_contexts = max_contexts
+        self._contexts = OrderedDict()
+
+    def register(self, data):
+        context_id = hashlib.sha256(data).hexdigest()[:32]
+        if context_id in self._contexts:
+            self._contexts.move_to_end(context_id)
+            return context_id, self._contexts[context_id]
+
+        try:
+            context = ts.context_from(data)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid TenSEAL context: {e}")
+        if context.is_private():
+            raise HTTPException(status_code=400, detail="Context contains a secret key; send a public context (make_context_public())")
+        if not context.has_galois_keys() or not context.has_relin_keys():
+            raise HTTPException(status_code=400, detail="Context needs Galois and relinearization keys")
+
+        self._contexts[context_id] = context
+        while len(self._contexts) > self.max_contexts:
+            self._contexts.popitem(last=False)
+        return context_id, context
+
+    def get(self, context_id):
+        if not context_id:
+            raise HTTPException(status_code=400, detail="Missing X-Context-Id header, register the public context with POST /fhe/context")
+        context = self._contexts.get(context_id)
+        if context is None:
+            raise HTTPException(
+                status_code=404,
+                detail="Unknown X-Context-Id: contexts are kept in memory by the API process that registered them "
+                       "(single worker only) and are evicted after restarts or when the registry is full. "
+                       "Register the public context again with POST /fhe/context."
+            )
+        self._contexts.move_to_end(context_id)
+        return context
+
+context_registry = ContextRegistry()
+
+def load_ckks_vector(context, data, expected_size):
+    """Deserialize a client CKKSVector and check its length"""
+    try:
+        enc_vector = ts.ckks_vector_from(context, data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CKKSVector: {e}")
+    if enc_vector.size() != expected_size:
+        raise HTTPException(status_code=400, detail=f"Expected {expected_size} encrypted values, got {enc_vector.size()}")
+    return enc_vector
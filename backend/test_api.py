@@ -1,38 +1,151 @@
-import requests
-import numpy as np
+"""
+API tests, run in-process with FastAPI's TestClient (startup events included,
+the LLM is the local echo provider).
+
+Run from backend/:
+    python -m pytest test_api.py
+"""
+
 import json
-import random
-
-def test_classify():
-    url = "http://localhost:8000/classify"
-    
-    # Create a dummy image (random noise or zero)
-    # 28x28 image with values between 0 and 1
-    dummy_image = np.random.rand(28 * 28).tolist()
-    
-    payload = {
-        "image": dummy_image
-    }
-    
-    try:
-        print(f"Sending request to {url}...")
-        response = requests.post(url, json=payload)
-        
-        if response.status_code == 200:
-            result = response.json()
-            print("Success!")
-            print("Response:", json.dumps(result, indent=2))
-            
-            if "prediction" in result and "encrypted" in result:
-                print("Verification PASSED: Received valid prediction.")
-            else:
-                print("Verification FAILED: Missing fields in response.")
-        else:
-            print(f"Failed with status code: {response.status_code}")
-            print("Response:", response.text)
-            
-    except Exception as e:
-        print(f"Error: {e}")
-
-if __name__ == "__main__":
-    test_classify()
+
+import numpy as np
+import pytest
+import tenseal as ts
+from fastapi.testclient import TestClient
+
+import app as app_module
+from digit_recognition.inference import compile_model
+from digit_recognition.preprocess import standardize
+from routers import chat, sentiment
+from serving.llm import EchoProvider, LLMClient
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(app_module.app) as client:
+        chat.llm_client = LLMClient(EchoProvider())
+        yield client
+
+def sse_events(text):
+    """(event, data) pairs of a Server-Sent Events body"""
+    events = []
+    event = None
+    for line in text.splitlines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            events.append((event, json.loads(line[len("data: "):])))
+    return events
+
+def test_status(client):
+    response = client.get("/status")
+    assert response.status_code == 200
+    assert "startup" in response.json()
+
+def test_metrics_export_startup(client):
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "enigma_startup_seconds " in response.text
+    assert 'enigma_context_cache_hit{pipeline="digit"}' in response.text
+
+def test_classify(client):
+    image = np.random.default_rng(0).random(28 * 28)
+    response = client.post("/classify", json={"image": image.tolist()})
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result["encrypted"] is True
+    expected = compile_model(app_module.model).forward(standardize(image)[np.newaxis, :])[0]
+    # CKKS noise may only swap classes whose plaintext logits are nearly tied
+    assert expected[result["prediction"]] >= expected.max() - 0.5
+    assert result["confidence"] == pytest.approx(float(np.max(expected)), abs=0.5)
+
+def test_classify_rejects_wrong_size(client):
+    response = client.post("/classify", json={"image": [0.0] * 100})
+    assert response.status_code == 400
+    assert "784" in response.json()["detail"]
+
+def test_sentiment_encrypted_binary(client):
+    if sentiment.sentiment_plan is None:
+        pytest.skip("sentiment model artifacts are not available")
+
+    # The client keeps the secret key and only shares a public context
+    context = ts.context(ts.SCHEME_TYPE.CKKS, poly_modulus_degree=8192, coeff_mod_bit_sizes=[60, 40, 40, 60])
+    context.global_scale = 2**40
+    context.generate_galois_keys()
+    public_context = context.copy()
+    public_context.make_context_public()
+
+    headers = {"Content-Type": "application/octet-stream"}
+    response = client.post("/fhe/context", content=public_context.serialize(), headers=headers)
+    assert response.status_code == 200, response.text
+    context_id = response.json()["context_id"]
+
+    features = np.random.default_rng(0).random(256)
+    response = client.post(
+        "/sentiment/predict-encrypted-binary",
+        content=ts.ckks_vector(context, features.tolist()).serialize(),
+        headers={**headers, "X-Context-Id": context_id}
+    )
+    assert response.status_code == 200, response.text
+    assert int(response.headers["X-Request-Bytes"]) > 0
+    logits = np.array(ts.ckks_vector_from(context, response.content).decrypt())
+    expected = sentiment.sentiment_compiled.forward(features[np.newaxis, :])[0]
+    np.testing.assert_allclose(logits, expected, atol=1e-2)
+
+def test_encrypted_routes_need_a_registered_context(client):
+    headers = {"Content-Type": "application/octet-stream"}
+    missing = client.post("/classify/encrypted", content=b"x", headers=headers)
+    assert missing.status_code == 400
+    unknown = client.post("/classify/encrypted", content=b"x", headers={**headers, "X-Context-Id": "0" * 32})
+    assert unknown.status_code == 404
+    assert "POST /fhe/context" in unknown.json()["detail"]
+
+@pytest.mark.parametrize("features", [[[1.0, 2.0], [3.0]], ["a", "b"], [[1.0, "x"]]])
+def test_sentiment_encrypted_rejects_malformed_features(client, features):
+    if sentiment.sentiment_plan is None:
+        pytest.skip("sentiment model artifacts are not available")
+    response = client.post("/sentiment/predict-encrypted", json={"encrypted_features": features})
+    assert response.status_code == 400
+
+def test_vectorizer_params_etag_per_encoding(client):
+    if sentiment.vectorizer_params is None:
+        pytest.skip("sentiment vectorizer is not available")
+    identity = client.get("/sentiment/vectorizer-params", headers={"Accept-Encoding": "identity"})
+    gzipped = client.get("/sentiment/vectorizer-params", headers={"Accept-Encoding": "gzip"})
+    assert identity.status_code == gzipped.status_code == 200
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+    assert "vocabulary" in identity.json()
+
+    revalidated = client.get(
+        "/sentiment/vectorizer-params",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["ETag"]}
+    )
+    assert revalidated.status_code == 304
+    mismatched = client.get(
+        "/sentiment/vectorizer-params",
+        headers={"Accept-Encoding": "identity", "If-None-Match": gzipped.headers["ETag"]}
+    )
+    assert mismatched.status_code == 200
+
+def test_chat_secure_stream(client):
+    if chat.nlp is None:
+        pytest.skip("/chat/secure/stream needs the spaCy model en_core_web_sm")
+    message = "My name is Alice Johnson and I live in Seattle. What should I see nearby?"
+    response = client.post("/chat/secure/stream", json={"message": message})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = sse_events(response.text)
+    names = [event for event, _ in events]
+    assert names[0] == "redaction"
+    assert names[-1] == "done"
+    assert "error" not in names
+    tokens = "".join(data["text"] for event, data in events if event == "token")
+    done = events[-1][1]
+    assert tokens == done["llm_response_restored"]
+    # The echo provider repeats the redacted prompt, so restoring it gives back the message
+    assert message in tokens
+
+def test_chat_secure_stream_rejects_missing_message(client):
+    response = client.post("/chat/secure/stream", json={})
+    assert response.status_code == 422
@@ -0,0 +1,82 @@
+"""
+Context analysis: the trimmed (no NER, sentences around candidates only),
+batched analysis must make the same decisions as the full spaCy pipeline on
+the whole message.
+
+Run from backend/:
+    python -m pytest test_context.py
+"""
+
+import pytest
+import spacy
+
+from privacy.context import SPACY_MODEL, ContextAnalyzer, load_context_nlp, personal_span
+
+needs_model = pytest.mark.skipif(
+    not spacy.util.is_package(SPACY_MODEL), reason=f"spaCy model {SPACY_MODEL} is not installed"
+)
+
+# (text, candidate entity)
+FIXTURES = [
+    ("I live in Seattle and work at Contoso.", "Seattle"),
+    ("I live in Seattle and work at Contoso.", "Contoso"),
+    ("We are planning a trip to Paris next spring.", "Paris"),
+    ("My city is Berlin, it is lovely in May.", "Berlin"),
+    ("Our company, Globex, is hiring.", "Globex"),
+    ("Tell me about the history of Rome.", "Rome"),
+    ("I was born in Toronto but grew up elsewhere.", "Toronto"),
+    ("Microsoft released a new version of Windows today.", "Microsoft"),
+    ("I study at Stanford University. It is far from home.", "Stanford University"),
+    ("What is the weather like in London? I am flying there tomorrow.", "London"),
+    ("We moved to Madrid last year. The food is great.", "Madrid"),
+    ("Apple and Google are competing in this market.", "Google"),
+    ("I am from Warsaw. Can you recommend a restaurant in Krakow?", "Warsaw"),
+    ("I am from Warsaw. Can you recommend a restaurant in Krakow?", "Krakow"),
+    ("My manager at Initech wants the report by Friday.", "Initech"),
+    ("Visit Tokyo in the spring for the cherry blossoms.", "Tokyo"),
+]
+
+def fixture_items():
+    items = []
+    for text, entity in FIXTURES:
+        start = text.index(entity)
+        items.append((text, [(start, start + len(entity))]))
+    return items
+
+@pytest.fixture(scope="module")
+def full_nlp():
+    return spacy.load(SPACY_MODEL)
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return ContextAnalyzer(load_context_nlp())
+
+@needs_model
+def test_batched_matches_full_pipeline(full_nlp, analyzer):
+    items = fixture_items()
+    for (text, spans), decisions in zip(items, analyzer.decide_batch(items)):
+        doc = full_nlp(text)
+        for start, end in spans:
+            assert decisions[(start, end)] == personal_span(doc, start, end), text[start:end]
+
+@needs_model
+def test_single_message_matches_batch(analyzer):
+    items = fixture_items()
+    assert [analyzer.decide(text, spans) for text, spans in items] == analyzer.decide_batch(items)
+
+@needs_model
+def test_long_document_matches_full_pipeline(full_nlp, analyzer):
+    filler = "The quarterly report covers revenue, costs and the outlook for next year in detail. " * 20
+    document = filler + "I live in Seattle and work at Contoso. " + filler
+    spans = [(document.index(name), document.index(name) + len(name)) for name in ("Seattle", "Contoso")]
+    doc = full_nlp(document)
+    assert analyzer.decide(document, spans) == {span: personal_span(doc, *span) for span in spans}
+
+def test_segments_cover_candidate_sentences_only():
+    # Sentence splitting uses a blank pipeline, so this runs without the model
+    analyzer = ContextAnalyzer(spacy.blank("en"))
+    text = "First sentence here. I live in Seattle. Another one. I work at Contoso. Last."
+    spans = [(text.index("Seattle"), text.index("Seattle") + 7), (text.index("Contoso"), text.index("Contoso") + 7)]
+    segments = [text[start:end].strip() for start, end in analyzer.segments(text, spans)]
+    assert segments == ["I live in Seattle.", "I work at Contoso."]
+    assert analyzer.decide(text, []) == {}
@@ -0,0 +1,77 @@
+"""
+BSGS encrypted linear layers (fhe/linear.py): encrypted logits must match the
+plaintext model(x), and the network must only generate Galois keys for the
+rotations it performs.
+
+Run from backend/:
+    python -m pytest test_linear.py
+"""
+
+import numpy as np
+import pytest
+import torch
+
+from digit_recognition.model import ConvNet
+from fhe.linear import BSGSNetwork, verify_against_model
+from sentiment_analysis.model import SentimentNet
+
+class RecordingEvaluator:
+    """Evaluator proxy that records the rotation steps actually used"""
+    def __init__(self, evaluator):
+        self._evaluator = evaluator
+        self.steps = set()
+
+    def rotate_vector(self, ct, step, galois_keys, destination):
+        self.steps.add(step)
+        return self._evaluator.rotate_vector(ct, step, galois_keys, destination)
+
+    def rotate_vector_inplace(self, ct, step, galois_keys):
+        self.steps.add(step)
+        return self._evaluator.rotate_vector_inplace(ct, step, galois_keys)
+
+    def __getattr__(self, name):
+        return getattr(self._evaluator, name)
+
+def seeded(model_class):
+    torch.manual_seed(0)
+    return model_class().eval()
+
+# (name, model factory, network builder, input features, expected Galois steps)
+NETWORKS = [
+    # 784 -> 128: g = 16, G = 8, folds 512/256/128; 128 -> 10: g = 4, G = 4, folds 64/32/16
+    ("ConvNet", lambda: seeded(ConvNet), BSGSNetwork.from_convnet, 28 * 28, [1, 4, 16, 32, 64, 128, 256, 512]),
+    # 256 -> 64: g = 8, G = 8, folds 128/64; 64 -> 3 (padded to 4): g = 2, G = 2, folds 32/16/8/4
+    ("SentimentNet", lambda: seeded(SentimentNet), BSGSNetwork.from_sentiment_net, 256, [1, 2, 4, 8, 16, 32, 64, 128]),
+]
+
+@pytest.fixture(scope="module", params=NETWORKS, ids=[name for name, *_ in NETWORKS])
+def network_case(request):
+    name, make_model, build, n_features, expected_steps = request.param
+    model = make_model()
+    return model, build(model), n_features, expected_steps
+
+def test_matches_plaintext_model(network_case):
+    model, network, n_features, _ = network_case
+    error = verify_against_model(network, model, n_features, n_samples=3, atol=1e-2)
+    assert error < 1e-2
+
+def test_only_needed_galois_keys(network_case):
+    model, network, n_features, expected_steps = network_case
+    assert network.rotation_steps == expected_steps
+    assert network.galois_keys.size() == len(expected_steps)
+
+    recorder = RecordingEvaluator(network.evaluator)
+    network.evaluator = recorder
+    try:
+        network.forward(np.random.default_rng(1).random(n_features))
+    finally:
+        network.evaluator = recorder._evaluator
+    assert sorted(recorder.steps) == expected_steps
+
+def test_unpadded_shapes():
+    """Sizes that are not powers of two are zero padded"""
+    rng = np.random.default_rng(0)
+    weight, bias = rng.normal(size=(7, 100)), rng.normal(size=7)
+    network = BSGSNetwork([(weight, bias)], [None], 8192, [60, 40, 60])
+    x = rng.random(100)
+    np.testing.assert_allclose(network.forward(x), weight @ x + bias, atol=1e-3)
@@ -0,0 +1,83 @@
+"""
+NER backends (privacy/ner.py): the traced int8 graph must not bake in the
+shape it was traced with, and the int8 backend must find the same PII spans
+as FP32 on the fixture corpus of benchmarks/ner_parity.py.
+
+Run from backend/:
+    python -m pytest test_ner.py
+"""
+
+import pytest
+import torch
+
+from benchmarks.ner_parity import NER_CORPUS, _spans, compare_spans
+from privacy.ner import NER_MODEL, load_fp32_pipeline, load_int8_pipeline, quantize_model, trace_graph
+
+def model_is_cached():
+    from transformers import AutoConfig
+    try:
+        AutoConfig.from_pretrained(NER_MODEL, local_files_only=True)
+    except OSError:
+        return False
+    return True
+
+needs_model = pytest.mark.skipif(not model_is_cached(), reason=f"NER model {NER_MODEL} is not downloaded")
+
+def token_inputs(batch_size, length, padding=0, seed=0):
+    """Random (input_ids, attention_mask, token_type_ids); the first row ends with `padding` pad tokens"""
+    generator = torch.Generator().manual_seed(seed)
+    input_ids = torch.randint(1, 100, (batch_size, length), generator=generator)
+    attention_mask = torch.ones(batch_size, length, dtype=torch.long)
+    if padding:
+        input_ids[0, length - padding:] = 0
+        attention_mask[0, length - padding:] = 0
+    return input_ids, attention_mask, torch.zeros_like(input_ids)
+
+@pytest.fixture(scope="module")
+def small_bert():
+    """Randomly initialized BERT token classifier, small enough to trace in a test"""
+    from transformers import BertConfig, BertForTokenClassification
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=100, hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, num_labels=9)
+    quantized = quantize_model(BertForTokenClassification(config))
+    return quantized, trace_graph(quantized, token_inputs(1, 12))
+
+@pytest.mark.parametrize("batch_size,length,padding", [(1, 12, 0), (1, 3, 0), (1, 200, 0), (4, 30, 0), (4, 30, 11)])
+def test_traced_graph_matches_eager_model(small_bert, batch_size, length, padding):
+    quantized, graph = small_bert
+    input_ids, attention_mask, token_type_ids = token_inputs(batch_size, length, padding, seed=length)
+    with torch.no_grad():
+        expected = quantized(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids).logits
+        actual = graph(input_ids, attention_mask, token_type_ids)
+    torch.testing.assert_close(actual, expected, atol=1e-5, rtol=1e-5)
+
+def test_traced_graph_applies_attention_mask(small_bert):
+    # The trace example had no padding; the mask must still change the output
+    _, graph = small_bert
+    input_ids, attention_mask, token_type_ids = token_inputs(1, 20, padding=8)
+    with torch.no_grad():
+        masked = graph(input_ids, attention_mask, token_type_ids)
+        unmasked = graph(input_ids, torch.ones_like(attention_mask), token_type_ids)
+    assert not torch.allclose(masked[0, :12], unmasked[0, :12])
+
+@pytest.fixture(scope="module")
+def pipelines(tmp_path_factory):
+    graph_path = str(tmp_path_factory.mktemp("ner") / "ner_int8.pt")
+    return load_fp32_pipeline(), load_int8_pipeline(graph_path=graph_path)
+
+@needs_model
+def test_int8_span_parity(pipelines):
+    fp32, int8 = pipelines
+    reference = [sorted(_spans(fp32(text))) for text in NER_CORPUS]
+    candidate = [sorted(_spans(int8(text))) for text in NER_CORPUS]
+    parity = compare_spans(reference, candidate)
+    assert parity["f1"] >= 0.95, parity["differing_texts"]
+
+@needs_model
+def test_int8_batch_matches_single_texts(pipelines):
+    # Padded batches of texts with very different lengths, as run_ner_batch sends them
+    _, int8 = pipelines
+    single = [_spans(int8(text)) for text in NER_CORPUS]
+    batched = [_spans(entities) for entities in int8(NER_CORPUS, batch_size=len(NER_CORPUS))]
+    assert batched == single
@@ -0,0 +1,47 @@
+"""
+Streamed restoration must give the same text as one-shot restoration,
+wherever the LLM stream happens to be split into chunks.
+
+Run from backend/:
+    python -m pytest test_redaction.py
+"""
+
+import random
+
+import pytest
+
+from privacy.pseudonyms import load_tables
+from privacy.redaction import SELF_CHECK_CASES, Restorer, StreamRestorer, chunkings
+
+def stream_restore(pii_map, chunks):
+    restorer = StreamRestorer(pii_map)
+    return "".join(restorer.feed(chunk) for chunk in chunks) + restorer.flush()
+
+@pytest.mark.parametrize("pii_map,response", SELF_CHECK_CASES)
+def test_every_chunk_boundary(pii_map, response):
+    expected = Restorer(pii_map).restore(response)
+    for chunks in chunkings(response):
+        assert stream_restore(pii_map, chunks) == expected, chunks
+
+def test_overlapping_fake_values():
+    # "b" ends the complete match "ab" and starts "bcd"; it must not be held back
+    assert stream_restore({"ab": "X", "bcd": "Y"}, ["abcd"]) == "Xcd"
+    assert stream_restore({"ab": "X", "bcd": "Y"}, ["ab", "cd"]) == "Xcd"
+    assert stream_restore({"ab": "X", "bcd": "Y"}, ["a", "bcd"]) == "Xcd"
+
+def test_pseudonym_tables():
+    """Fake values from the real tables, many of which overlap, split at every boundary"""
+    values = [value for table in load_tables().values() for value in table]
+    rng = random.Random(0)
+    for _ in range(20):
+        fakes = rng.sample(values, 20)
+        pii_map = {fake: f"<original {i}>" for i, fake in enumerate(fakes)}
+        pieces = []
+        for fake in rng.sample(fakes, 6):
+            # Whole values, and truncated ones that overlap the next value
+            pieces.append(fake if rng.random() < 0.6 else fake[rng.randint(1, len(fake) - 1):])
+            pieces.append(rng.choice(["", " ", ", "]))
+        response = "".join(pieces)
+        expected = Restorer(pii_map).restore(response)
+        for chunks in chunkings(response, sizes=(1, 4)):
+            assert stream_restore(pii_map, chunks) == expected, chunks
@@ -20,11 +20,40 @@ interface ChatMessage {
   };
 }
 
+// Parses a text/event-stream body, calling onEvent(event, data) per event
+async function readEvents(
+  body: ReadableStream<Uint8Array>,
+  onEvent: (event: string, data: any) => void
+) {
+  const reader = body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      let event = "message";
+      let data = "";
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (data) onEvent(event, JSON.parse(data));
+    }
+  }
+}
+
 export default function SecureChatbotPage() {
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [input, setInput] = useState("");
   const [isLoading, setIsLoading] = useState(false);
   const scrollRef = useRef<HTMLDivElement>(null);
+  // Server-side session: keeps pseudonyms consistent across turns and holds the history
+  const conversationId = useRef<string | null>(null);
 
   // Auto-scroll to bottom
   useEffect(() => {
@@ -42,30 +71,54 @@ export default function SecureChatbotPage() {
     setIsLoading(true);
 
     try {
-      const res = await fetch("http://localhost:8000/chat/secure", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ message: userMsg.content }),
-      });
+      const send = async () => {
+        if (!conversationId.current) {
+          const session = await fetch("http://localhost:8000/chat/sessions", { method: "POST" });
+          conversationId.current = (await session.json()).conversation_id;
+        }
+        // Server-Sent Events: the restored reply is streamed as Gemini generates it
+        return fetch("http://localhost:8000/chat/secure/stream", {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ message: userMsg.content, conversation_id: conversationId.current }),
+        });
+      };
+
+      let res = await send();
+      if (res.status === 404) {
+        // Session expired on the server: start a new one
+        conversationId.current = null;
+        res = await send();
+      }
+      if (!res.ok || !res.body) throw new Error(`HTTP ${res.status}`);
 
-      const data = await res.json();
-      
-      if (data.error) throw new Error(data.error);
+      const updateBot = (update: (msg: ChatMessage) => ChatMessage) =>
+        setMessages((prev) => [...prev.slice(0, -1), update(prev[prev.length - 1])]);
 
-      // Add Assistant Response
-      const botMsg: ChatMessage = {
-        role: "assistant",
-        content: data.llm_response_restored, // Show restored by default
-        metadata: {
-          original: data.original_prompt,
-          redacted: data.redacted_prompt,
-          pii_map: data.pii_map,
-          preserved_items: data.preserved_items,
-          raw_response: data.llm_response_raw
+      await readEvents(res.body, (event, data) => {
+        if (event === "error") throw new Error(data.error);
+        if (event === "redaction") {
+          const botMsg: ChatMessage = {
+            role: "assistant",
+            content: "",
+            metadata: {
+              original: data.original_prompt,
+              redacted: data.redacted_prompt,
+              pii_map: data.pii_map,
+              preserved_items: data.preserved_items
+            }
+          };
+          setMessages((prev) => [...prev, botMsg]);
+        } else if (event === "token") {
+          updateBot((msg) => ({ ...msg, content: msg.content + data.text }));
+        } else if (event === "done") {
+          updateBot((msg) => ({
+            ...msg,
+            content: data.llm_response_restored, // Show restored by default
+            metadata: { ...msg.metadata, raw_response: data.llm_response_raw }
+          }));
         }
-      };
-      
-      setMessages((prev) => [...prev, botMsg]);
+      });
 
     } catch (e: any) {
         setMessages(prev => [...prev, { 
@@ -118,7 +171,7 @@ export default function SecureChatbotPage() {
           {messages.map((msg, idx) => (
             <MessageItem key={idx} msg={msg} />
           ))}
-          {isLoading && (
+          {isLoading && messages[messages.length - 1]?.role !== "assistant" && (
              <div className="flex gap-4">
                 <div className="w-8 h-8 rounded-full bg-primary/10 flex items-center justify-center border border-primary/20">
                     <Bot className="w-4 h-4 text-primary" />
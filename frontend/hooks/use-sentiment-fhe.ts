@@ -45,9 +45,7 @@ export function useSentimentFHE() {
     
     try {
       // Get vectorizer params from server
-      const res = await fetch("http://localhost:8000/sentiment/get-vectorizer-params", {
-        method: "POST"
-      })
+      const res = await fetch("http://localhost:8000/sentiment/vectorizer-params")
       
       if (!res.ok) throw new Error("Failed to get vectorizer params")
       const params = await res.json()